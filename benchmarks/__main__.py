@@ -0,0 +1,79 @@
+"""
+Runner della suite di benchmark.
+
+    python -m benchmarks                          # tutto, stampa JSON
+    python -m benchmarks --quick -o run.json      # salva i risultati
+    python -m benchmarks -b base.json -t 0.25     # exit 1 se una metrica
+                                                  # di tempo peggiora >25%
+    python -m benchmarks -k pairing -k tokens     # solo alcuni benchmark
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("-o", "--output", help="scrive i risultati JSON in questo file")
+    parser.add_argument("-b", "--baseline", help="risultati JSON di riferimento")
+    parser.add_argument(
+        "-t", "--threshold", type=float, default=0.2,
+        help="peggioramento massimo ammesso rispetto alla baseline (default 0.2)",
+    )
+    parser.add_argument("-k", "--only", action="append", help="esegue solo questo benchmark")
+    parser.add_argument("--quick", action="store_true", help="taglie e ripetizioni ridotte")
+    parser.add_argument("--list", action="store_true", help="elenca i benchmark")
+    args = parser.parse_args(argv)
+
+    # stato di pairing isolato: i moduli leggono ~/.ice_studio all'import
+    home = tempfile.mkdtemp(prefix="ice-bench-")
+    os.environ["HOME"] = home
+    try:
+        return _main(parser, args)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+
+def _main(parser: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    from . import suite  # noqa: F401  (registra i benchmark)
+    from .harness import BENCHMARKS, compare, run
+
+    if args.list:
+        print("\n".join(sorted(BENCHMARKS)))
+        return 0
+
+    unknown = [name for name in args.only or [] if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    current = run(args.only, quick=args.quick)
+    output = json.dumps(current, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        regressions = compare(baseline, current, args.threshold)
+        for reg in regressions:
+            print(
+                f"REGRESSION {reg['metric']}: {reg['baseline']} -> {reg['current']} "
+                f"(x{reg['ratio']})",
+                file=sys.stderr,
+            )
+        if regressions:
+            return 1
+        print(f"no regressions over {args.threshold:.0%}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Token validation: verifica offline dei token firmati contro il percorso
+lookup-based (TokenRegistry locale e TokenRegistry dietro un round trip
+UDP su loopback, il minimo che paga un nodo remoto).
+
+    python -m benchmarks.bench_tokens
+"""
+from __future__ import annotations
+
+import json
+import socket
+import threading
+import timeit
+
+from protocols.security.tokens.registry import TokenRegistry
+from protocols.security.tokens.signed import (
+    Keyring,
+    RevocationList,
+    SigningKey,
+    issue_signed_token,
+    verify_signed_token,
+)
+
+
+def _per_call_us(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+
+
+def _remote_validator(registry: TokenRegistry) -> tuple[int, threading.Event]:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    stop = threading.Event()
+
+    def _serve():
+        sock.settimeout(0.2)
+        while not stop.is_set():
+            try:
+                data, addr = sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            ok = registry.is_valid(data.decode())
+            sock.sendto(b"1" if ok else b"0", addr)
+        sock.close()
+
+    threading.Thread(target=_serve, daemon=True).start()
+    return sock.getsockname()[1], stop
+
+
+def run(outstanding: int = 20000, number: int = 20000) -> dict:
+    registry = TokenRegistry()
+    for _ in range(outstanding):
+        registry.issue("session")
+    opaque = registry.issue("session").token
+
+    keyring = Keyring([SigningKey.generate("k1")])
+    keyring.rotate(SigningKey.generate("k2"))
+    # stesso keyring senza cache dei token verificati: costo a freddo
+    cold = Keyring([keyring.get("k1"), keyring.get("k2")], cache_size=0)
+    revocations = RevocationList()
+    for i in range(64):
+        revocations.revoke(f"revoked-{i}", 1e12)
+    signed = issue_signed_token(keyring, "session", issuer="bench").token
+
+    port, stop = _remote_validator(registry)
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.connect(("127.0.0.1", port))
+    payload = opaque.encode()
+
+    def _remote():
+        client.send(payload)
+        client.recv(8)
+
+    try:
+        results = {
+            "signed_verify_us": _per_call_us(
+                lambda: verify_signed_token(keyring, signed, "session", revocations),
+                number,
+            ),
+            "signed_verify_cold_us": _per_call_us(
+                lambda: verify_signed_token(cold, signed, "session", revocations),
+                number,
+            ),
+            "registry_validate_us": _per_call_us(
+                lambda: registry.validate(opaque, "session"), number
+            ),
+            "registry_loopback_roundtrip_us": _per_call_us(_remote, number // 10),
+            "outstanding_tokens": outstanding,
+        }
+    finally:
+        stop.set()
+        client.close()
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,91 @@
+"""
+Infrastruttura comune dei benchmark: registro, misura, risultati JSON
+confrontabili tra commit.
+
+Le metriche con suffisso _us / _ms sono tempi (più basso = meglio) e
+sono le uniche confrontate con la baseline; le altre (conteggi, taglie)
+sono solo descrittive.
+"""
+from __future__ import annotations
+
+import platform
+import subprocess
+import sys
+import time
+import timeit
+from typing import Callable, Dict, List, Optional
+
+Metrics = Dict[str, float]
+
+BENCHMARKS: Dict[str, Callable[[bool], Metrics]] = {}
+
+
+def benchmark(name: str):
+    """Registra fn(quick) -> {metrica: valore} sotto `name`."""
+
+    def _register(fn: Callable[[bool], Metrics]) -> Callable[[bool], Metrics]:
+        BENCHMARKS[name] = fn
+        return fn
+
+    return _register
+
+
+def per_call_us(fn: Callable[[], object], number: int, repeat: int = 5) -> float:
+    """Miglior tempo per chiamata su `repeat` serie da `number` chiamate."""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def is_timing(metric: str) -> bool:
+    return metric.endswith("_us") or metric.endswith("_ms")
+
+
+def _commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run(names: Optional[List[str]] = None, quick: bool = False) -> dict:
+    selected = names or sorted(BENCHMARKS)
+    results: Dict[str, float] = {}
+    for name in selected:
+        started = time.perf_counter()
+        for metric, value in BENCHMARKS[name](quick).items():
+            results[f"{name}.{metric}"] = round(float(value), 3)
+        print(f"  {name}: {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return {
+        "meta": {
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[dict]:
+    """
+    Metriche di tempo peggiorate oltre `threshold` (0.2 = +20%) rispetto
+    alla baseline. Metriche nuove o sparite non contano.
+    """
+    regressions = []
+    before = baseline.get("results", {})
+    for metric, value in current.get("results", {}).items():
+        old = before.get(metric)
+        if not is_timing(metric) or not old:
+            continue
+        ratio = value / old
+        if ratio > 1.0 + threshold:
+            regressions.append(
+                {"metric": metric, "baseline": old, "current": value, "ratio": round(ratio, 3)}
+            )
+    return regressions
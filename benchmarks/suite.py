@@ -0,0 +1,285 @@
+"""
+Benchmark dei percorsi caldi del protocollo.
+
+I moduli di pairing tengono lo stato in ~/.ice_studio: il runner
+(python -m benchmarks) punta HOME a una directory temporanea prima di
+importarli, quindi gli import di `protocols` qui sono dentro le funzioni.
+"""
+from __future__ import annotations
+
+import socket
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from .harness import benchmark, per_call_us
+
+
+# ---------------------------------------------------------------------------
+# Discovery
+# ---------------------------------------------------------------------------
+
+def _fleet_responder(nodes: int):
+    """Un socket loopback che risponde a ogni probe per conto di `nodes` nodi."""
+    from protocols.transport.udp.wire import ProbeHandler
+
+    handlers = [
+        ProbeHandler(
+            {
+                "node_id": f"bench-{i}",
+                "hostname": f"bench-{i}",
+                "ip": "127.0.0.1",
+                "role": "host",
+                "fingerprint": f"SHA256:bench-{i}",
+            }
+        )
+        for i in range(nodes)
+    ]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(0.2)
+    stop = threading.Event()
+
+    def _serve():
+        while not stop.is_set():
+            try:
+                data, addr = sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            for handler in handlers:
+                response = handler.respond(data, addr)
+                if response:
+                    sock.sendto(response[0], addr)
+        sock.close()
+
+    threading.Thread(target=_serve, daemon=True).start()
+    return sock.getsockname(), stop, handlers
+
+
+@benchmark("discovery")
+def bench_discovery(quick: bool) -> dict:
+    from protocols.transport.udp.udp_discovery import udp_discovery
+    from protocols.transport.udp.wire import encode_probe
+
+    nodes = 20 if quick else 100
+    address, stop, handlers = _fleet_responder(nodes)
+    probe = encode_probe()
+    try:
+        timings = []
+        for _ in range(3 if quick else 10):
+            started = time.perf_counter()
+            found = udp_discovery(timeout=2.0, expected=nodes, address=address)
+            timings.append((time.perf_counter() - started) * 1e3)
+            if len(found) != nodes:
+                raise RuntimeError(f"discovery found {len(found)}/{nodes} nodes")
+        return {
+            "udp_discovery_ms": min(timings),
+            "probe_respond_us": per_call_us(lambda: handlers[0].respond(probe), 20000),
+            "nodes": nodes,
+        }
+    finally:
+        stop.set()
+
+
+@benchmark("discovery_scale")
+def bench_discovery_scale(quick: bool) -> dict:
+    """udp_discovery() contro flotte virtuali (simulator.py), 1% di perdita."""
+    from protocols.transport.udp.simulator import simulate
+
+    results = {}
+    for nodes in (500,) if quick else (500, 5000):
+        report = simulate(nodes, loss=0.01, window=0.3, rounds=2, timeout=1.2, seed=nodes)
+        results[f"p50_{nodes}_ms"] = report.latency_ms["p50"]
+        results[f"p99_{nodes}_ms"] = report.latency_ms["p99"]
+        results[f"completeness_{nodes}"] = report.completeness
+        results[f"drop_rate_{nodes}"] = report.drop_rate
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Pairing
+# ---------------------------------------------------------------------------
+
+@benchmark("pairing")
+def bench_pairing(quick: bool) -> dict:
+    from protocols.security.pairing import pairing
+
+    number = 200 if quick else 1000
+    counter = iter(range(10**9))
+
+    def _create():
+        i = next(counter)
+        return pairing.create_pairing_request(
+            {"host_id": f"pair-host-{i}", "ip": "10.0.0.1", "client_id": f"pair-client-{i}"}
+        )
+
+    create_us = per_call_us(_create, number, repeat=3)
+
+    requests = [_create().request_id for _ in range(number // 4)]
+    pending = iter(requests)
+    approve_us = per_call_us(lambda: pairing.approve_pairing(next(pending)), len(requests), repeat=1)
+
+    batch = [_create().request_id for _ in range(number // 4)]
+    started = time.perf_counter()
+    pairing.approve_pairings(batch)
+    batch_us = (time.perf_counter() - started) / len(batch) * 1e6
+
+    return {
+        "create_pairing_request_us": create_us,
+        "approve_pairing_us": approve_us,
+        "approve_pairings_per_item_us": batch_us,
+    }
+
+
+@benchmark("trust_store")
+def bench_trust_store(quick: bool) -> dict:
+    """Costo di put durevole (fsync) in funzione della taglia dello store."""
+    from protocols.security.store.trust import TrustedHost, TrustStore
+
+    results = {}
+    sizes = (100, 1000) if quick else (100, 1000, 10000)
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = TrustStore(Path(tmp) / "trusted_hosts.json")
+            for i in range(size):
+                store.put(f"h{i}", TrustedHost(f"h{i}", f"host-{i}", f"10.0.{i // 250}.{i % 250}", "", 0.0), sync=False)
+            store.compact()
+            counter = iter(range(10**9))
+
+            def _put():
+                i = next(counter) % size
+                store.put(f"h{i}", TrustedHost(f"h{i}", f"host-{i}", "10.9.9.9", "", time.time()))
+
+            results[f"put_durable_{size}_us"] = per_call_us(_put, 50 if quick else 200, repeat=3)
+            store.close()
+    return results
+
+
+@benchmark("trust_memory")
+def bench_trust_memory(quick: bool) -> dict:
+    """Memoria per host trusted (store + indici) e per richiesta pendente."""
+    import gc
+    import tracemalloc
+    import uuid
+
+    from protocols.security.pairing.pending import PendingPairings
+    from protocols.security.store.trust import PairingRequest, TrustedHost, TrustStore
+
+    number = 10000 if quick else 100000
+
+    def _measure(build) -> float:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        return (after - before) / number
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TrustStore(Path(tmp) / "trusted_hosts.json", durable=False)
+
+        def _hosts():
+            for i in range(number):
+                host = TrustedHost(
+                    str(uuid.UUID(int=i)),
+                    f"node-{i % 500}",
+                    f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+                    "SHA256:" + uuid.UUID(int=i * 7 + 1).hex,
+                    time.time(),
+                )
+                store.put(host.host_id, host, sync=False)
+            store.commit()
+            return store
+
+        host_bytes = _measure(_hosts)
+        store.close()
+
+    def _pending():
+        table = PendingPairings(max_pending=number)
+        for i in range(number):
+            table.add(
+                PairingRequest(
+                    request_id=str(uuid.UUID(int=number + i)),
+                    host_id=str(uuid.UUID(int=i)),
+                    host_hostname=f"node-{i % 500}",
+                    host_ip="10.0.0.1",
+                    client_id="client-1",
+                    client_fingerprint="SHA256:client",
+                )
+            )
+        return table
+
+    return {
+        "trusted_host_bytes": host_bytes,
+        "pending_pairing_bytes": _measure(_pending),
+        "entries": number,
+    }
+
+
+@benchmark("pairing_status")
+def bench_pairing_status(quick: bool) -> dict:
+    from protocols.security.pairing import pairing
+
+    results = {}
+    sizes = (10, 100, 1000)
+    total = 0
+    for size in sizes:
+        pairing.trust_hosts(
+            {"host_id": f"status-{i}", "hostname": f"status-{i}", "ip": "10.1.1.1"}
+            for i in range(total, size)
+        )
+        total = size
+        host = "status-0"
+        version = pairing.pairing_version()
+        number = 2000 if quick else 20000
+
+        def _rebuild():
+            pairing._bump_version()
+            pairing.pairing_status(host)
+
+        results[f"status_{size}_us"] = per_call_us(lambda: pairing.pairing_status(host), number)
+        results[f"status_not_modified_{size}_us"] = per_call_us(
+            lambda: pairing.pairing_status(host, since_version=version), number
+        )
+        results[f"status_json_{size}_us"] = per_call_us(
+            lambda: pairing.pairing_status_json(host), number
+        )
+        results[f"status_rebuild_{size}_us"] = per_call_us(_rebuild, 20 if quick else 100)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Security primitives
+# ---------------------------------------------------------------------------
+
+@benchmark("fingerprint")
+def bench_fingerprint(quick: bool) -> dict:
+    from protocols.snowball.security import compute_fingerprint
+
+    return {
+        "compute_fingerprint_us": per_call_us(
+            lambda: compute_fingerprint("node-1234567890", "workstation.local"),
+            20000 if quick else 200000,
+        )
+    }
+
+
+@benchmark("tokens")
+def bench_tokens(quick: bool) -> dict:
+    from protocols.security.tokens.signed import Keyring, SigningKey, issue_signed_token
+    from protocols.security.tokens.tokens import generate_token
+
+    from . import bench_tokens as tokens
+
+    number = 2000 if quick else 20000
+    keyring = Keyring([SigningKey.generate("k1")])
+    results = {
+        "generate_token_us": per_call_us(lambda: generate_token("session"), number),
+        "issue_signed_token_us": per_call_us(lambda: issue_signed_token(keyring, "session"), number),
+    }
+    results.update(tokens.run(outstanding=number, number=number))
+    return results
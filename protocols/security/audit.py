@@ -1,7 +1,230 @@
+"""
+Audit di sicurezza.
+
+audit_event() non scrive nulla sul thread chiamante: accoda l'evento in un
+ring buffer limitato e ritorna. Un thread writer svuota il buffer a
+blocchi e li appende come JSONL a un AuditLog a segmenti indicizzati
+(~/.ice_studio/audit/, vedi audit_log.py), interrogabile con query_audit().
+
+Con il buffer pieno si applica la policy:
+  - "drop_oldest"  scarta l'evento più vecchio in coda (default)
+  - "drop_newest"  scarta l'evento appena arrivato
+  - "block"        attende spazio fino a `block_timeout`, poi scarta
+Ogni scarto incrementa `dropped`. Alla chiusura dell'interprete (atexit)
+la coda viene svuotata su disco.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
 import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional
+
+from .audit_log import AuditLog
+
+logger = logging.getLogger("ice.security.audit")
+
+AUDIT_DIR = Path.home() / ".ice_studio" / "audit"
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+
+
+class AuditSink:
+    def __init__(
+        self,
+        directory: Path = AUDIT_DIR,
+        *,
+        capacity: int = 4096,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+        segment_bytes: int = 8 * 1024 * 1024,
+        max_segments: Optional[int] = 512,
+        policy: str = DROP_OLDEST,
+        block_timeout: float = 0.05,
+    ) -> None:
+        if policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f"unknown audit policy: {policy}")
+        self.log = AuditLog(directory, segment_bytes, max_segments)
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+
+        self._queue: Deque[Dict] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._busy = False
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+
+        self._thread = threading.Thread(target=self._run, daemon=True, name="ice-audit")
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Producer (hot path)
+    # ------------------------------------------------------------------
+
+    def submit(self, record: Dict) -> bool:
+        """Accoda `record`; False se è stato scartato."""
+        with self._cond:
+            if self._closed:
+                self.dropped += 1
+                return False
+            if len(self._queue) >= self.capacity:
+                if self.policy == DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                elif self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                else:
+                    # il writer può dormire fino a flush_interval: va svegliato
+                    self._cond.notify_all()
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._queue) >= self.capacity and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    if len(self._queue) >= self.capacity or self._closed:
+                        self.dropped += 1
+                        return False
+            self._queue.append(record)
+            self.enqueued += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    # ------------------------------------------------------------------
+    # Writer
+    # ------------------------------------------------------------------
+
+    def _take(self) -> List[Dict]:
+        batch = []
+        while self._queue and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._queue and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                batch = self._take()
+                self._busy = bool(batch)
+                closed = self._closed
+                # spazio liberato: sveglia i produttori in attesa (policy block)
+                self._cond.notify_all()
+            if batch:
+                try:
+                    self.log.append(batch)
+                except OSError as err:
+                    logger.warning("audit write failed: %s", err)
+                    with self._cond:
+                        self.dropped += len(batch)
+                else:
+                    with self._cond:
+                        self.written += len(batch)
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+            elif closed:
+                break
+        self.log.close()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """Attende che il buffer sia vuoto e l'ultimo blocco su disco."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._queue or self._busy:
+                if not self._thread.is_alive():
+                    return False
+                remaining = self.flush_interval
+                if deadline is not None:
+                    remaining = min(remaining, deadline - time.monotonic())
+                    if remaining <= 0:
+                        return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def query(self, **filters) -> Iterator[Dict]:
+        """Query sull'AuditLog (vedi AuditLog.query) dopo un flush."""
+        self.flush()
+        return self.log.query(**filters)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "queued": len(self._queue),
+            }
+
+
+_SINK: Optional[AuditSink] = None
+_SINK_LOCK = threading.Lock()
+
+
+def configure_audit(**options) -> AuditSink:
+    """Sostituisce il sink di default (il precedente viene svuotato e chiuso)."""
+    global _SINK
+    with _SINK_LOCK:
+        old, _SINK = _SINK, AuditSink(**options)
+    if old is not None:
+        old.close()
+    return _SINK
+
+
+def get_audit_sink() -> AuditSink:
+    global _SINK
+    if _SINK is None:
+        with _SINK_LOCK:
+            if _SINK is None:
+                _SINK = AuditSink()
+    return _SINK
+
+
+def shutdown_audit(timeout: Optional[float] = 5.0) -> None:
+    with _SINK_LOCK:
+        sink = _SINK
+    if sink is not None:
+        sink.close(timeout)
+
+
+atexit.register(shutdown_audit)
 
 
 def audit_event(event: str, details: dict | None = None):
-    ts = time.strftime("%Y-%m-%d %H:%M:%S")
-    payload = details or {}
-    print(f"[SECURITY][{ts}] {event} :: {payload}")
\ No newline at end of file
+    get_audit_sink().submit(
+        {"ts": time.time(), "event": event, "details": dict(details) if details else {}}
+    )
+
+
+def query_audit(
+    event: Optional[str] = None,
+    node: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+) -> Iterator[Dict]:
+    """Es. query_audit("sandbox.launch", node=node_id, since=time.time() - 3600)."""
+    return get_audit_sink().query(event=event, node=node, since=since, until=until)
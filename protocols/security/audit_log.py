@@ -0,0 +1,214 @@
+"""
+Log di audit a segmenti, indicizzato per tempo, evento e nodo.
+
+Layout su disco (una coppia per segmento):
+    audit-<ms>.jsonl   gli eventi, una riga JSON ciascuno
+    audit-<ms>.idx     un record a dimensione fissa per riga:
+                       (ts, offset nel .jsonl, crc32(event), crc32(node))
+
+Le query (query()) fanno mmap dell'indice, trovano con una ricerca
+binaria il primo record >= `since` e scorrono solo quel tratto,
+confrontando gli hash interi; il .jsonl viene letto (sempre via mmap)
+solo per le righe che corrispondono. I risultati sono un generatore:
+memoria costante anche su mesi di log.
+
+Il nodo di un evento è details["node_id"] (o "host_id").
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+INDEX_ENTRY = struct.Struct("<dQII")
+SEGMENT_PREFIX = "audit-"
+
+
+def _key(value: Optional[str]) -> int:
+    return zlib.crc32(value.encode()) if value else 0
+
+
+def record_node(record: Dict) -> Optional[str]:
+    details = record.get("details") or {}
+    node = details.get("node_id") or details.get("host_id")
+    return str(node) if node else None
+
+
+class AuditLog:
+    def __init__(
+        self,
+        directory: Path,
+        segment_bytes: int = 8 * 1024 * 1024,
+        max_segments: Optional[int] = 512,
+    ) -> None:
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self._data = None
+        self._index = None
+        self._size = 0
+        self._last_ts = 0.0
+
+    # ------------------------------------------------------------------
+    # Segmenti
+    # ------------------------------------------------------------------
+
+    def segments(self) -> List[Path]:
+        """Segmenti in ordine cronologico (path del .jsonl)."""
+        if not self.directory.exists():
+            return []
+        return sorted(
+            self.directory.glob(f"{SEGMENT_PREFIX}*.jsonl"),
+            key=lambda p: int(p.stem[len(SEGMENT_PREFIX):]),
+        )
+
+    def _open_segment(self, ts: float) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        ms = int(ts * 1000)
+        last = self.segments()
+        if last:
+            ms = max(ms, int(last[-1].stem[len(SEGMENT_PREFIX):]) + 1)
+        base = self.directory / f"{SEGMENT_PREFIX}{ms}"
+        self._data = open(base.with_suffix(".jsonl"), "ab")
+        self._index = open(base.with_suffix(".idx"), "ab")
+        self._size = 0
+        self._prune()
+
+    def _prune(self) -> None:
+        if self.max_segments is None:
+            return
+        segments = self.segments()
+        for path in segments[: max(0, len(segments) - self.max_segments)]:
+            for stale in (path, path.with_suffix(".idx")):
+                try:
+                    stale.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def _close_segment(self) -> None:
+        if self._data is not None:
+            self._data.close()
+            self._index.close()
+            self._data = self._index = None
+
+    # ------------------------------------------------------------------
+    # Scrittura (solo dal writer dell'AuditSink)
+    # ------------------------------------------------------------------
+
+    def append(self, records: List[Dict]) -> None:
+        if not records:
+            return
+        if self._data is None or self._size >= self.segment_bytes:
+            self._close_segment()
+            self._open_segment(records[0].get("ts") or time.time())
+
+        lines = []
+        entries = []
+        offset = self._size
+        for record in records:
+            line = json.dumps(record, separators=(",", ":"), default=str).encode() + b"\n"
+            # ts nell'indice non decrescente (l'ordine di coda può invertire di
+            # pochi µs): la ricerca binaria resta valida, il filtro usa il ts vero
+            self._last_ts = max(self._last_ts, float(record.get("ts") or 0.0))
+            entries.append(
+                INDEX_ENTRY.pack(
+                    self._last_ts,
+                    offset,
+                    _key(record.get("event")),
+                    _key(record_node(record)),
+                )
+            )
+            lines.append(line)
+            offset += len(line)
+
+        # prima i dati, poi l'indice: un lettore non trova mai offset oltre i dati
+        self._data.write(b"".join(lines))
+        self._data.flush()
+        self._index.write(b"".join(entries))
+        self._index.flush()
+        self._size = offset
+
+    def close(self) -> None:
+        self._close_segment()
+
+    # ------------------------------------------------------------------
+    # Query
+    # ------------------------------------------------------------------
+
+    def query(
+        self,
+        event: Optional[str] = None,
+        node: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> Iterator[Dict]:
+        """Eventi che corrispondono ai filtri, in ordine cronologico."""
+        event_key = _key(event) if event else None
+        node_key = _key(node) if node else None
+        segments = self.segments()
+
+        for position, path in enumerate(segments):
+            # i segmenti sono ordinati: salta quelli finiti prima di `since`
+            if since is not None and position + 1 < len(segments):
+                next_start = int(segments[position + 1].stem[len(SEGMENT_PREFIX):]) / 1000
+                if next_start < since:
+                    continue
+            if until is not None and int(path.stem[len(SEGMENT_PREFIX):]) / 1000 > until:
+                return
+            yield from self._query_segment(path, event, node, event_key, node_key, since, until)
+
+    def _query_segment(self, path, event, node, event_key, node_key, since, until):
+        try:
+            index_file = open(path.with_suffix(".idx"), "rb")
+            data_file = open(path, "rb")
+        except FileNotFoundError:
+            return
+        with index_file, data_file:
+            count = os.fstat(index_file.fileno()).st_size // INDEX_ENTRY.size
+            if not count or not os.fstat(data_file.fileno()).st_size:
+                return
+            with mmap.mmap(index_file.fileno(), count * INDEX_ENTRY.size, access=mmap.ACCESS_READ) as index, \
+                    mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                unpack = INDEX_ENTRY.unpack_from
+                size = INDEX_ENTRY.size
+
+                lo, hi = 0, count
+                if since is not None:
+                    while lo < hi:
+                        mid = (lo + hi) // 2
+                        if unpack(index, mid * size)[0] < since:
+                            lo = mid + 1
+                        else:
+                            hi = mid
+
+                for position in range(lo, count):
+                    ts, offset, ev, nd = unpack(index, position * size)
+                    if until is not None and ts > until:
+                        break
+                    if event_key is not None and ev != event_key:
+                        continue
+                    if node_key is not None and nd != node_key:
+                        continue
+                    end = data.find(b"\n", offset)
+                    if end < 0:
+                        break
+                    try:
+                        record = json.loads(data[offset:end])
+                    except ValueError:
+                        continue
+                    # crc32 può collidere: conferma sui valori veri
+                    if event is not None and record.get("event") != event:
+                        continue
+                    if node is not None and record_node(record) != node:
+                        continue
+                    record_ts = record.get("ts") or 0.0
+                    if since is not None and record_ts < since:
+                        continue
+                    if until is not None and record_ts > until:
+                        continue
+                    yield record
@@ -1,14 +1,39 @@
 # ice_studio/security/identity.py
-from dataclasses import dataclass
-from enum import Enum
+"""
+Identity del nodo locale.
+
+Risolta una volta e tenuta in cache da IdentityProvider, insieme al
+payload già serializzato: handler HTTP e responder UDP leggono solo
+attributi, mai socket.gethostbyname() (che può bloccare su DNS).
+Un thread ricontrolla hostname e IP a intervalli (avviato dal primo
+get_identity_provider()) e aggiorna la cache quando cambiano (cambio
+rete, DHCP, VPN); i responder seguono i cambi con follow().
+NodeIdentity è immutabile: la stessa istanza viene condivisa tra i
+chiamanti senza copie.
+"""
+from __future__ import annotations
+
+import json
+import logging
 import socket
+import threading
 import uuid
+from dataclasses import asdict, dataclass
+from enum import Enum
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger("ice.security.identity")
+
+# indirizzo TEST-NET: connect() su UDP sceglie solo la route, non invia nulla
+_ROUTE_PROBE = ("192.0.2.1", 9)
+REFRESH_INTERVAL = 30.0
+
 
 class NodeRole(str, Enum):
     CLIENT = "client"
     HOST = "host"
 
-@dataclass
+@dataclass(frozen=True)
 class NodeIdentity:
     node_id: str
     hostname: str
@@ -17,17 +42,148 @@ class NodeIdentity:
     fingerprint: str
 
 
+def _local_ip() -> str:
+    """IP dell'interfaccia di uscita di default, senza DNS."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect(_ROUTE_PROBE)
+        return sock.getsockname()[0]
+    except OSError:
+        return "127.0.0.1"
+    finally:
+        sock.close()
+
+
+class IdentityProvider:
+    """Identity locale in cache, con payload pre-serializzato."""
+
+    def __init__(self, role: NodeRole = NodeRole.HOST) -> None:
+        self.role = NodeRole(role)
+        self.version = 0
+        self._node_id = str(uuid.getnode())  # stabile
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[NodeIdentity], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._identity: Optional[NodeIdentity] = None
+        self._payload: Dict = {}
+        self._payload_bytes = b""
+        self.refresh()
+
+    def _resolve(self) -> NodeIdentity:
+        return NodeIdentity(
+            node_id=self._node_id,
+            hostname=socket.gethostname(),
+            ip=_local_ip(),
+            role=self.role,
+            fingerprint=f"SHA256:{self._node_id}",  # placeholder, ok per ora
+        )
+
+    # ------------------------------------------------------------------
+    # Cache
+    # ------------------------------------------------------------------
+
+    @property
+    def identity(self) -> NodeIdentity:
+        return self._identity
+
+    @property
+    def payload(self) -> Dict:
+        """Payload per risposte HTTP/UDP (copia: la cache resta intatta)."""
+        return dict(self._payload)
+
+    @property
+    def payload_bytes(self) -> bytes:
+        """Il payload già serializzato in JSON."""
+        return self._payload_bytes
+
+    def refresh(self) -> bool:
+        """Ri-risolve hostname/IP; True se l'identity è cambiata."""
+        identity = self._resolve()
+        with self._lock:
+            if identity == self._identity:
+                return False
+            payload = asdict(identity)
+            payload["role"] = identity.role.value
+            # pubblicati insieme: chi legge vede sempre una coppia coerente
+            self._identity = identity
+            self._payload = payload
+            self._payload_bytes = json.dumps(payload, separators=(",", ":")).encode()
+            self.version += 1
+            first = self.version == 1
+            listeners = list(self._listeners)
+
+        if not first:
+            logger.info("[IDENTITY] changed hostname=%s ip=%s", identity.hostname, identity.ip)
+            for listener in listeners:
+                try:
+                    listener(identity)
+                except Exception:
+                    logger.exception("identity listener failed")
+        return True
+
+    def subscribe(self, listener: Callable[[NodeIdentity], None]) -> Callable[[], None]:
+        """Notifica `listener` a ogni cambio; ritorna la funzione di unsubscribe."""
+        with self._lock:
+            self._listeners.append(listener)
+
+        def _unsubscribe() -> None:
+            with self._lock:
+                if listener in self._listeners:
+                    self._listeners.remove(listener)
+
+        return _unsubscribe
+
+    def follow(self, update: Callable[[Dict], None]) -> Callable[[], None]:
+        """Come subscribe(), ma passa il nuovo payload (es. ProbeHandler.update)."""
+        return self.subscribe(lambda _identity: update(self.payload))
+
+    # ------------------------------------------------------------------
+    # Refresh in background
+    # ------------------------------------------------------------------
+
+    def start(self, interval: float = REFRESH_INTERVAL) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def _loop() -> None:
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception("identity refresh failed")
+
+        self._thread = threading.Thread(target=_loop, daemon=True, name="ice-identity")
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+
+_PROVIDERS: Dict[NodeRole, IdentityProvider] = {}
+_PROVIDERS_LOCK = threading.Lock()
+
+
+def get_identity_provider(role: NodeRole = NodeRole.HOST) -> IdentityProvider:
+    """
+    Provider condiviso per `role`: creato e risolto al primo uso, con il
+    refresh in background già avviato.
+    """
+    role = NodeRole(role)
+    provider = _PROVIDERS.get(role)
+    if provider is None:
+        with _PROVIDERS_LOCK:
+            provider = _PROVIDERS.get(role)
+            if provider is None:
+                provider = IdentityProvider(role)
+                provider.start()
+                _PROVIDERS[role] = provider
+    return provider
+
+
 def get_local_identity(role: NodeRole) -> NodeIdentity:
-    hostname = socket.gethostname()
-    ip = socket.gethostbyname(hostname)
-
-    node_id = str(uuid.getnode())      # stabile
-    fingerprint = f"SHA256:{node_id}"  # placeholder, ok per ora
-
-    return NodeIdentity(
-        node_id=node_id,
-        hostname=hostname,
-        ip=ip,
-        role=role,
-        fingerprint=fingerprint,
-    )
+    return get_identity_provider(role).identity
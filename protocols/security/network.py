@@ -1,37 +1,27 @@
-from dataclasses import dataclass, asdict
-from enum import Enum
-import socket
-import uuid
-
-class NodeRole(str, Enum):
-    CLIENT = "client"
-    HOST = "host"
-
-@dataclass
-class NodeIdentity:
-    node_id: str
-    hostname: str
-    ip: str
-    role: NodeRole
-    fingerprint: str
-
-
-def get_local_identity(role: NodeRole) -> NodeIdentity:
-    hostname = socket.gethostname()
-    ip = socket.gethostbyname(hostname)
-
-    node_id = str(uuid.getnode())  # stabile
-    fingerprint = f"SHA256:{node_id}"
-
-    return NodeIdentity(
-        node_id=node_id,
-        hostname=hostname,
-        ip=ip,
-        role=role,
-        fingerprint=fingerprint,
-    )
+from .identity.identity import (
+    IdentityProvider,
+    NodeIdentity,
+    NodeRole,
+    get_identity_provider,
+    get_local_identity,
+)
+
+__all__ = [
+    "IdentityProvider",
+    "NodeIdentity",
+    "NodeRole",
+    "get_identity_provider",
+    "get_local_identity",
+    "identity_payload",
+    "identity_payload_bytes",
+]
 
 
 def identity_payload(role: NodeRole = NodeRole.HOST) -> dict:
     """Return serialized identity payload for HTTP responses."""
-    return asdict(get_local_identity(role))
+    return get_identity_provider(role).payload
+
+
+def identity_payload_bytes(role: NodeRole = NodeRole.HOST) -> bytes:
+    """Same payload, already JSON-encoded (no per-response serialization)."""
+    return get_identity_provider(role).payload_bytes
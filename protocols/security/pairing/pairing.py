@@ -4,53 +4,27 @@ import json
 import logging
 import time
 import uuid
-from dataclasses import dataclass, asdict
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
+
+from ..identity.identity import NodeRole, get_local_identity
+from ..store.journal import JournalStore
+from ..store.sync import SyncReport, TrustSyncServer, sync_stores
+from ..store.trust import (
+    PairingRequest,
+    SharedTrustStore,
+    TrustedClient,
+    TrustedHost,
+    TrustStore,
+    client_store,
+)
+from .pending import PendingPairings
 
 TRUSTED_DIR = Path.home() / ".ice_studio"
 TRUSTED_HOSTS_PATH = TRUSTED_DIR / "trusted_hosts.json"
 TRUSTED_CLIENTS_PATH = TRUSTED_DIR / "trusted_clients.json"
 
 
-@dataclass
-class PairingRequest:
-    request_id: str
-
-    # host info (remote flake)
-    host_id: str
-    host_hostname: str
-    host_ip: str
-
-    # client info (questa macchina preboot)
-    client_id: str
-    client_fingerprint: str
-
-    created_at: float
-    approved: bool = False
-
-
-@dataclass
-class TrustedHost:
-    host_id: str
-    hostname: str
-    ip: str
-    fingerprint: str
-    paired_at: float
-
-
-@dataclass
-class TrustedClient:
-    client_id: str
-    fingerprint: str
-    paired_at: float
-
-
-_PAIRINGS: Dict[str, PairingRequest] = {}
-_TRUSTED_HOSTS: Dict[str, TrustedHost] = {}
-_TRUSTED_CLIENTS: Dict[str, TrustedClient] = {}
-_SELECTED_HOST_ID: Optional[str] = None
-
 logger = logging.getLogger("ice.preboot")
 
 
@@ -58,57 +32,45 @@ logger = logging.getLogger("ice.preboot")
 # IO helpers
 # ---------------------------------------------------------------------------
 
-def _ensure_dir() -> None:
-    TRUSTED_DIR.mkdir(parents=True, exist_ok=True)
-
+def _hosts_store() -> TrustStore:
+    return SharedTrustStore(TRUSTED_HOSTS_PATH)
 
-def _load_trusted_hosts() -> None:
-    if not TRUSTED_HOSTS_PATH.exists():
-        return
-    try:
-        data = json.loads(TRUSTED_HOSTS_PATH.read_text())
-    except Exception:
-        return
 
-    for entry in data:
-        try:
-            host = TrustedHost(**entry)
-            _TRUSTED_HOSTS[host.host_id] = host
-        except TypeError:
-            continue
+def _clients_store() -> JournalStore[TrustedClient]:
+    return client_store(TRUSTED_CLIENTS_PATH, shared=True)
 
 
-def _save_trusted_hosts() -> None:
-    _ensure_dir()
-    data = [asdict(host) for host in _TRUSTED_HOSTS.values()]
-    TRUSTED_HOSTS_PATH.write_text(json.dumps(data, indent=2))
+# Carica subito host/client già trusted (snapshot + journal).
+# Ogni modifica appende una riga al journal invece di riscrivere il file.
+# Gli store sono condivisi con runtime e Snowball (store/shared.py): chi
+# legge _TRUSTED_HOSTS / _TRUSTED_CLIENTS direttamente passa da _refresh().
+_HOSTS = _hosts_store()
+_CLIENTS = _clients_store()
 
+# Richieste pendenti: TTL, limite massimo, dedup per (host_id, client_id)
+_PAIRINGS = PendingPairings()
+_TRUSTED_HOSTS: Dict[str, TrustedHost] = _HOSTS.data
+_TRUSTED_CLIENTS: Dict[str, TrustedClient] = _CLIENTS.data
+_SELECTED_HOST_ID: Optional[str] = None
 
-def _load_trusted_clients() -> None:
-    if not TRUSTED_CLIENTS_PATH.exists():
-        return
-    try:
-        data = json.loads(TRUSTED_CLIENTS_PATH.read_text())
-    except Exception:
-        return
-
-    for entry in data:
-        try:
-            client = TrustedClient(**entry)
-            _TRUSTED_CLIENTS[client.client_id] = client
-        except TypeError:
-            continue
+# Versione monotona di host trusted + selezione, per il polling condizionale
+# di pairing_status(). Parte dal clock (ms) così una versione vista prima
+# di un riavvio del daemon non coincide con una nuova.
+_VERSION = int(time.time() * 1000)
+_STATUS_CACHE: Optional[dict] = None
 
 
-def _save_trusted_clients() -> None:
-    _ensure_dir()
-    data = [asdict(client) for client in _TRUSTED_CLIENTS.values()]
-    TRUSTED_CLIENTS_PATH.write_text(json.dumps(data, indent=2))
+def _bump_version() -> None:
+    global _VERSION
+    _VERSION += 1
 
 
-# Carica subito host/client già trusted
-_load_trusted_hosts()
-_load_trusted_clients()
+def _refresh() -> None:
+    """Applica le modifiche al trust scritte da altri processi."""
+    hosts_changed = _HOSTS.refresh()
+    _CLIENTS.refresh()
+    if hosts_changed:
+        _bump_version()
 
 
 # ---------------------------------------------------------------------------
@@ -124,7 +86,7 @@ def create_pairing_request(payload: dict) -> PairingRequest:
         "host_id": "...",
         "ip": "192.168.0.X",
         "hostname": "Exon",
-        // opzionali:
+        // opzionali (default: identity locale, NodeRole.CLIENT):
         "client_id": "...",
         "client_fingerprint": "...",
       }
@@ -139,12 +101,18 @@ def create_pairing_request(payload: dict) -> PairingRequest:
     host_hostname = payload.get("hostname") or host_id
     host_ip = payload.get("ip") or payload.get("host_ip") or ""
 
-    client_id = payload.get("client_id") or payload.get("node_id") or str(uuid.uuid4())
+    client_id = payload.get("client_id") or payload.get("node_id")
     fingerprint = (
         payload.get("client_fingerprint")
         or payload.get("fingerprint")
         or ""
     )
+    if not client_id:
+        # la UI di solito non lo manda: il client è questa macchina, la sua
+        # identity è stabile e le richieste ripetute restano deduplicate
+        local = get_local_identity(NodeRole.CLIENT)
+        client_id = local.node_id
+        fingerprint = fingerprint or local.fingerprint
 
     req = PairingRequest(
         request_id=str(uuid.uuid4()),
@@ -156,10 +124,11 @@ def create_pairing_request(payload: dict) -> PairingRequest:
         created_at=time.time(),
         approved=False,
     )
-    _PAIRINGS[req.request_id] = req
+    req, created = _PAIRINGS.add(req)
 
     logger.info(
-        "[PAIRING] request created host_id=%s ip=%s client_id=%s",
+        "[PAIRING] request %s host_id=%s ip=%s client_id=%s",
+        "created" if created else "refreshed",
         req.host_id,
         req.host_ip,
         req.client_id,
@@ -168,44 +137,31 @@ def create_pairing_request(payload: dict) -> PairingRequest:
 
 
 def list_pairings() -> List[dict]:
-    return [asdict(p) for p in _PAIRINGS.values()]
+    return [p.to_record() for p in _PAIRINGS.values()]
 
 
 def list_trusted_hosts() -> List[dict]:
-    return [asdict(host) for host in _TRUSTED_HOSTS.values()]
+    _refresh()
+    return [host.to_record() for host in _TRUSTED_HOSTS.values()]
 
 
 def list_trusted_clients() -> List[dict]:
-    return [asdict(client) for client in _TRUSTED_CLIENTS.values()]
+    _refresh()
+    return [client.to_record() for client in _TRUSTED_CLIENTS.values()]
+
+
+def _trust_host(host_id: str, hostname: str, ip: str, fingerprint: str) -> TrustedHost:
+    """Aggiorna host trusted in memoria e accoda la riga di journal (senza fsync)."""
+    return _HOSTS.trust(host_id, hostname, ip, fingerprint, sync=False)
 
 
 def trust_host(host_id: str, hostname: str, ip: str, fingerprint: str) -> TrustedHost:
     """
     Aggiunge/aggiorna un host nella lista dei flake trusted.
     """
-    existing = _TRUSTED_HOSTS.get(host_id)
-    if existing:
-        # aggiorna info esistenti
-        if hostname:
-            existing.hostname = hostname
-        if ip:
-            existing.ip = ip
-        if fingerprint:
-            existing.fingerprint = fingerprint
-        if not existing.paired_at:
-            existing.paired_at = time.time()
-        trusted = existing
-    else:
-        trusted = TrustedHost(
-            host_id=host_id,
-            hostname=hostname or host_id,
-            ip=ip,
-            fingerprint=fingerprint or "",
-            paired_at=time.time(),
-        )
-        _TRUSTED_HOSTS[host_id] = trusted
-
-    _save_trusted_hosts()
+    trusted = _trust_host(host_id, hostname, ip, fingerprint)
+    _HOSTS.commit()
+    _bump_version()
     logger.info(
         "[SECURITY] trusted host saved host_id=%s hostname=%s ip=%s",
         trusted.host_id,
@@ -215,11 +171,84 @@ def trust_host(host_id: str, hostname: str, ip: str, fingerprint: str) -> Truste
     return trusted
 
 
+def trust_hosts(batch: Iterable[dict]) -> List[dict]:
+    """
+    Come trust_host() per un intero batch: tutto in memoria, poi un solo
+    commit del journal (una fsync) e un solo bump di versione.
+
+    Ogni elemento: {"host_id", "hostname", "ip", "fingerprint"} (host_id
+    può mancare se c'è node_id). Ritorna un risultato per elemento:
+      {"host_id": ..., "ok": True} oppure {"host_id": ..., "ok": False, "error": ...}
+    """
+    results: List[dict] = []
+    with _HOSTS.locked():
+        for item in batch:
+            host_id = item.get("host_id") or item.get("node_id")
+            if not host_id:
+                results.append({"host_id": None, "ok": False, "error": "missing host_id"})
+                continue
+            _trust_host(
+                host_id,
+                item.get("hostname") or "",
+                item.get("ip") or "",
+                item.get("fingerprint") or "",
+            )
+            results.append({"host_id": host_id, "ok": True})
+
+    trusted = sum(1 for r in results if r["ok"])
+    if trusted:
+        _HOSTS.commit()
+        _bump_version()
+    logger.info("[SECURITY] trusted hosts saved (batch) count=%d failed=%d",
+                trusted, len(results) - trusted)
+    return results
+
+
+def revoke_host(host_id: str) -> bool:
+    """
+    Toglie un host dai trusted. La rimozione resta come tombstone e la
+    sync (sync_trust) la propaga ai peer invece di farla rientrare.
+    """
+    global _SELECTED_HOST_ID
+    if not _HOSTS.delete(host_id):
+        return False
+    if _SELECTED_HOST_ID == host_id:
+        _SELECTED_HOST_ID = None
+    _bump_version()
+    logger.info("[SECURITY] trusted host revoked host_id=%s", host_id)
+    return True
+
+
+def trusted_host_by_fingerprint(fingerprint: str) -> Optional[TrustedHost]:
+    return _HOSTS.by_fingerprint(fingerprint)
+
+
+def trusted_hosts_by_ip(ip: str) -> List[TrustedHost]:
+    return _HOSTS.lookup("ip", ip) if ip else []
+
+
+def trusted_hosts_by_hostname(hostname: str) -> List[TrustedHost]:
+    return _HOSTS.lookup("hostname", hostname) if hostname else []
+
+
+def trusted_client_by_fingerprint(fingerprint: str) -> Optional[TrustedClient]:
+    return _CLIENTS.lookup_one("fingerprint", fingerprint) if fingerprint else None
+
+
+def is_fingerprint_trusted(fingerprint: str) -> bool:
+    return bool(
+        trusted_host_by_fingerprint(fingerprint)
+        or trusted_client_by_fingerprint(fingerprint)
+    )
+
+
 def load_trusted_hosts() -> Dict[str, TrustedHost]:
+    _refresh()
     return dict(_TRUSTED_HOSTS)
 
 
 def load_trusted_clients() -> Dict[str, TrustedClient]:
+    _refresh()
     return dict(_TRUSTED_CLIENTS)
 
 
@@ -236,17 +265,37 @@ def approve_pairing(request_id: str) -> bool:
     """
     req = _PAIRINGS.get(request_id)
     if not req:
-        logger.warning("[PAIRING] approve failed: unknown request_id=%s", request_id)
+        if _PAIRINGS.is_retired(request_id):
+            # già approvata in passato → idempotente
+            return True
+        logger.warning(
+            "[PAIRING] approve failed: unknown or expired request_id=%s", request_id
+        )
         return False
 
-    if req.approved:
-        # già approvata in passato → idempotente
-        return True
+    trusted_host, trusted_client = _approve(req)
+    _HOSTS.commit()
+    _CLIENTS.commit()
+    _bump_version()
+
+    # Seleziona l'host come target corrente
+    select_host(trusted_host.host_id)
+
+    logger.info(
+        "[PAIRING] approved client_id=%s host_id=%s ip=%s",
+        trusted_client.client_id,
+        trusted_host.host_id,
+        trusted_host.ip,
+    )
+    return True
+
 
+def _approve(req: PairingRequest) -> tuple[TrustedHost, TrustedClient]:
+    """Applica in memoria l'approvazione di `req`; il commit è del chiamante."""
     req.approved = True
 
     # Host trusted (flake)
-    trusted_host = trust_host(
+    trusted_host = _trust_host(
         host_id=req.host_id,
         hostname=req.host_hostname,
         ip=req.host_ip,
@@ -259,46 +308,147 @@ def approve_pairing(request_id: str) -> bool:
         fingerprint=req.client_fingerprint,
         paired_at=time.time(),
     )
-    _TRUSTED_CLIENTS[trusted_client.client_id] = trusted_client
-    _save_trusted_clients()
+    _CLIENTS.put(trusted_client.client_id, trusted_client, sync=False)
 
-    # Seleziona l'host come target corrente
-    select_host(trusted_host.host_id)
+    # la richiesta esce dalla tabella pendenti: ora vive nel trust store
+    _PAIRINGS.retire(req.request_id)
+    return trusted_host, trusted_client
+
+
+def approve_pairings(request_ids: Iterable[str]) -> Dict[str, dict]:
+    """
+    Approva un batch di richieste (onboarding di una flotta).
+
+    Tutto in memoria, poi un commit per store (hosts + clients) invece di
+    due per richiesta. Se nessun host è selezionato viene selezionato il
+    primo approvato. Ritorna, per request_id:
+      {"ok": True, "status": "approved" | "already_approved", "host_id": ...}
+      {"ok": False, "status": "unknown"}
+    """
+    results: Dict[str, dict] = {}
+    approved: List[TrustedHost] = []
+    # un flock per store per tutto il batch (ordine: hosts, poi clients)
+    with _HOSTS.locked(), _CLIENTS.locked():
+        for request_id in request_ids:
+            if request_id in results:
+                continue
+            req = _PAIRINGS.get(request_id)
+            if not req:
+                if _PAIRINGS.is_retired(request_id):
+                    results[request_id] = {"ok": True, "status": "already_approved"}
+                else:
+                    results[request_id] = {"ok": False, "status": "unknown"}
+                continue
+            trusted_host, _ = _approve(req)
+            approved.append(trusted_host)
+            results[request_id] = {"ok": True, "status": "approved", "host_id": trusted_host.host_id}
+
+    if approved:
+        _HOSTS.commit()
+        _CLIENTS.commit()
+        _bump_version()
+        if not _SELECTED_HOST_ID:
+            select_host(approved[0].host_id)
 
     logger.info(
-        "[PAIRING] approved client_id=%s host_id=%s ip=%s",
-        trusted_client.client_id,
-        trusted_host.host_id,
-        trusted_host.ip,
+        "[PAIRING] approved batch count=%d unknown=%d",
+        len(approved),
+        sum(1 for r in results.values() if not r["ok"]),
     )
-    return True
+    return results
 
 
 # ---------------------------------------------------------------------------
 # Status / selection
 # ---------------------------------------------------------------------------
 
-def pairing_status(host_id: Optional[str]) -> dict:
+def _status_snapshot() -> dict:
     """
-    Ritorna lo stato di pairing lato preboot per l'host richiesto.
-    Usato dal polling JS (/preboot/pairing/status).
+    Parte di pairing_status() che non dipende dall'host richiesto,
+    ricostruita (e serializzata) solo quando cambia _VERSION.
     """
-    trusted = load_trusted_hosts()
+    global _STATUS_CACHE
+    cache = _STATUS_CACHE
+    if cache is not None and cache["version"] == _VERSION:
+        return cache
+
+    version = _VERSION
+    hosts = list_trusted_hosts()
     selected = selected_host()
-    is_trusted = bool(host_id and host_id in trusted)
+    cache = {
+        "version": version,
+        "selected_host": selected,
+        "trusted_hosts": hosts,
+        "selected_host_json": json.dumps(selected),
+        "trusted_hosts_json": json.dumps(hosts),
+    }
+    _STATUS_CACHE = cache
+    return cache
+
+
+def pairing_version() -> int:
+    return _VERSION
 
-    return {
+
+def pairing_status(host_id: Optional[str], since_version: Optional[int] = None) -> dict:
+    """
+    Ritorna lo stato di pairing lato preboot per l'host richiesto.
+    Usato dal polling JS (/preboot/pairing/status).
+
+    Con `since_version` uguale alla versione corrente la risposta è
+    "not modified": solo trusted/status/version, senza lista host.
+    Il costo non dipende dal numero di host trusted; le liste ritornate
+    sono condivise tra le chiamate e vanno trattate come read-only.
+    """
+    _refresh()
+    is_trusted = bool(host_id and host_id in _TRUSTED_HOSTS)
+    status = {
         "trusted": is_trusted,
         "status": "approved" if is_trusted else "pending",
-        "selected_host": selected,
-        "trusted_hosts": list_trusted_hosts(),
     }
+    snapshot = _status_snapshot()
+    status["version"] = snapshot["version"]
+
+    if since_version is not None and since_version == snapshot["version"]:
+        status["modified"] = False
+        return status
+
+    status["modified"] = True
+    status["selected_host"] = snapshot["selected_host"]
+    status["trusted_hosts"] = snapshot["trusted_hosts"]
+    return status
+
+
+def pairing_status_json(host_id: Optional[str], since_version: Optional[int] = None) -> bytes:
+    """Come pairing_status(), già serializzato per la risposta HTTP."""
+    _refresh()
+    is_trusted = bool(host_id and host_id in _TRUSTED_HOSTS)
+    head = '{"trusted": %s, "status": "%s"' % (
+        "true" if is_trusted else "false",
+        "approved" if is_trusted else "pending",
+    )
+    snapshot = _status_snapshot()
+    version = snapshot["version"]
+
+    if since_version is not None and since_version == version:
+        return ('%s, "version": %d, "modified": false}' % (head, version)).encode()
+
+    return (
+        '%s, "version": %d, "modified": true, "selected_host": %s, "trusted_hosts": %s}'
+        % (
+            head,
+            version,
+            snapshot["selected_host_json"],
+            snapshot["trusted_hosts_json"],
+        )
+    ).encode()
 
 
 def select_host(host_id: str) -> bool:
     """
     Marca un host trusted come 'selected' (per SNOWBALL / runtime remote).
     """
+    _refresh()
     if host_id not in _TRUSTED_HOSTS:
         logger.warning(
             "[PAIRING] select_host ignored: host_id=%s not in trusted", host_id
@@ -306,7 +456,9 @@ def select_host(host_id: str) -> bool:
         return False
 
     global _SELECTED_HOST_ID
-    _SELECTED_HOST_ID = host_id
+    if _SELECTED_HOST_ID != host_id:
+        _SELECTED_HOST_ID = host_id
+        _bump_version()
     logger.info("[PAIRING] selected_host=%s", host_id)
     return True
 
@@ -315,4 +467,44 @@ def selected_host() -> Optional[dict]:
     if not _SELECTED_HOST_ID:
         return None
     host = _TRUSTED_HOSTS.get(_SELECTED_HOST_ID)
-    return asdict(host) if host else None
+    return host.to_record() if host else None
+
+
+# ---------------------------------------------------------------------------
+# Sync tra nodi
+# ---------------------------------------------------------------------------
+
+def trust_stores() -> Dict[str, JournalStore]:
+    """Store di trust di questo modulo, per nome, per store/sync.py."""
+    return {"trusted_hosts": _HOSTS, "trusted_clients": _CLIENTS}
+
+
+def _on_synced(name: str, keys: List[str]) -> None:
+    if name == "trusted_hosts":
+        _bump_version()
+    logger.info("[SECURITY] trust sync applied store=%s count=%d", name, len(keys))
+
+
+def serve_trust_sync(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    secret: Optional[bytes] = None,
+) -> TrustSyncServer:
+    """
+    Espone trusted_hosts / trusted_clients ai peer (vedi sync_trust).
+    Senza `secret` i peer possono solo leggere: nessun push accettato.
+    """
+    return TrustSyncServer(
+        trust_stores(), host=host, port=port, secret=secret, on_change=_on_synced
+    ).start()
+
+
+def sync_trust(address: tuple, secret: Optional[bytes] = None) -> SyncReport:
+    """
+    Riconcilia host e client trusted con il nodo a `address`: passano solo
+    le voci diverse, vince la modifica più recente (updated_at). Senza `secret`
+    nulla viene applicato: il report conta solo le differenze (pending).
+    """
+    report = sync_stores(address, trust_stores(), secret=secret, on_change=_on_synced)
+    logger.info("[SECURITY] trust sync with %s:%s %s", address[0], address[1], report.as_dict())
+    return report
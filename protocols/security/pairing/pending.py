@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Protocol, Tuple
+
+logger = logging.getLogger("ice.preboot")
+
+
+class _Pending(Protocol):
+    request_id: str
+    host_id: str
+    client_id: str
+    created_at: float
+    expires_at: float
+
+
+class PendingPairings:
+    """
+    Tabella delle richieste di pairing in attesa.
+
+    - ogni richiesta scade dopo `ttl` secondi (heap di scadenze, pulizia
+      lazy a ogni accesso: nessun thread, nessuna scansione completa)
+    - al massimo `max_pending` richieste: oltre il limite viene scartata
+      quella più vicina alla scadenza
+    - una nuova richiesta per la stessa coppia (host_id, client_id)
+      rinnova quella esistente invece di crearne un'altra
+    - le richieste approvate vengono ritirate; l'id resta in una lista
+      limitata di "ritirate" così una seconda approve è idempotente
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        max_pending: int = 1024,
+        max_retired: int = 1024,
+    ) -> None:
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self.max_retired = max_retired
+
+        self._requests: Dict[str, _Pending] = {}
+        self._by_pair: Dict[Tuple[str, str], str] = {}
+        self._expiry: List[Tuple[float, int, str]] = []
+        self._retired: "OrderedDict[str, float]" = OrderedDict()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+        self.expired = 0
+        self.evicted = 0
+
+    # ------------------------------------------------------------------
+    # Internals (con lock)
+    # ------------------------------------------------------------------
+
+    def _drop(self, request_id: str) -> Optional[_Pending]:
+        req = self._requests.pop(request_id, None)
+        if req is not None:
+            pair = (req.host_id, req.client_id)
+            if self._by_pair.get(pair) == request_id:
+                del self._by_pair[pair]
+        return req
+
+    def _expire(self, now: float) -> None:
+        heap = self._expiry
+        while heap and heap[0][0] <= now:
+            expires_at, _, request_id = heapq.heappop(heap)
+            req = self._requests.get(request_id)
+            # entry obsoleta: la richiesta è stata rinnovata o rimossa
+            if req is None or req.expires_at != expires_at:
+                continue
+            self._drop(request_id)
+            self.expired += 1
+
+    def _evict_one(self) -> None:
+        heap = self._expiry
+        while heap:
+            expires_at, _, request_id = heapq.heappop(heap)
+            req = self._requests.get(request_id)
+            if req is None or req.expires_at != expires_at:
+                continue
+            self._drop(request_id)
+            self.evicted += 1
+            # a debug: sotto scan / UI impazzita sarebbe un log per richiesta
+            logger.debug(
+                "[PAIRING] pending table full, evicted request_id=%s host_id=%s",
+                request_id,
+                req.host_id,
+            )
+            return
+
+    def _schedule(self, req: _Pending, ttl: float) -> None:
+        req.expires_at = time.time() + ttl
+        heapq.heappush(self._expiry, (req.expires_at, next(self._order), req.request_id))
+        if len(self._expiry) > 4 * max(self.max_pending, len(self._requests)):
+            # troppi rinnovi: ricostruisce l'heap senza le entry obsolete
+            self._expiry = [
+                entry
+                for entry in self._expiry
+                if (r := self._requests.get(entry[2])) is not None
+                and r.expires_at == entry[0]
+            ]
+            heapq.heapify(self._expiry)
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def add(self, req: _Pending, ttl: Optional[float] = None) -> Tuple[_Pending, bool]:
+        """
+        Inserisce `req` o rinnova la richiesta già pendente per la stessa
+        coppia (host_id, client_id). Ritorna (richiesta, creata).
+        """
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._expire(time.time())
+
+            existing_id = self._by_pair.get((req.host_id, req.client_id))
+            existing = self._requests.get(existing_id) if existing_id else None
+            if existing is not None:
+                for field in ("host_hostname", "host_ip", "host_fingerprint", "client_fingerprint"):
+                    value = getattr(req, field, None)
+                    if value:
+                        setattr(existing, field, value)
+                self._schedule(existing, ttl)
+                return existing, False
+
+            while len(self._requests) >= self.max_pending:
+                self._evict_one()
+
+            self._requests[req.request_id] = req
+            self._by_pair[(req.host_id, req.client_id)] = req.request_id
+            self._schedule(req, ttl)
+            return req, True
+
+    def get(self, request_id: str) -> Optional[_Pending]:
+        with self._lock:
+            self._expire(time.time())
+            return self._requests.get(request_id)
+
+    def retire(self, request_id: str) -> Optional[_Pending]:
+        """Rimuove una richiesta (es. approvata) ricordandone l'id."""
+        with self._lock:
+            req = self._drop(request_id)
+            if req is not None:
+                self._retired[request_id] = time.time()
+                while len(self._retired) > self.max_retired:
+                    self._retired.popitem(last=False)
+            return req
+
+    def find(self, host_id: str, client_id: str = "") -> Optional[_Pending]:
+        """Richiesta pendente per la coppia (host_id, client_id), se esiste."""
+        with self._lock:
+            self._expire(time.time())
+            request_id = self._by_pair.get((host_id, client_id))
+            return self._requests.get(request_id) if request_id else None
+
+    def discard(self, request_id: str) -> bool:
+        with self._lock:
+            return self._drop(request_id) is not None
+
+    def is_retired(self, request_id: str) -> bool:
+        with self._lock:
+            return request_id in self._retired
+
+    def values(self) -> List[_Pending]:
+        with self._lock:
+            self._expire(time.time())
+            return list(self._requests.values())
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(time.time())
+            return len(self._requests)
+
+    def __contains__(self, request_id: str) -> bool:
+        return self.get(request_id) is not None
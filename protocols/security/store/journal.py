@@ -0,0 +1,505 @@
+"""
+Store persistente append-only per i dati di trust (~/.ice_studio/*.json).
+
+Layout su disco:
+    <name>.json          snapshot (stesso formato dei vecchi file JSON)
+    <name>.json.journal  una riga JSON per modifica: {"k": key, "v": record}
+                         oppure {"k": key, "d": 1, "t": ts} per una rimozione
+
+Ogni modifica appende una riga (costo O(1), non O(dimensione store)).
+Lo snapshot viene riscritto solo in compattazione, via file temporaneo +
+os.replace: un crash a metà non lascia mai un file di trust troncato.
+Una riga finale incompleta nel journal (crash durante l'append) viene
+ignorata al caricamento.
+
+Le fsync sono in group commit: i thread che committano mentre è in corso
+una fsync vengono serviti tutti dalla successiva, con una sola fsync.
+
+Le rimozioni lasciano una tombstone (key -> istante della rimozione) in
+`store.tombstones`, usata dalla sync tra nodi (sync.py) perché un peer
+che ha ancora la voce non la faccia rientrare. Lo snapshot mantiene il
+suo formato: in compattazione le tombstone ancora valide (più giovani di
+`tombstone_ttl`) vengono riscritte nel journal nuovo, che prende il
+posto del vecchio con lo stesso tmp + rename dello snapshot.
+
+Indici secondari opzionali (es. fingerprint, ip, hostname) sono mantenuti
+a ogni put/delete e danno lookup O(1) senza scansioni. Un valore
+indicizzato con una sola chiave (il caso tipico per fingerprint) tiene
+la chiave stessa invece di un set.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Generic, Iterator, Optional, Tuple, TypeVar, Union
+
+logger = logging.getLogger("ice.security.store")
+
+V = TypeVar("V")
+
+Record = Dict[str, Any]
+SnapshotReader = Callable[[Any], Dict[str, Record]]
+SnapshotWriter = Callable[[Dict[str, Record]], Any]
+IndexKey = Callable[[Any], Optional[str]]
+IndexEntry = Union[str, set]
+
+
+# dopo questo tempo una rimozione non viene più propagata dalla sync
+TOMBSTONE_TTL = 30 * 86400.0
+
+
+def _identity(value):
+    return value
+
+
+def _fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _keys(entry: Optional[IndexEntry]) -> tuple:
+    if entry is None:
+        return ()
+    if isinstance(entry, str):
+        return (entry,)
+    return tuple(entry)
+
+
+def _deleted_at(entry: Dict[str, Any]) -> float:
+    """Istante di una riga di rimozione (0 per le righe scritte senza)."""
+    try:
+        return float(entry.get("t") or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def atomic_write(path: Path, data: str) -> None:
+    """Scrive `data` in `path` via tmp + fsync + rename."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path.parent)
+
+
+class JournalStore(Generic[V]):
+    """
+    Mappa key -> valore, persistita come snapshot + journal.
+
+    `to_record` / `from_record` convertono i valori in dict JSON e ritorno;
+    `read_snapshot` / `write_snapshot` adattano il formato dello snapshot
+    (es. lista di record per trusted_hosts.json).
+
+    `key_field`: campo del record che contiene la chiave; se manca (es.
+    snapshot {key: record}) viene aggiunto prima di from_record.
+    `frozen_values`: i valori non vengono mai modificati in place (record
+    immutabili), quindi gli indici si aggiornano rileggendo il valore
+    vecchio invece di ricordare i valori indicizzati per chiave.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        to_record: Callable[[V], Record] = _identity,
+        from_record: Callable[[Record], V] = _identity,
+        read_snapshot: SnapshotReader = _identity,
+        write_snapshot: SnapshotWriter = _identity,
+        compact_ratio: float = 2.0,
+        min_compact: int = 256,
+        durable: bool = True,
+        indexes: Optional[Dict[str, IndexKey]] = None,
+        key_field: Optional[str] = None,
+        frozen_values: bool = False,
+        tombstone_ttl: float = TOMBSTONE_TTL,
+    ) -> None:
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.name + ".journal")
+        self.to_record = to_record
+        self.from_record = from_record
+        self.read_snapshot = read_snapshot
+        self.write_snapshot = write_snapshot
+        self.compact_ratio = compact_ratio
+        self.min_compact = min_compact
+        self.durable = durable
+        self.key_field = key_field
+        self.frozen_values = frozen_values
+        self.tombstone_ttl = tombstone_ttl
+
+        self.data: Dict[str, V] = {}
+        # key -> istante della rimozione
+        self.tombstones: Dict[str, float] = {}
+        self.journal_records = 0
+
+        # name -> valore indicizzato -> chiave/chiavi; _indexed ricorda i
+        # valori indicizzati di ogni chiave, così l'indice resta corretto
+        # anche se il chiamante modifica l'oggetto in place prima del put()
+        # (non serve con frozen_values)
+        self._index_keys: Dict[str, IndexKey] = dict(indexes or {})
+        self._indexes: Dict[str, Dict[str, IndexEntry]] = {n: {} for n in self._index_keys}
+        self._indexed: Dict[str, Dict[str, str]] = {}
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._pending: list[str] = []
+        self._seq = 0
+        self._flushed = 0
+        self._fh = None
+
+        self.load()
+
+    # ------------------------------------------------------------------
+    # Load
+    # ------------------------------------------------------------------
+
+    def _decode(self, key: str, record: Record) -> Optional[V]:
+        if self.key_field and isinstance(record, dict):
+            if self.key_field not in record:
+                record = dict(record)
+                record[self.key_field] = key
+            elif record[self.key_field] != key:
+                logger.warning(
+                    "store %s: record %s carries %s=%r, skipped",
+                    self.path.name, key, self.key_field, record[self.key_field],
+                )
+                return None
+        try:
+            return self.from_record(record)
+        except (TypeError, ValueError, KeyError):
+            logger.warning("store %s: skipping invalid record %s", self.path.name, key)
+            return None
+
+    def load(self) -> None:
+        """(Ri)carica snapshot + journal dal disco."""
+        data: Dict[str, V] = {}
+        tombstones: Dict[str, float] = {}
+
+        if self.path.exists():
+            try:
+                records = self.read_snapshot(json.loads(self.path.read_text()))
+            except Exception as err:
+                logger.warning("store %s: unreadable snapshot: %s", self.path.name, err)
+                records = {}
+            for key, record in records.items():
+                value = self._decode(key, record)
+                if value is not None:
+                    data[key] = value
+
+        count = 0
+        if self.journal_path.exists():
+            with open(self.journal_path, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                        key = entry["k"]
+                    except (ValueError, KeyError, TypeError):
+                        # riga troncata da un crash: le successive non esistono
+                        continue
+                    count += 1
+                    if entry.get("d"):
+                        data.pop(key, None)
+                        tombstones[key] = _deleted_at(entry)
+                        continue
+                    value = self._decode(key, entry.get("v"))
+                    if value is not None:
+                        data[key] = value
+                        tombstones.pop(key, None)
+
+        with self._lock:
+            # in place: i moduli che espongono `store.data` restano allineati
+            self.data.clear()
+            self.data.update(data)
+            self.tombstones = tombstones
+            self.journal_records = count
+            self._reindex()
+
+    # ------------------------------------------------------------------
+    # Read
+    # ------------------------------------------------------------------
+
+    def refresh(self) -> bool:
+        """
+        Allinea la copia in memoria con le scritture di altri processi.
+        No-op qui (un solo processo per file); vedi shared.py.
+        """
+        return False
+
+    @contextmanager
+    def locked(self):
+        """Sezione di scrittura (lettura + put coerenti); vedi shared.py."""
+        yield self
+
+    def get(self, key: str) -> Optional[V]:
+        return self.data.get(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def lookup_keys(self, index: str, value: str) -> list[str]:
+        with self._lock:
+            return list(_keys(self._indexes[index].get(value)))
+
+    def lookup(self, index: str, value: str) -> list[V]:
+        """Valori con `index == value` (indice secondario, O(1))."""
+        with self._lock:
+            return [self.data[key] for key in _keys(self._indexes[index].get(value))]
+
+    def lookup_one(self, index: str, value: str) -> Optional[V]:
+        with self._lock:
+            keys = _keys(self._indexes[index].get(value))
+            return self.data[keys[0]] if keys else None
+
+    def items(self) -> Iterator[Tuple[str, V]]:
+        return iter(list(self.data.items()))
+
+    def values(self) -> Iterator[V]:
+        return iter(list(self.data.values()))
+
+    # ------------------------------------------------------------------
+    # Write
+    # ------------------------------------------------------------------
+
+    def put(self, key: str, value: V, sync: bool = True) -> None:
+        line = json.dumps({"k": key, "v": self.to_record(value)}, separators=(",", ":"))
+        with self._lock:
+            old = self.data.get(key)
+            self.data[key] = value
+            self.tombstones.pop(key, None)
+            self._index(key, value, old)
+            seq = self._append(line)
+        if sync:
+            self.commit(seq)
+
+    def delete(self, key: str, sync: bool = True, at: Optional[float] = None) -> bool:
+        """
+        Rimuove `key` lasciando una tombstone. Con `at` (rimozione ricevuta
+        da un peer) la tombstone viene registrata anche se la voce non c'è,
+        purché più recente di quella già nota.
+        """
+        with self._lock:
+            if key not in self.data:
+                if at is None or at <= self.tombstones.get(key, float("-inf")):
+                    return False
+            else:
+                self._unindex(key, self.data.pop(key))
+            deleted_at = time.time() if at is None else at
+            self.tombstones[key] = deleted_at
+            seq = self._append(
+                json.dumps({"k": key, "d": 1, "t": deleted_at}, separators=(",", ":"))
+            )
+        if sync:
+            self.commit(seq)
+        return True
+
+    def _live_tombstones(self, now: Optional[float] = None) -> Dict[str, float]:
+        """Con il lock: scarta le tombstone scadute e ritorna le altre."""
+        horizon = (time.time() if now is None else now) - self.tombstone_ttl
+        for key in [k for k, t in self.tombstones.items() if t < horizon]:
+            del self.tombstones[key]
+        return dict(self.tombstones)
+
+    @staticmethod
+    def _tombstone_lines(tombstones: Dict[str, float]) -> str:
+        return "".join(
+            json.dumps({"k": key, "d": 1, "t": t}, separators=(",", ":")) + "\n"
+            for key, t in tombstones.items()
+        )
+
+    def _needs_compaction(self) -> bool:
+        live = len(self.data) + len(self.tombstones)
+        return self.journal_records > max(self.min_compact, self.compact_ratio * live)
+
+    # ------------------------------------------------------------------
+    # Indici secondari
+    # ------------------------------------------------------------------
+
+    def _indexed_values(self, value: V) -> Dict[str, str]:
+        current = {}
+        for name, key_of in self._index_keys.items():
+            indexed = key_of(value)
+            if indexed:
+                current[name] = indexed
+        return current
+
+    def _unindex(self, key: str, old: Optional[V] = None) -> None:
+        if self.frozen_values:
+            indexed = self._indexed_values(old) if old is not None else {}
+        else:
+            indexed = self._indexed.pop(key, {})
+        for name, value in indexed.items():
+            index = self._indexes[name]
+            entry = index.get(value)
+            if entry is None:
+                continue
+            if isinstance(entry, str):
+                if entry == key:
+                    del index[value]
+                continue
+            entry.discard(key)
+            if len(entry) == 1:
+                index[value] = next(iter(entry))
+            elif not entry:
+                del index[value]
+
+    def _index(self, key: str, value: V, old: Optional[V] = None) -> None:
+        if not self._index_keys:
+            return
+        self._unindex(key, old)
+        current = self._indexed_values(value)
+        for name, indexed in current.items():
+            index = self._indexes[name]
+            entry = index.get(indexed)
+            if entry is None:
+                index[indexed] = key
+            elif isinstance(entry, str):
+                if entry != key:
+                    index[indexed] = {entry, key}
+            else:
+                entry.add(key)
+        if current and not self.frozen_values:
+            self._indexed[key] = current
+
+    def _reindex(self) -> None:
+        self._indexes = {name: {} for name in self._index_keys}
+        self._indexed = {}
+        for key, value in self.data.items():
+            self._index(key, value)
+
+    def _append(self, line: str) -> int:
+        self._pending.append(line + "\n")
+        self._seq += 1
+        return self._seq
+
+    def commit(self, seq: Optional[int] = None) -> None:
+        """
+        Rende durevoli le modifiche fino a `seq` (default: tutte).
+        Group commit: chi trova una fsync in corso aspetta e, se la sua
+        riga non era inclusa, la porta nella fsync successiva insieme a
+        tutte le altre accumulate nel frattempo.
+        """
+        if seq is None:
+            seq = self._seq
+        with self._flush_lock:
+            if self._flushed >= seq:
+                return
+            with self._lock:
+                lines, self._pending = self._pending, []
+                target = self._seq
+            if lines:
+                fh = self._journal()
+                fh.write("".join(lines))
+                fh.flush()
+                if self.durable:
+                    os.fsync(fh.fileno())
+            self._flushed = target
+            self.journal_records += len(lines)
+
+            if self._needs_compaction():
+                self._compact_locked()
+
+    def _journal(self):
+        if self._fh is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            torn = False
+            if self.journal_path.exists() and self.journal_path.stat().st_size:
+                with open(self.journal_path, "rb") as fh:
+                    fh.seek(-1, os.SEEK_END)
+                    torn = fh.read(1) != b"\n"
+            self._fh = open(self.journal_path, "a", encoding="utf-8")
+            if torn:
+                # append interrotto da un crash: chiude la riga troncata, così
+                # il record successivo non finisce sulla stessa riga
+                self._fh.write("\n")
+        return self._fh
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def compact(self) -> None:
+        """Riscrive lo snapshot completo e azzera il journal."""
+        self.commit()
+        with self._flush_lock:
+            self._compact_locked()
+
+    def _compact_locked(self) -> None:
+        with self._lock:
+            records = {key: self.to_record(value) for key, value in self.data.items()}
+            tombstones = self._live_tombstones()
+            self._pending = []
+            target = self._seq
+        atomic_write(
+            self.path,
+            json.dumps(self.write_snapshot(records), indent=2),
+        )
+        # Crash qui: il journal viene ri-applicato sopra il nuovo snapshot,
+        # le righe sono valori completi quindi il replay è idempotente.
+        # Il journal nuovo (le sole tombstone ancora valide) sostituisce il
+        # vecchio via rename, mai troncando: in ogni istante su disco c'è
+        # l'uno o l'altro, e le rimozioni non si perdono.
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        atomic_write(self.journal_path, self._tombstone_lines(tombstones))
+        self._fh = open(self.journal_path, "a", encoding="utf-8")
+        self.journal_records = len(tombstones)
+        # le righe ancora in coda fino a `target` sono già nello snapshot
+        self._flushed = max(self._flushed, target)
+
+    def close(self) -> None:
+        self.commit()
+        with self._flush_lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+# ---------------------------------------------------------------------------
+# Formati snapshot
+# ---------------------------------------------------------------------------
+
+def list_snapshot(key_field: str) -> Tuple[SnapshotReader, SnapshotWriter]:
+    """Snapshot come lista di record (formato di trusted_hosts.json)."""
+
+    def _read(data: Any) -> Dict[str, Record]:
+        return {
+            entry[key_field]: entry
+            for entry in data or []
+            if isinstance(entry, dict) and key_field in entry
+        }
+
+    def _write(records: Dict[str, Record]) -> Any:
+        return list(records.values())
+
+    return _read, _write
+
+
+def section_snapshot(section: str) -> Tuple[SnapshotReader, SnapshotWriter]:
+    """Snapshot come {section: {key: record}} (formato di snowball_state.json)."""
+
+    def _read(data: Any) -> Dict[str, Record]:
+        return dict((data or {}).get(section) or {})
+
+    def _write(records: Dict[str, Record]) -> Any:
+        return {section: records}
+
+    return _read, _write
@@ -0,0 +1,424 @@
+"""
+JournalStore condiviso tra processi (preboot, runtime, Snowball sugli
+stessi ~/.ice_studio/*.json).
+
+Accanto allo store:
+    <name>.json.lock   flock esclusivo dei writer (advisory)
+    <name>.json.gen    header mmap'd, protetto da un seqlock:
+                       seq | epoch | generation | journal_size
+
+- writer: prendono il flock, si allineano al journal, appendono le righe
+  (subito visibili agli altri processi) e pubblicano la nuova
+  generation/journal_size nell'header. La fsync resta al commit().
+- lettori: nessun lock di file. Ogni lettura confronta la generation
+  dell'header con la propria (una lettura di 32 byte dalla mmap); se è
+  cambiata applicano solo i byte di journal nuovi. Un lettore non
+  aspetta mai un writer: al massimo ripete la lettura dell'header se
+  la trova a metà aggiornamento.
+- compattazione: snapshot e journal vuoto vengono sostituiti via rename
+  ed epoch avanza; un lettore che vede cambiare epoch durante la lettura
+  ricarica da capo (il replay del journal sopra lo snapshot è idempotente).
+
+`store.data` resta il dict in memoria: chi lo legge direttamente deve
+chiamare refresh() prima (i metodi di lettura lo fanno da soli).
+Solo POSIX (fcntl.flock).
+"""
+from __future__ import annotations
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from .journal import JournalStore, V, _deleted_at, _fsync_dir, atomic_write, logger
+
+# seq (pari = stabile), epoch (compattazioni), generation (scritture),
+# journal_size (byte di journal pubblicati, sempre a fine riga)
+HEADER = struct.Struct("<QQQQ")
+
+
+def _complete_size(journal: Path) -> int:
+    try:
+        data = journal.read_bytes()
+    except OSError:
+        return 0
+    return data.rfind(b"\n") + 1
+
+
+class SharedJournalStore(JournalStore[V]):
+    """JournalStore sicuro tra processi: writer serializzati, lettori senza lock."""
+
+    def __init__(self, path: Path, **options) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock_path = path.with_name(path.name + ".lock")
+        self.header_path = path.with_name(path.name + ".gen")
+        self._lock_fd = os.open(str(self.lock_path), os.O_RDWR | os.O_CREAT, 0o600)
+        self._write_lock = threading.RLock()
+        self._depth = 0
+        self._epoch = -1
+        self._generation = -1
+        self._offset = 0
+        self._jfd: Optional[int] = None
+        self._unsynced = False
+        self._header = self._open_header(path.with_name(path.name + ".journal"))
+        super().__init__(path, **options)
+
+    # ------------------------------------------------------------------
+    # Header (seqlock)
+    # ------------------------------------------------------------------
+
+    def _open_header(self, journal: Path) -> mmap.mmap:
+        fd = os.open(str(self.header_path), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < HEADER.size:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+                try:
+                    if os.fstat(fd).st_size < HEADER.size:
+                        # store nato senza header: il journal esistente è
+                        # tutto pubblicato (meno un'eventuale riga troncata)
+                        os.ftruncate(fd, HEADER.size)
+                        header = mmap.mmap(fd, HEADER.size)
+                        HEADER.pack_into(header, 0, 0, 0, 1, _complete_size(journal))
+                        return header
+                finally:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            return mmap.mmap(fd, HEADER.size)
+        finally:
+            os.close(fd)
+
+    def _read_header(self) -> Tuple[int, int, int]:
+        header = self._header
+        spins = 0
+        while True:
+            seq, epoch, generation, size = HEADER.unpack_from(header, 0)
+            if not seq & 1 and HEADER.unpack_from(header, 0)[0] == seq:
+                return epoch, generation, size
+            # writer a metà aggiornamento: pochi istanti
+            spins += 1
+            if spins % 1000 == 0:
+                time.sleep(0)
+                if spins >= 10000:
+                    self._repair_header()
+
+    def _repair_header(self) -> None:
+        """seq dispari e nessun writer attivo: un writer è morto dentro _publish()."""
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+        try:
+            seq = HEADER.unpack_from(self._header, 0)[0]
+            if seq & 1:
+                logger.warning("store %s: repairing torn header", self.header_path.name)
+                struct.pack_into("<Q", self._header, 0, seq + 1)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _publish(self, epoch: int, generation: int, size: int) -> None:
+        """Solo con il flock: un writer alla volta."""
+        header = self._header
+        seq = HEADER.unpack_from(header, 0)[0]
+        struct.pack_into("<Q", header, 0, seq + 1)
+        struct.pack_into("<QQQ", header, 8, epoch, generation, size)
+        struct.pack_into("<Q", header, 0, seq + 2)
+        self._epoch, self._generation, self._offset = epoch, generation, size
+
+    # ------------------------------------------------------------------
+    # Read side
+    # ------------------------------------------------------------------
+
+    def load(self) -> None:
+        """Caricamento completo e coerente: ripete se nel frattempo c'è stata una compattazione."""
+        while True:
+            epoch, generation, size = self._read_header()
+            data: Dict[str, V] = {}
+            tombstones: Dict[str, float] = {}
+            if self.path.exists():
+                try:
+                    records = self.read_snapshot(json.loads(self.path.read_text()))
+                except Exception as err:
+                    logger.warning("store %s: unreadable snapshot: %s", self.path.name, err)
+                    records = {}
+                for key, record in records.items():
+                    value = self._decode(key, record)
+                    if value is not None:
+                        data[key] = value
+            chunk = self._read_journal(0, size)
+            if self._read_header()[0] != epoch:
+                continue
+            if chunk is None:
+                # journal più corto dell'header (crash tra il rename della
+                # compattazione e _publish, o file toccato da fuori): vale
+                # ciò che c'è, fino all'ultima riga completa. L'header viene
+                # ripubblicato dal prossimo writer (_catch_up).
+                logger.warning("store %s: journal shorter than published", self.path.name)
+                size = _complete_size(self.journal_path)
+                chunk = self._read_journal(0, size) or b""
+            count = 0
+            for line in chunk.splitlines():
+                entry = self._parse(line)
+                if entry is None:
+                    continue
+                count += 1
+                key = entry["k"]
+                if entry.get("d"):
+                    data.pop(key, None)
+                    tombstones[key] = _deleted_at(entry)
+                else:
+                    value = self._decode(key, entry.get("v"))
+                    if value is not None:
+                        data[key] = value
+                        tombstones.pop(key, None)
+            with self._lock:
+                self.data.clear()
+                self.data.update(data)
+                self.tombstones = tombstones
+                self.journal_records = count
+                self._reindex()
+                self._seq += 1
+                self._epoch, self._generation, self._offset = epoch, generation, size
+            return
+
+    def _read_journal(self, start: int, end: int) -> Optional[bytes]:
+        """Byte [start, end) del journal; None se il file è stato sostituito (più corto)."""
+        if end <= start:
+            return b""
+        try:
+            fd = os.open(str(self.journal_path), os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            data = os.pread(fd, end - start, start)
+        finally:
+            os.close(fd)
+        return data if len(data) == end - start else None
+
+    @staticmethod
+    def _parse(line: bytes) -> Optional[dict]:
+        try:
+            entry = json.loads(line)
+            entry["k"]
+        except (ValueError, KeyError, TypeError):
+            return None
+        return entry
+
+    def refresh(self) -> bool:
+        """Applica le scritture degli altri processi; True se qualcosa è cambiato."""
+        epoch, generation, size = self._read_header()
+        if generation == self._generation and epoch == self._epoch:
+            return False
+        with self._lock:
+            if generation == self._generation and epoch == self._epoch:
+                return False
+            if epoch != self._epoch or size < self._offset:
+                self.load()
+                return True
+            chunk = self._read_journal(self._offset, size)
+            if chunk is None or self._read_header()[0] != epoch:
+                self.load()
+                return True
+            for line in chunk.splitlines():
+                entry = self._parse(line)
+                if entry is None:
+                    continue
+                self.journal_records += 1
+                key = entry["k"]
+                if entry.get("d"):
+                    if key in self.data:
+                        self._unindex(key, self.data.pop(key))
+                    self.tombstones[key] = _deleted_at(entry)
+                    continue
+                value = self._decode(key, entry.get("v"))
+                if value is not None:
+                    old = self.data.get(key)
+                    self.data[key] = value
+                    self.tombstones.pop(key, None)
+                    self._index(key, value, old)
+            self._seq += 1
+            self._generation, self._offset = generation, size
+            return True
+
+    def get(self, key: str) -> Optional[V]:
+        self.refresh()
+        return super().get(key)
+
+    def __contains__(self, key: str) -> bool:
+        self.refresh()
+        return super().__contains__(key)
+
+    def __len__(self) -> int:
+        self.refresh()
+        return super().__len__()
+
+    def lookup_keys(self, index: str, value: str) -> list[str]:
+        self.refresh()
+        return super().lookup_keys(index, value)
+
+    def lookup(self, index: str, value: str) -> list[V]:
+        self.refresh()
+        return super().lookup(index, value)
+
+    def lookup_one(self, index: str, value: str) -> Optional[V]:
+        self.refresh()
+        return super().lookup_one(index, value)
+
+    def items(self) -> Iterator[Tuple[str, V]]:
+        self.refresh()
+        return super().items()
+
+    def values(self) -> Iterator[V]:
+        self.refresh()
+        return super().values()
+
+    # ------------------------------------------------------------------
+    # Write side
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def locked(self):
+        """
+        Sezione di scrittura: flock esclusivo (rientrante nel processo) e
+        copia in memoria allineata al disco. Più put() dentro un solo
+        locked() prendono il flock una volta.
+        """
+        with self._write_lock:
+            if self._depth == 0:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+                try:
+                    self._catch_up()
+                except BaseException:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+                    raise
+            self._depth += 1
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _catch_up(self) -> None:
+        self.refresh()
+        if self._jfd is not None:
+            try:
+                current = os.fstat(self._jfd).st_ino == os.stat(self.journal_path).st_ino
+            except FileNotFoundError:
+                current = False
+            if not current:
+                # journal sostituito da una compattazione di un altro processo
+                os.close(self._jfd)
+                self._jfd = None
+        if self._jfd is None:
+            self._jfd = os.open(
+                str(self.journal_path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600
+            )
+        size = os.fstat(self._jfd).st_size
+        published = self._read_header()[2]
+        if size < self._offset or published != self._offset:
+            self._repair_journal(size)
+        elif size > self._offset:
+            # righe scritte ma mai pubblicate (writer morto a metà): scartate
+            os.ftruncate(self._jfd, self._offset)
+
+    def _repair_journal(self, size: int) -> None:
+        """
+        Con il flock: il journal è più corto di quanto pubblicato. Mai
+        ftruncate verso l'alto (allungherebbe il file con byte NUL e il
+        record successivo non sarebbe più leggibile): si riparte dalla
+        parte completa del file, con un nuovo epoch così tutti ricaricano.
+        """
+        complete = _complete_size(self.journal_path)
+        if complete < size:
+            os.ftruncate(self._jfd, complete)
+        logger.warning(
+            "store %s: journal shorter than published, republishing at %d bytes",
+            self.path.name,
+            complete,
+        )
+        self._publish(self._epoch + 1, self._generation + 1, complete)
+        self.load()
+
+    def put(self, key: str, value: V, sync: bool = True) -> None:
+        with self.locked():
+            super().put(key, value, sync=False)
+        if sync:
+            self.commit()
+
+    def delete(self, key: str, sync: bool = True, at: Optional[float] = None) -> bool:
+        with self.locked():
+            deleted = super().delete(key, sync=False, at=at)
+        if deleted and sync:
+            self.commit()
+        return deleted
+
+    def _append(self, line: str) -> int:
+        # chiamata da put()/delete() con il flock e self._lock presi
+        data = (line + "\n").encode("utf-8")
+        written = 0
+        while written < len(data):
+            written += os.write(self._jfd, data[written:])
+        self._unsynced = True
+        self.journal_records += 1
+        self._seq += 1
+        self._publish(self._epoch, self._generation + 1, self._offset + len(data))
+        return self._seq
+
+    def commit(self, seq: Optional[int] = None) -> None:
+        """Le righe sono già nel journal (e visibili): qui solo la fsync."""
+        with self._flush_lock:
+            if self._unsynced and self._jfd is not None and self.durable:
+                os.fsync(self._jfd)
+            self._unsynced = False
+            self._flushed = self._seq
+        if self._needs_compaction():
+            self.compact()
+
+    def compact(self) -> None:
+        with self.locked():
+            with self._lock:
+                records = {key: self.to_record(value) for key, value in self.data.items()}
+                tombstones = self._live_tombstones()
+            atomic_write(self.path, json.dumps(self.write_snapshot(records), indent=2))
+            # journal nuovo via rename (con le sole tombstone ancora valide):
+            # chi sta leggendo il vecchio lo legge intero, poi vede epoch
+            # cambiato e ricarica
+            head = self._tombstone_lines(tombstones).encode("utf-8")
+            tmp = self.journal_path.with_name(f".{self.journal_path.name}.{os.getpid()}.tmp")
+            fd = os.open(str(tmp), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                written = 0
+                while written < len(head):
+                    written += os.write(fd, head[written:])
+                if self.durable:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp, self.journal_path)
+            _fsync_dir(self.path.parent)
+            # le prossime append dentro lo stesso locked() vanno nel journal nuovo
+            if self._jfd is not None:
+                os.close(self._jfd)
+            self._jfd = os.open(str(self.journal_path), os.O_WRONLY | os.O_APPEND)
+            with self._flush_lock:
+                self._unsynced = False
+            self.journal_records = len(tombstones)
+            self._publish(self._epoch + 1, self._generation + 1, len(head))
+
+    def close(self) -> None:
+        self.commit()
+        with self._write_lock:
+            if self._jfd is not None:
+                os.close(self._jfd)
+                self._jfd = None
+            if not self._header.closed:
+                self._header.close()
+            if self._lock_fd >= 0:
+                os.close(self._lock_fd)
+                self._lock_fd = -1
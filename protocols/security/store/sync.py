@@ -0,0 +1,532 @@
+"""
+Anti-entropy tra JournalStore di nodi diversi (trusted_hosts,
+trusted_clients, snowball_state).
+
+Ogni store viene riassunto in un albero di hash (fanout 16):
+
+    foglie    bucket = primi 4*depth bit di blake2b(key)
+    hash      XOR degli hash dei record sotto il nodo, dove
+              hash record = blake2b(key, JSON canonico del record)
+
+Il client confronta la radice, scende solo nei sottoalberi diversi e
+alla fine scambia (key, hash, versione) dei soli bucket diversi: per due
+store da 50k voci che differiscono per poche voci passano pochi KB.
+
+Conflitti: vince il record con `updated_at` maggiore (avanzato a ogni
+scrittura; i record che non lo hanno ancora usano paired_at); a parità
+vince l'hash maggiore, così entrambi i lati scelgono lo stesso record.
+Ogni lato ricontrolla la regola prima di applicare un record ricevuto.
+
+Le rimozioni viaggiano come tombstone (store.tombstones, record
+{"deleted": 1, "updated_at": istante}) e seguono la stessa regola: una
+revoca più recente dell'ultima modifica del peer lo rimuove anche lì,
+un nuovo pairing più recente della revoca fa rientrare la voce. Una voce
+presente da un solo lato (e senza tombstone dall'altro) viene copiata.
+
+Trasporto: TCP, messaggi JSON con prefisso di lunghezza (4 byte). Con
+`secret` i due lati si autenticano a vicenda (HMAC su due nonce) prima
+di qualsiasi scambio. Senza secret nessuno dei due lati scrive: il
+server rifiuta i put (chiunque raggiunga la porta, anche un processo
+locale, potrebbe altrimenti iniettare host trusted) e il client calcola
+solo il diff (SyncResult.pending) senza applicare nulla, perché un peer
+non autenticato potrebbe altrimenti far entrare host o revocarne.
+
+Ogni record ricevuto deve avere il campo chiave (host_id, client_id)
+uguale alla chiave con cui viaggia: un record per "a" non può scrivere
+la voce "b".
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .journal import JournalStore, Record
+
+logger = logging.getLogger("ice.security.store")
+
+FANOUT_BITS = 4
+MAX_DEPTH = 5
+MAX_MESSAGE = 64 * 1024 * 1024
+_LENGTH = struct.Struct(">I")
+
+ChangeCallback = Callable[[str, List[str]], None]
+
+
+class SyncError(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Digest
+# ---------------------------------------------------------------------------
+
+def _canonical(record: Record) -> bytes:
+    return json.dumps(record, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def _record_hash(key: str, record: Record) -> int:
+    digest = hashlib.blake2b(key.encode("utf-8") + b"\0", digest_size=8)
+    digest.update(_canonical(record))
+    return int.from_bytes(digest.digest(), "big")
+
+
+def _bucket(key: str, depth: int) -> int:
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> (64 - FANOUT_BITS * depth)
+
+
+def _tombstone(deleted_at: float) -> Record:
+    return {"deleted": 1, "updated_at": deleted_at}
+
+
+def _local_record(store: JournalStore, key: str) -> Optional[Record]:
+    """Record locale di `key`: valore, tombstone o None."""
+    value = store.get(key)
+    if value is not None:
+        return store.to_record(value)
+    deleted_at = store.tombstones.get(key)
+    return _tombstone(deleted_at) if deleted_at is not None else None
+
+
+def _version(record: Record) -> float:
+    try:
+        return float(record.get("updated_at") or record.get("paired_at") or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def depth_for(count: int) -> int:
+    """Profondità con ~8-16 voci per bucket foglia."""
+    depth, leaves = 1, 16
+    while depth < MAX_DEPTH and count > leaves * 16:
+        depth += 1
+        leaves *= 16
+    return depth
+
+
+class Digest:
+    """Albero di hash di uno store, a una profondità fissata dal client."""
+
+    def __init__(self, store: JournalStore, depth: int) -> None:
+        self.depth = depth
+        self.seq = store._seq
+        self.records: Dict[str, Record] = {}
+        self.hashes: Dict[str, int] = {}
+        self.leaves: Dict[int, List[str]] = {}
+        self.levels: List[Dict[int, int]] = [{} for _ in range(depth + 1)]
+
+        leaf = self.levels[depth]
+        entries = [(key, store.to_record(value)) for key, value in store.items()]
+        entries += [(key, _tombstone(t)) for key, t in list(store.tombstones.items())]
+        for key, record in entries:
+            h = _record_hash(key, record)
+            bucket = _bucket(key, depth)
+            self.records[key] = record
+            self.hashes[key] = h
+            self.leaves.setdefault(bucket, []).append(key)
+            leaf[bucket] = leaf.get(bucket, 0) ^ h
+        for level in range(depth - 1, -1, -1):
+            parent = self.levels[level]
+            for index, h in self.levels[level + 1].items():
+                parent[index >> FANOUT_BITS] = parent.get(index >> FANOUT_BITS, 0) ^ h
+
+    @property
+    def root(self) -> int:
+        return self.levels[0].get(0, 0)
+
+    def children(self, level: int, index: int) -> List[int]:
+        below = self.levels[level + 1]
+        base = index << FANOUT_BITS
+        return [below.get(base + i, 0) for i in range(1 << FANOUT_BITS)]
+
+    def bucket(self, index: int) -> Dict[str, Tuple[int, float]]:
+        return {
+            key: (self.hashes[key], _version(self.records[key]))
+            for key in self.leaves.get(index, ())
+        }
+
+
+_DIGESTS: "weakref.WeakKeyDictionary[JournalStore, Digest]" = weakref.WeakKeyDictionary()
+
+
+def digest_of(store: JournalStore, depth: int) -> Digest:
+    """
+    Digest in cache finché lo store non cambia (ogni put/delete avanza
+    il suo seq): costruirlo costa O(n) to_record + hash, sessioni
+    ripetute contro uno store fermo non lo ripagano.
+    """
+    store.refresh()
+    digest = _DIGESTS.get(store)
+    if digest is None or digest.depth != depth or digest.seq != store._seq:
+        digest = _DIGESTS[store] = Digest(store, depth)
+    return digest
+
+
+def _wins(new: Tuple[float, int], old: Optional[Tuple[float, int]]) -> bool:
+    """(updated_at, hash) nuovo contro quello locale."""
+    return old is None or new > old
+
+
+# ---------------------------------------------------------------------------
+# Framing
+# ---------------------------------------------------------------------------
+
+class _Channel:
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.sent = 0
+        self.received = 0
+
+    def send(self, message: dict) -> None:
+        data = json.dumps(message, separators=(",", ":")).encode("utf-8")
+        self.sock.sendall(_LENGTH.pack(len(data)) + data)
+        self.sent += _LENGTH.size + len(data)
+
+    def _read(self, size: int) -> bytes:
+        chunks = []
+        while size:
+            chunk = self.sock.recv(min(size, 1 << 20))
+            if not chunk:
+                raise SyncError("connection closed")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def recv(self) -> dict:
+        (size,) = _LENGTH.unpack(self._read(_LENGTH.size))
+        if size > MAX_MESSAGE:
+            raise SyncError(f"message too large ({size} bytes)")
+        message = json.loads(self._read(size))
+        self.received += _LENGTH.size + size
+        if "error" in message:
+            raise SyncError(message["error"])
+        return message
+
+    def call(self, message: dict) -> dict:
+        self.send(message)
+        return self.recv()
+
+
+def _proof(secret: bytes, side: bytes, client_nonce: str, server_nonce: str) -> str:
+    payload = side + bytes.fromhex(client_nonce) + bytes.fromhex(server_nonce)
+    return hmac.new(secret, payload, hashlib.sha256).hexdigest()
+
+
+def _apply(
+    store: JournalStore,
+    records: Dict[str, Record],
+    name: str,
+    on_change: Optional[ChangeCallback],
+) -> List[str]:
+    """
+    Applica i record che vincono sul valore locale; un solo commit.
+    Confronto e scrittura nella stessa sezione locked(): un altro writer
+    dello store (anche di un altro processo) non si infila in mezzo.
+    Va chiamata solo con record di un peer autenticato.
+    """
+    applied = []
+    with store.locked():
+        for key, record in records.items():
+            if not isinstance(key, str) or not isinstance(record, dict):
+                raise SyncError(f"malformed record for {key!r}")
+            if store.key_field and record.get(store.key_field, key) != key:
+                logger.warning(
+                    "trust sync: %s record %r carries %s=%r, ignored",
+                    name, key, store.key_field, record.get(store.key_field),
+                )
+                continue
+            local = _local_record(store, key)
+            old = None
+            if local is not None:
+                old = (_version(local), _record_hash(key, local))
+            if not _wins((_version(record), _record_hash(key, record)), old):
+                continue
+            if record.get("deleted"):
+                if store.delete(key, sync=False, at=_version(record)):
+                    applied.append(key)
+                continue
+            value = store._decode(key, record)
+            if value is None:
+                continue
+            store.put(key, value, sync=False)
+            applied.append(key)
+    if applied:
+        store.commit()
+        if on_change:
+            on_change(name, applied)
+    return applied
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class TrustSyncServer:
+    """
+    Espone uno o più store per la sync: {nome: JournalStore}.
+
+    on_change(nome, chiavi) viene chiamato dopo ogni push applicato
+    (es. per invalidare cache o bumpare versioni). Senza `secret` i push
+    sono rifiutati: i peer possono solo leggere.
+    """
+
+    def __init__(
+        self,
+        stores: Dict[str, JournalStore],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        secret: Optional[bytes] = None,
+        on_change: Optional[ChangeCallback] = None,
+        timeout: float = 30.0,
+    ) -> None:
+        self.stores = stores
+        self.secret = secret
+        self.on_change = on_change
+        self.timeout = timeout
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self.address = self._sock.getsockname()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "TrustSyncServer":
+        self._sock.listen(8)
+        self._sock.settimeout(0.5)
+        self._thread = threading.Thread(target=self._accept, name="trust-sync", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self._sock.close()
+
+    def _accept(self) -> None:
+        while not self._stop.is_set():
+            try:
+                conn, addr = self._sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(
+                target=self._session, args=(conn, addr), name="trust-sync-session", daemon=True
+            ).start()
+
+    def _session(self, conn: socket.socket, addr) -> None:
+        conn.settimeout(self.timeout)
+        channel = _Channel(conn)
+        digests: Dict[str, Digest] = {}
+        try:
+            hello = channel.recv()
+            if hello.get("op") != "hello":
+                raise SyncError("expected hello")
+            if self.secret is not None:
+                nonce = os.urandom(16).hex()
+                client_nonce = str(hello.get("nonce") or "")
+                channel.send(
+                    {"nonce": nonce, "proof": _proof(self.secret, b"s", client_nonce, nonce)}
+                )
+                auth = channel.recv()
+                expected = _proof(self.secret, b"c", client_nonce, nonce)
+                if not hmac.compare_digest(str(auth.get("proof") or ""), expected):
+                    channel.send({"error": "authentication failed"})
+                    logger.warning("trust sync: authentication failed from %s", addr[0])
+                    return
+            channel.send({"stores": {name: len(store) for name, store in self.stores.items()}})
+
+            while True:
+                message = channel.recv()
+                op = message.get("op")
+                if op == "bye":
+                    return
+                name = message.get("store")
+                store = self.stores.get(name)
+                if store is None:
+                    channel.send({"error": f"unknown store {name!r}"})
+                    return
+                if op == "open":
+                    depth = max(1, min(MAX_DEPTH, int(message.get("depth") or 1)))
+                    digest = digests[name] = digest_of(store, depth)
+                    channel.send({"root": digest.root, "count": len(digest.records)})
+                elif op == "nodes":
+                    digest = digests[name]
+                    level = int(message["level"])
+                    if not 0 <= level < digest.depth:
+                        raise SyncError(f"invalid level {level}")
+                    channel.send(
+                        {"children": [digest.children(level, i) for i in message["nodes"]]}
+                    )
+                elif op == "leaves":
+                    digest = digests[name]
+                    channel.send({"buckets": [digest.bucket(i) for i in message["buckets"]]})
+                elif op == "get":
+                    digest = digests[name]
+                    channel.send(
+                        {"records": {k: digest.records[k] for k in message["keys"] if k in digest.records}}
+                    )
+                elif op == "put":
+                    if self.secret is None:
+                        channel.send({"error": "push requires authentication"})
+                        logger.warning("trust sync: unauthenticated push refused from %s", addr[0])
+                        return
+                    applied = _apply(store, message["records"], name, self.on_change)
+                    channel.send({"applied": len(applied)})
+                else:
+                    channel.send({"error": f"unknown op {op!r}"})
+                    return
+        except (SyncError, OSError, ValueError, KeyError, IndexError, TypeError) as err:
+            logger.warning("trust sync session %s failed: %s", addr[0], err)
+        finally:
+            conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+@dataclass
+class SyncResult:
+    store: str
+    local: int = 0
+    remote: int = 0
+    pulled: int = 0
+    pushed: int = 0
+    conflicts: int = 0
+    round_trips: int = 0
+    # voci in cui il peer vince ma non applicate (sync senza secret)
+    pending: int = 0
+
+
+@dataclass
+class SyncReport:
+    results: List[SyncResult]
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+    def as_dict(self) -> Dict:
+        return {
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "stores": {r.store: {k: v for k, v in vars(r).items() if k != "store"} for r in self.results},
+        }
+
+
+def _reconcile(
+    channel: _Channel,
+    name: str,
+    store: JournalStore,
+    remote_count: int,
+    on_change: Optional[ChangeCallback],
+    authenticated: bool = True,
+) -> SyncResult:
+    result = SyncResult(store=name, local=len(store), remote=remote_count)
+
+    # stessa profondità sui due lati, tarata sullo store più grande
+    depth = depth_for(max(len(store), remote_count))
+    opened = channel.call({"op": "open", "store": name, "depth": depth})
+    result.round_trips += 1
+    result.remote = int(opened.get("count") or 0)
+    local = digest_of(store, depth)
+    if opened["root"] == local.root:
+        return result
+
+    # discesa nei soli sottoalberi diversi
+    nodes = [0]
+    for level in range(local.depth):
+        reply = channel.call({"op": "nodes", "store": name, "level": level, "nodes": nodes})
+        result.round_trips += 1
+        diverging = []
+        for index, remote_children in zip(nodes, reply["children"]):
+            mine = local.children(level, index)
+            base = index << FANOUT_BITS
+            diverging += [base + i for i, h in enumerate(remote_children) if h != mine[i]]
+        nodes = diverging
+        if not nodes:
+            return result
+
+    reply = channel.call({"op": "leaves", "store": name, "buckets": nodes})
+    result.round_trips += 1
+    pull: List[str] = []
+    push: Dict[str, Record] = {}
+    for index, remote_bucket in zip(nodes, reply["buckets"]):
+        mine = local.bucket(index)
+        for key, (h, version) in remote_bucket.items():
+            if key not in mine:
+                pull.append(key)
+                continue
+            local_h, local_version = mine[key]
+            if local_h == h:
+                continue
+            result.conflicts += 1
+            if _wins((version, h), (local_version, local_h)):
+                pull.append(key)
+            else:
+                push[key] = local.records[key]
+        for key in mine.keys() - remote_bucket.keys():
+            push[key] = local.records[key]
+
+    if not authenticated:
+        # diff in sola lettura: nessun record di un peer non autenticato
+        # entra nello store, né come valore né come tombstone
+        result.pending = len(pull)
+        return result
+    if pull:
+        reply = channel.call({"op": "get", "store": name, "keys": pull})
+        result.round_trips += 1
+        result.pulled = len(_apply(store, reply["records"], name, on_change))
+    if push:
+        reply = channel.call({"op": "put", "store": name, "records": push})
+        result.round_trips += 1
+        result.pushed = int(reply.get("applied") or 0)
+    return result
+
+
+def sync_stores(
+    address: Tuple[str, int],
+    stores: Dict[str, JournalStore],
+    secret: Optional[bytes] = None,
+    on_change: Optional[ChangeCallback] = None,
+    timeout: float = 30.0,
+) -> SyncReport:
+    """
+    Riconcilia in due direzioni gli store locali con quelli omonimi del
+    server a `address`. Gli store che il server non espone sono saltati.
+    Senza `secret` solo diff: nulla viene applicato né inviato, i record
+    in cui il server vince sono contati in SyncResult.pending.
+    """
+    with socket.create_connection(address, timeout=timeout) as sock:
+        channel = _Channel(sock)
+        nonce = os.urandom(16).hex()
+        hello = channel.call({"op": "hello", "nonce": nonce})
+        if secret is None and "proof" in hello:
+            raise SyncError("server requires authentication")
+        if secret is not None:
+            server_nonce = str(hello.get("nonce") or "")
+            expected = _proof(secret, b"s", nonce, server_nonce)
+            if not hmac.compare_digest(str(hello.get("proof") or ""), expected):
+                raise SyncError("server authentication failed")
+            hello = channel.call({"op": "auth", "proof": _proof(secret, b"c", nonce, server_nonce)})
+        remote = hello.get("stores") or {}
+
+        results = [
+            _reconcile(
+                channel, name, store, int(remote[name]), on_change, authenticated=secret is not None
+            )
+            for name, store in stores.items()
+            if name in remote
+        ]
+        channel.send({"op": "bye"})
+        return SyncReport(results, bytes_sent=channel.sent, bytes_received=channel.received)
@@ -0,0 +1,258 @@
+"""
+Modello di trust unico, condiviso da preboot (security/pairing) e
+Snowball (snowball/state.py).
+
+I record sono dataclass con __slots__: i trusted host/client sono
+immutabili (un aggiornamento crea un nuovo record con replace()) e
+portano `updated_at`, avanzato a ogni scrittura (paired_at resta la data
+del pairing): è la versione usata dalla sync per risolvere i conflitti. Le
+richieste di pairing restano mutabili per la tabella pendenti. Le
+stringhe ripetute tra molti record (hostname, ip, fingerprint condivisi,
+id usati anche come chiavi) sono internate: una copia per valore invece
+di una per record.
+
+TrustStore è il JournalStore degli host trusted con gli indici
+fingerprint / ip / hostname; client_store() quello dei client.
+SharedTrustStore / client_store(shared=True) sono le varianti condivise
+tra processi (shared.py) usate per ~/.ice_studio.
+"""
+from __future__ import annotations
+
+import sys
+import time
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from .journal import JournalStore, Record, SnapshotReader, SnapshotWriter, list_snapshot
+from .shared import SharedJournalStore
+
+
+def _intern(value: Optional[str]) -> str:
+    return sys.intern(value) if value else ""
+
+
+@dataclass(frozen=True, slots=True)
+class TrustedHost:
+    host_id: str
+    hostname: str
+    ip: str
+    fingerprint: str
+    paired_at: float
+    updated_at: float = 0.0
+
+    def __post_init__(self) -> None:
+        for name in ("host_id", "hostname", "ip", "fingerprint"):
+            object.__setattr__(self, name, _intern(getattr(self, name)))
+        if not self.updated_at:
+            object.__setattr__(self, "updated_at", self.paired_at)
+
+    def to_record(self) -> Record:
+        return {
+            "host_id": self.host_id,
+            "hostname": self.hostname,
+            "ip": self.ip,
+            "fingerprint": self.fingerprint,
+            "paired_at": self.paired_at,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_record(cls, record: Record) -> "TrustedHost":
+        return cls(
+            record["host_id"],
+            record.get("hostname") or "",
+            record.get("ip") or "",
+            record.get("fingerprint") or "",
+            float(record.get("paired_at") or 0.0),
+            float(record.get("updated_at") or 0.0),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class TrustedClient:
+    client_id: str
+    fingerprint: str
+    paired_at: float
+    updated_at: float = 0.0
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "client_id", _intern(self.client_id))
+        object.__setattr__(self, "fingerprint", _intern(self.fingerprint))
+        if not self.updated_at:
+            object.__setattr__(self, "updated_at", self.paired_at)
+
+    def to_record(self) -> Record:
+        return {
+            "client_id": self.client_id,
+            "fingerprint": self.fingerprint,
+            "paired_at": self.paired_at,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_record(cls, record: Record) -> "TrustedClient":
+        return cls(
+            record["client_id"],
+            record.get("fingerprint") or "",
+            float(record.get("paired_at") or 0.0),
+            float(record.get("updated_at") or 0.0),
+        )
+
+
+@dataclass(slots=True)
+class PairingRequest:
+    """
+    Richiesta di pairing, sia preboot (host remoto + client locale) sia
+    Snowball (nodo che chiede di usare questo host: solo i campi host_*).
+    """
+
+    request_id: str
+
+    # host info (remote flake / nodo Snowball)
+    host_id: str
+    host_hostname: str
+    host_ip: str
+
+    # client info (questa macchina preboot)
+    client_id: str = ""
+    client_fingerprint: str = ""
+
+    created_at: float = field(default_factory=time.time)
+    approved: bool = False
+    expires_at: float = 0.0
+    host_fingerprint: str = ""
+
+    def __post_init__(self) -> None:
+        self.host_id = _intern(self.host_id)
+        self.host_hostname = _intern(self.host_hostname)
+        self.host_ip = _intern(self.host_ip)
+        self.client_id = _intern(self.client_id)
+        self.client_fingerprint = _intern(self.client_fingerprint)
+        self.host_fingerprint = _intern(self.host_fingerprint)
+
+    def to_record(self) -> Record:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+# ---------------------------------------------------------------------------
+# Store
+# ---------------------------------------------------------------------------
+
+def section_hosts_snapshot(section: str) -> Tuple[SnapshotReader, SnapshotWriter]:
+    """
+    Snapshot {section: {host_id: record senza host_id}} (formato di
+    snowball_state.json); host_id viene reintegrato da key_field.
+    """
+
+    def _read(data: Any) -> Dict[str, Record]:
+        return dict((data or {}).get(section) or {})
+
+    def _write(records: Dict[str, Record]) -> Any:
+        return {
+            section: {
+                key: {k: v for k, v in record.items() if k != "host_id"}
+                for key, record in records.items()
+            }
+        }
+
+    return _read, _write
+
+
+class TrustStore(JournalStore[TrustedHost]):
+    """Host trusted per host_id, con indici fingerprint / ip / hostname."""
+
+    def __init__(
+        self,
+        path: Path,
+        snapshot: Optional[Tuple[SnapshotReader, SnapshotWriter]] = None,
+        **options,
+    ) -> None:
+        read, write = snapshot or list_snapshot("host_id")
+        super().__init__(
+            path,
+            to_record=TrustedHost.to_record,
+            from_record=TrustedHost.from_record,
+            read_snapshot=read,
+            write_snapshot=write,
+            indexes={
+                "fingerprint": lambda host: host.fingerprint,
+                "ip": lambda host: host.ip,
+                "hostname": lambda host: host.hostname,
+            },
+            key_field="host_id",
+            frozen_values=True,
+            **options,
+        )
+
+    def trust(
+        self,
+        host_id: str,
+        hostname: str = "",
+        ip: str = "",
+        fingerprint: str = "",
+        paired_at: Optional[float] = None,
+        sync: bool = True,
+    ) -> TrustedHost:
+        """
+        Aggiunge o aggiorna un host. Sui record esistenti i campi vuoti
+        non sovrascrivono quelli noti; paired_at resta quello originale
+        salvo che venga passato esplicitamente, updated_at avanza sempre.
+        """
+        with self.locked():
+            return self._trust(host_id, hostname, ip, fingerprint, paired_at, sync)
+
+    def _trust(
+        self,
+        host_id: str,
+        hostname: str,
+        ip: str,
+        fingerprint: str,
+        paired_at: Optional[float],
+        sync: bool,
+    ) -> TrustedHost:
+        now = time.time()
+        existing = self.data.get(host_id)
+        if existing is not None:
+            host = replace(
+                existing,
+                hostname=hostname or existing.hostname,
+                ip=ip or existing.ip,
+                fingerprint=fingerprint or existing.fingerprint,
+                paired_at=paired_at or existing.paired_at or now,
+                # mai indietro: anche con il clock che salta resta più
+                # recente della versione che sostituisce
+                updated_at=max(now, existing.updated_at + 1e-6),
+            )
+        else:
+            host = TrustedHost(
+                host_id=host_id,
+                hostname=hostname or host_id,
+                ip=ip,
+                fingerprint=fingerprint,
+                paired_at=paired_at or now,
+                updated_at=now,
+            )
+        self.put(host.host_id, host, sync=sync)
+        return host
+
+    def by_fingerprint(self, fingerprint: str) -> Optional[TrustedHost]:
+        return self.lookup_one("fingerprint", fingerprint) if fingerprint else None
+
+
+class SharedTrustStore(SharedJournalStore[TrustedHost], TrustStore):
+    """TrustStore condiviso tra processi: trust() legge e scrive sotto flock."""
+
+
+def client_store(path: Path, shared: bool = False) -> JournalStore[TrustedClient]:
+    read, write = list_snapshot("client_id")
+    return (SharedJournalStore if shared else JournalStore)(
+        path,
+        to_record=TrustedClient.to_record,
+        from_record=TrustedClient.from_record,
+        read_snapshot=read,
+        write_snapshot=write,
+        indexes={"fingerprint": lambda client: client.fingerprint},
+        key_field="client_id",
+        frozen_values=True,
+    )
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from .tokens import SecurityToken, generate_token
+from .wheel import TimingWheel
+
+
+def _digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+class TokenRegistry:
+    """
+    Registro dei token emessi: validazione per stringa, revoca, indice
+    per scope.
+
+    - lookup O(1) per digest SHA-256 del token: la tabella non confronta
+      mai il segreto presentato carattere per carattere
+    - scadenza tramite TimingWheel: nessuna scansione dei token attivi,
+      la ruota avanza in modo lazy a ogni operazione
+    """
+
+    def __init__(self, default_ttl: int = 300, tick: float = 1.0) -> None:
+        self.default_ttl = default_ttl
+        self._tokens: Dict[bytes, SecurityToken] = {}
+        self._by_scope: Dict[str, Set[bytes]] = {}
+        self._wheel = TimingWheel(tick=tick, now=time.time())
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Internals (con lock)
+    # ------------------------------------------------------------------
+
+    def _drop(self, key: bytes) -> Optional[SecurityToken]:
+        token = self._tokens.pop(key, None)
+        if token is None:
+            return None
+        keys = self._by_scope.get(token.scope)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_scope[token.scope]
+        self._wheel.cancel(key)
+        return token
+
+    def _expire(self, now: float) -> int:
+        expired = self._wheel.advance(now)
+        for key in expired:
+            token = self._tokens.get(key)
+            if token is not None:
+                # la ruota ha già tolto la chiave, _drop toglie il resto
+                self._drop(key)
+        return len(expired)
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def issue(self, scope: str, ttl_seconds: Optional[int] = None) -> SecurityToken:
+        token = generate_token(
+            scope, self.default_ttl if ttl_seconds is None else ttl_seconds
+        )
+        self.register(token)
+        return token
+
+    def register(self, token: SecurityToken) -> None:
+        """Aggiunge un token già generato (es. da generate_token())."""
+        key = _digest(token.token)
+        with self._lock:
+            self._expire(time.time())
+            self._drop(key)
+            self._tokens[key] = token
+            self._by_scope.setdefault(token.scope, set()).add(key)
+            self._wheel.schedule(key, token.expires_at)
+
+    def validate(self, token: str, scope: Optional[str] = None) -> Optional[SecurityToken]:
+        """Il SecurityToken se `token` è attivo (e dello scope richiesto)."""
+        key = _digest(token)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            found = self._tokens.get(key)
+        if found is None or now >= found.expires_at:
+            return None
+        if not hmac.compare_digest(found.token, token):
+            return None
+        if scope is not None and found.scope != scope:
+            return None
+        return found
+
+    def is_valid(self, token: str, scope: Optional[str] = None) -> bool:
+        return self.validate(token, scope) is not None
+
+    def revoke(self, token: str) -> bool:
+        with self._lock:
+            return self._drop(_digest(token)) is not None
+
+    def revoke_scope(self, scope: str) -> int:
+        with self._lock:
+            keys = list(self._by_scope.get(scope, ()))
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def tokens_for_scope(self, scope: str) -> List[SecurityToken]:
+        with self._lock:
+            self._expire(time.time())
+            return [self._tokens[key] for key in self._by_scope.get(scope, ())]
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Forza l'avanzamento della ruota; ritorna i token scaduti."""
+        with self._lock:
+            return self._expire(time.time() if now is None else now)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(time.time())
+            return len(self._tokens)
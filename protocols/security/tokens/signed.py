@@ -0,0 +1,272 @@
+"""
+Token firmati, verificabili offline da qualsiasi nodo trusted.
+
+Formato:  ice1.<key_id>.<payload>.<firma>
+  payload = base64url(JSON compatto {"s": scope, "e": expires_at,
+                                     "j": token id, "i": issuer})
+  firma   = base64url(HMAC-SHA256(secret[key_id], "ice1.<key_id>.<payload>"))
+
+A differenza dei token opachi di generate_token(), scope e scadenza sono
+dentro il token: chi condivide il keyring verifica localmente, senza
+chiedere all'emittente. La rotazione aggiunge una nuova chiave attiva e
+mantiene le precedenti per la verifica finché i loro token non scadono;
+una RevocationList piccola copre le revoche anticipate.
+
+I token già verificati restano in una piccola cache del keyring: un token
+di sessione presentato più volte paga firma e decodifica una volta sola.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .tokens import SecurityToken
+
+TOKEN_PREFIX = "ice1"
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _unb64(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+@dataclass(frozen=True)
+class SigningKey:
+    key_id: str
+    secret: bytes = field(repr=False)
+    created_at: float = 0.0
+
+    @classmethod
+    def generate(cls, key_id: Optional[str] = None) -> "SigningKey":
+        return cls(
+            key_id=key_id or secrets.token_hex(4),
+            secret=secrets.token_bytes(32),
+            created_at=time.time(),
+        )
+
+
+class Keyring:
+    """
+    Chiavi HMAC condivise tra i nodi trusted.
+    Firma sempre con la chiave attiva, verifica con tutte quelle presenti.
+    """
+
+    def __init__(
+        self,
+        keys: Optional[List[SigningKey]] = None,
+        keep: int = 3,
+        cache_size: int = 4096,
+    ) -> None:
+        self.keep = keep
+        self.cache_size = cache_size
+        self._keys: Dict[str, SigningKey] = {}
+        self._macs: Dict[str, "hmac.HMAC"] = {}
+        self._order: List[str] = []
+        self._lock = threading.Lock()
+        # token -> (scope, expires_at, token_id, issuer) già verificati
+        self._verified: "OrderedDict[str, Tuple[str, float, str, str]]" = OrderedDict()
+        for key in keys or []:
+            self.add(key)
+
+    @property
+    def active(self) -> SigningKey:
+        if not self._order:
+            raise LookupError("keyring is empty")
+        return self._keys[self._order[-1]]
+
+    def get(self, key_id: str) -> Optional[SigningKey]:
+        return self._keys.get(key_id)
+
+    def add(self, key: SigningKey) -> None:
+        """Aggiunge `key` come chiave attiva (le più vecchie oltre `keep` escono)."""
+        with self._lock:
+            self._add(key)
+
+    def _add(self, key: SigningKey) -> None:
+        if key.key_id in self._keys:
+            self._order.remove(key.key_id)
+        self._keys[key.key_id] = key
+        self._macs[key.key_id] = hmac.new(key.secret, digestmod=hashlib.sha256)
+        self._order.append(key.key_id)
+        while len(self._order) > self.keep:
+            old = self._order.pop(0)
+            del self._keys[old]
+            del self._macs[old]
+        # una chiave sostituita o uscita invalida i token verificati con lei
+        self._verified.clear()
+
+    def sign(self, key_id: str, signing_input: bytes) -> Optional[bytes]:
+        mac = self._macs.get(key_id)
+        if mac is None:
+            return None
+        mac = mac.copy()
+        mac.update(signing_input)
+        return mac.digest()
+
+    def remember(self, token: str, claims: Tuple[str, float, str, str]) -> None:
+        with self._lock:
+            self._verified[token] = claims
+            if len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+
+    def rotate(self, key: Optional[SigningKey] = None) -> SigningKey:
+        key = key or SigningKey.generate()
+        self.add(key)
+        return key
+
+    def key_ids(self) -> List[str]:
+        return list(self._order)
+
+
+class RevocationList:
+    """
+    Revoche anticipate di token firmati, per token id.
+    Una revoca serve solo finché il token non scade da solo: poi viene
+    potata, così la lista resta piccola. La potatura avviene da sola in
+    revoke()/merge(), al più una volta ogni `prune_interval` secondi.
+    """
+
+    def __init__(self, prune_interval: float = 60.0) -> None:
+        self.prune_interval = prune_interval
+        self._revoked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._next_prune = time.time() + prune_interval
+
+    def _prune(self, now: float) -> int:
+        """Con il lock."""
+        stale = [tid for tid, exp in self._revoked.items() if exp <= now]
+        for tid in stale:
+            del self._revoked[tid]
+        self._next_prune = now + self.prune_interval
+        return len(stale)
+
+    def _maybe_prune(self) -> None:
+        now = time.time()
+        if now >= self._next_prune:
+            self._prune(now)
+
+    def revoke(self, token_id: str, expires_at: float) -> None:
+        with self._lock:
+            self._maybe_prune()
+            self._revoked[token_id] = expires_at
+
+    def is_revoked(self, token_id: str) -> bool:
+        return token_id in self._revoked
+
+    def prune(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._prune(now)
+
+    def export(self) -> Dict[str, float]:
+        """Snapshot da distribuire agli altri nodi."""
+        with self._lock:
+            return dict(self._revoked)
+
+    def merge(self, entries: Dict[str, float]) -> None:
+        with self._lock:
+            self._maybe_prune()
+            self._revoked.update(entries)
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+
+@dataclass
+class SignedToken(SecurityToken):
+    token_id: str = ""
+    issuer: str = ""
+    key_id: str = ""
+
+
+def issue_signed_token(
+    keyring: Keyring,
+    scope: str,
+    ttl_seconds: int = 300,
+    issuer: str = "",
+) -> SignedToken:
+    key = keyring.active
+    expires_at = time.time() + ttl_seconds
+    token_id = secrets.token_urlsafe(12)
+    claims = {"s": scope, "e": expires_at, "j": token_id, "i": issuer}
+    payload = _b64(json.dumps(claims, separators=(",", ":")).encode())
+    signing_input = f"{TOKEN_PREFIX}.{key.key_id}.{payload}"
+    signature = keyring.sign(key.key_id, signing_input.encode("ascii"))
+    token = f"{signing_input}.{_b64(signature)}"
+    return SignedToken(
+        token=token,
+        scope=scope,
+        expires_at=expires_at,
+        token_id=token_id,
+        issuer=issuer,
+        key_id=key.key_id,
+    )
+
+
+def verify_signed_token(
+    keyring: Keyring,
+    token: str,
+    scope: Optional[str] = None,
+    revocations: Optional[RevocationList] = None,
+    now: Optional[float] = None,
+) -> Optional[SignedToken]:
+    """
+    Verifica locale: firma, scadenza, scope e revoca.
+    Ritorna il token decodificato, None se non è valido.
+    """
+    try:
+        prefix, key_id, payload, signature = token.split(".")
+    except ValueError:
+        return None
+    if prefix != TOKEN_PREFIX:
+        return None
+
+    cached = keyring._verified.get(token)
+    if cached is not None:
+        token_scope, expires_at, token_id, issuer = cached
+    else:
+        expected = keyring.sign(key_id, token[: -len(signature) - 1].encode())
+        if expected is None:
+            return None
+        if not hmac.compare_digest(_b64(expected).encode(), signature.encode()):
+            return None
+        try:
+            claims = json.loads(_unb64(payload))
+            expires_at = float(claims["e"])
+            token_scope = claims["s"]
+            token_id = claims["j"]
+            issuer = claims.get("i", "")
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+        keyring.remember(token, (token_scope, expires_at, token_id, issuer))
+
+    if (time.time() if now is None else now) >= expires_at:
+        return None
+    if scope is not None and token_scope != scope:
+        return None
+    if revocations is not None and revocations.is_revoked(token_id):
+        return None
+
+    return SignedToken(
+        token=token,
+        scope=token_scope,
+        expires_at=expires_at,
+        token_id=token_id,
+        issuer=issuer,
+        key_id=key_id,
+    )
+
+
+def revoke_signed_token(revocations: RevocationList, token: SignedToken) -> None:
+    revocations.revoke(token.token_id, token.expires_at)
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import math
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+
+class TimingWheel:
+    """
+    Timing wheel gerarchica per scadenze.
+
+    Il livello 0 ha `slots` slot da `tick` secondi; ogni livello superiore
+    copre `slots` volte il precedente. Con i default (1s, 64 slot,
+    4 livelli) l'orizzonte è ~194 giorni; scadenze oltre vengono
+    parcheggiate nell'ultimo livello e ri-schedulate quando arrivano.
+
+    schedule/cancel sono O(1); advance() salta direttamente al prossimo
+    tick in cui uno slot occupato viene raggiunto, quindi costa
+    O(slot occupati attraversati * livelli * slots + scaduti) e non
+    dipende dal tempo trascorso: dopo giorni di inattività il recupero
+    non tiene il lock del chiamante per ogni tick vuoto. Le entry ricadono
+    di livello solo quando il loro slot viene raggiunto.
+    """
+
+    def __init__(
+        self,
+        tick: float = 1.0,
+        slots: int = 64,
+        levels: int = 4,
+        now: float = 0.0,
+    ) -> None:
+        if slots & (slots - 1):
+            raise ValueError("slots must be a power of two")
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._wheels: List[List[Set[Hashable]]] = [
+            [set() for _ in range(slots)] for _ in range(levels)
+        ]
+        # key -> (livello, slot, tick di scadenza)
+        self._where: Dict[Hashable, Tuple[int, int, int]] = {}
+        self._now = self._to_tick(now)
+
+    def _to_tick(self, t: float) -> int:
+        return math.floor(t / self.tick)
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def _place(self, key: Hashable, due: int) -> None:
+        delta = max(1, due - self._now)
+        level = 0
+        while level < self.levels - 1 and delta >= 1 << (self._bits * (level + 1)):
+            level += 1
+        if delta >= 1 << (self._bits * self.levels):
+            # oltre l'orizzonte: ultimo slot raggiungibile, poi si ri-schedula
+            slot = (self._now >> (self._bits * level)) & self._mask
+        else:
+            slot = (max(due, self._now + 1) >> (self._bits * level)) & self._mask
+        self._wheels[level][slot].add(key)
+        self._where[key] = (level, slot, due)
+
+    def schedule(self, key: Hashable, deadline: float) -> None:
+        """(Ri)programma `key` per il tempo assoluto `deadline`."""
+        self.cancel(key)
+        self._place(key, math.ceil(deadline / self.tick))
+
+    def cancel(self, key: Hashable) -> bool:
+        where = self._where.pop(key, None)
+        if where is None:
+            return False
+        level, slot, _ = where
+        self._wheels[level][slot].discard(key)
+        return True
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        where = self._where.get(key)
+        return where[2] * self.tick if where else None
+
+    def _next_tick(self, limit: int) -> int:
+        """
+        Primo tick in (now, limit] in cui advance() trova uno slot
+        occupato; `limit` se non ce ne sono. Il livello L viene visitato
+        ai multipli di slots**L, sullo slot (tick >> bits*L) & mask.
+        """
+        best = limit
+        for level in range(self.levels):
+            shift = self._bits * level
+            base = self._now >> shift
+            wheel = self._wheels[level]
+            for step in range(1, self.slots + 1):
+                tick = (base + step) << shift
+                if tick >= best:
+                    break
+                if wheel[(base + step) & self._mask]:
+                    best = tick
+                    break
+        return best
+
+    def advance(self, now: float) -> List[Hashable]:
+        """Porta la ruota a `now` e ritorna le chiavi scadute."""
+        target = self._to_tick(now)
+        expired: List[Hashable] = []
+        if target <= self._now:
+            return expired
+        if not self._where:
+            self._now = target
+            return expired
+
+        bits, mask = self._bits, self._mask
+        while self._now < target:
+            # i tick in mezzo visiterebbero solo slot vuoti
+            self._now = self._next_tick(target)
+            tick = self._now
+
+            # cascade: quando uno slot del livello inferiore fa il giro,
+            # lo slot corrente del livello superiore viene redistribuito
+            level = 1
+            while level < self.levels and (tick >> (bits * (level - 1))) & mask == 0:
+                slot = (tick >> (bits * level)) & mask
+                bucket = self._wheels[level][slot]
+                if bucket:
+                    self._wheels[level][slot] = set()
+                    for key in bucket:
+                        _, _, due = self._where.pop(key)
+                        if due <= tick:
+                            expired.append(key)
+                        else:
+                            self._place(key, due)
+                level += 1
+
+            bucket = self._wheels[0][tick & mask]
+            if bucket:
+                self._wheels[0][tick & mask] = set()
+                for key in bucket:
+                    _, _, due = self._where.pop(key)
+                    if due <= tick:
+                        expired.append(key)
+                    else:
+                        self._place(key, due)
+
+            if not self._where:
+                self._now = target
+                break
+
+        return expired
@@ -1,7 +1,13 @@
+import time
+import uuid
+
 from .state import SnowballState
 from .pairing import PairingService
+from .security import compute_fingerprint
 from .resources import ResourceController
-from .models import ResourceRequest
+from .sandbox import SandboxHandle, SandboxManager
+from .models import REJECTED, PairingRequest, ResourceRequest
+from ..transport.udp.registry import DiscoveryRegistry
 
 
 class SnowballAgent:
@@ -9,6 +15,60 @@ class SnowballAgent:
         self.state = SnowballState()
         self.pairing = PairingService(self.state)
         self.resources = ResourceController()
+        # le sandbox reclamano le grant e le rilasciano all'uscita
+        self.sandbox = SandboxManager(controller=self.resources)
+        self.discovery = DiscoveryRegistry()
+
+    def discover_hosts(self) -> list[dict]:
+        # Lettura dalla registry live: il primo accesso avvia il refresh
+        # in background e ne attende il primo giro (come la scan sincrona),
+        # le chiamate successive non toccano la rete.
+        self.discovery.start()
+        self.discovery.wait_ready()
+        return self.discovery.nodes()
+
+    def approve_pairings(self, request_ids: list[str]) -> dict[str, dict]:
+        return self.state.approve_pairings(request_ids)
+
+    def trust_hosts(self, batch: list[dict]) -> list[dict]:
+        """
+        Enrollment diretto di un batch di nodi nello stato Snowball
+        (già approvati fuori banda): un solo commit, un risultato per nodo.
+        """
+        results: list[dict] = []
+        pairings: list[PairingRequest] = []
+        for item in batch:
+            node_id = item.get("node_id") or item.get("host_id")
+            hostname = item.get("hostname") or ""
+            if not node_id:
+                results.append({"node_id": None, "ok": False, "error": "missing node_id"})
+                continue
+            if not hostname:
+                # il fingerprint di ammissione dipende dall'hostname reale:
+                # calcolato su "" il nodo sarebbe trusted ma mai ammesso
+                results.append({"node_id": node_id, "ok": False, "error": "missing hostname"})
+                continue
+            # l'ammissione (PairingService) confronta compute_fingerprint():
+            # un fingerprint diverso renderebbe il nodo trusted ma mai ammesso
+            fingerprint = compute_fingerprint(node_id, hostname)
+            if item.get("fingerprint") and item["fingerprint"] != fingerprint:
+                results.append({"node_id": node_id, "ok": False, "error": "fingerprint mismatch"})
+                continue
+            pairings.append(
+                PairingRequest(
+                    request_id=str(uuid.uuid4()),
+                    host_id=node_id,
+                    host_hostname=hostname,
+                    host_ip=item.get("ip") or "",
+                    host_fingerprint=fingerprint,
+                    created_at=time.time(),
+                    approved=True,
+                )
+            )
+            results.append({"node_id": node_id, "ok": True})
+        if pairings:
+            self.state.trust_hosts(pairings)
+        return results
 
     def accept_connection(
         self,
@@ -21,10 +81,26 @@ class SnowballAgent:
             raise PermissionError("Pairing rejected by host")
 
         capabilities = self.resources.verify_local_capabilities()
-        grant = self.resources.grant(resource_request)
+        # una grant per nodo: una riconnessione riusa o sostituisce quella
+        # non ancora usata; se il nodo non lancia nulla il lease scade
+        grant = self.resources.grant(resource_request, owner=node_id)
 
+        # "queued": la grant diventa utilizzabile solo dopo
+        # resources.wait(grant); "rejected": host pieno, nessuna grant
         return {
             "trusted": True,
             "capabilities": capabilities,
-            "resource_grant": grant,
+            "grant_status": grant.status,
+            "resource_grant": grant if grant.status != REJECTED else None,
         }
+
+    def launch(self, node_id: str, command: list[str], wait: float | None = None) -> SandboxHandle:
+        """Lancia `command` con la grant ottenuta da `node_id` in accept_connection."""
+        grant = self.resources.owned_by(node_id)
+        if grant is None:
+            raise PermissionError(f"No resource grant for {node_id}")
+        return self.sandbox.launch(command, grant, wait=wait)
+
+    def disconnect(self, node_id: str) -> bool:
+        """Restituisce la grant non usata di un nodo che si disconnette."""
+        return self.resources.release_owner(node_id)
@@ -24,6 +24,9 @@ class SnowballAPI:
     def discover(self) -> list[dict]:
         return self.agent.discover_hosts()
 
+    def locate(self, node_id: str) -> str | None:
+        return self.agent.discovery.locate(node_id)
+
     def request_pairing(self, payload: Dict[str, Any]) -> dict:
         req = SnowballRequest(**payload)
         result = self.agent.create_pairing(req)
@@ -32,6 +35,13 @@ class SnowballAPI:
     def approve_pairing(self, request_id: str) -> bool:
         return self.agent.approve_pairing(request_id)
 
+    def approve_pairings(self, request_ids: list[str]) -> dict[str, dict]:
+        """Approvazione bulk: un commit per tutto il batch, esito per id."""
+        return self.agent.approve_pairings(request_ids)
+
+    def trust_hosts(self, batch: list[dict]) -> list[dict]:
+        return self.agent.trust_hosts(batch)
+
     def status(self) -> dict:
         return {
             "state": self.agent.state.name,
@@ -0,0 +1,146 @@
+from __future__ import annotations
+# src/ice_studio/snowball/capabilities.py
+
+import glob
+import os
+import platform
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .cgroups import CGROUP_ROOT
+
+CPU_SYSFS = "/sys/devices/system/cpu"
+MEMINFO = "/proc/meminfo"
+GPU_NODES = ("/dev/nvidia[0-9]*", "/dev/dri/renderD*", "/dev/kfd")
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as fh:
+            return fh.read()
+    except OSError:
+        return None
+
+
+def _mtime(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def _cpu_topology() -> Dict[str, int]:
+    packages = set()
+    cores = set()
+    for topology in glob.glob(f"{CPU_SYSFS}/cpu[0-9]*/topology"):
+        package = (_read(f"{topology}/physical_package_id") or "").strip()
+        core = (_read(f"{topology}/core_id") or "").strip()
+        if package:
+            packages.add(package)
+            cores.add((package, core))
+    logical = os.cpu_count() or 1
+    try:
+        usable = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        usable = logical
+    return {
+        "cpu_count": logical,
+        "cpu_usable": usable,
+        "cpu_sockets": len(packages) or 1,
+        "cpu_cores": len(cores) or logical,
+    }
+
+
+def _memory() -> Dict[str, int]:
+    fields = {}
+    for line in (_read(MEMINFO) or "").splitlines():
+        key, _, value = line.partition(":")
+        if key in ("MemTotal", "MemAvailable"):
+            fields[key] = int(value.split()[0]) // 1024
+    return {
+        "ram_total_mb": fields.get("MemTotal", 0),
+        "ram_available_mb": fields.get("MemAvailable", 0),
+    }
+
+
+def _cgroups() -> Dict[str, object]:
+    controllers = (_read(str(CGROUP_ROOT / "cgroup.controllers")) or "").split()
+    return {
+        "cgroup_v2": bool(controllers) or (CGROUP_ROOT / "cgroup.controllers").exists(),
+        "cgroup_controllers": controllers,
+        "cgroup_writable": os.access(str(CGROUP_ROOT), os.W_OK) and bool(controllers),
+    }
+
+
+def _gpus() -> List[str]:
+    devices: List[str] = []
+    for pattern in GPU_NODES:
+        devices += sorted(glob.glob(pattern))
+    return devices
+
+
+class CapabilityProber:
+    """
+    Capability reali dell'host, in cache.
+
+    La cache vale `ttl` secondi; ogni `check_interval` un controllo
+    economico (mtime di /dev e /dev/dri, CPU online, controller cgroup)
+    la invalida prima se c'è stato hotplug o un cambio dei cgroup.
+    Tra un controllo e l'altro capabilities() è una lettura di dict.
+    """
+
+    def __init__(self, ttl: float = 30.0, check_interval: float = 2.0) -> None:
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._cached: Optional[Dict] = None
+        self._stamp: Optional[Tuple] = None
+        self._probed_at = 0.0
+        self._checked_at = 0.0
+
+    def _fingerprint(self) -> Tuple:
+        return (
+            _mtime("/dev"),
+            _mtime("/dev/dri"),
+            _read(f"{CPU_SYSFS}/online"),
+            _read(str(CGROUP_ROOT / "cgroup.controllers")),
+            _read(str(CGROUP_ROOT / "cgroup.subtree_control")),
+        )
+
+    def probe(self) -> Dict:
+        system = platform.system().lower()
+        gpus = _gpus() if system == "linux" else []
+        caps: Dict = {"os": system}
+        caps.update(_cpu_topology())
+        caps.update(_memory() if system == "linux" else {})
+        caps.update(_cgroups() if system == "linux" else {"cgroup_v2": False})
+        caps["gpu_devices"] = gpus
+        caps["supports_gpu"] = bool(gpus)
+        caps["supports_cgroups"] = bool(caps.get("cgroup_v2"))
+        return caps
+
+    def capabilities(self) -> Dict:
+        now = time.monotonic()
+        cached = self._cached
+        if cached is not None and now - self._checked_at < self.check_interval:
+            return cached
+        with self._lock:
+            now = time.monotonic()
+            if self._cached is not None and now - self._checked_at < self.check_interval:
+                return self._cached
+            stamp = self._fingerprint()
+            if (
+                self._cached is None
+                or stamp != self._stamp
+                or now - self._probed_at >= self.ttl
+            ):
+                self._cached = self.probe()
+                self._stamp = stamp
+                self._probed_at = now
+            self._checked_at = now
+            return self._cached
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._cached = None
@@ -0,0 +1,242 @@
+from __future__ import annotations
+# src/ice_studio/snowball/cgroups.py
+
+import logging
+import os
+import signal
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("ice.snowball.sandbox")
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+CPU_PERIOD_US = 100_000
+CONTROLLERS = ("cpu", "memory", "pids")
+
+# sposta la shell nel cgroup e poi exec del comando: il pid resta lo stesso
+# e il processo parte già dentro i limiti (niente preexec_fn, fork-safe)
+ATTACH = 'echo $$ > "$0/cgroup.procs" && exec "$@"'
+
+
+@dataclass
+class CgroupUsage:
+    cpu_usage_usec: int = 0
+    cpu_throttled_usec: int = 0
+    cpu_nr_throttled: int = 0
+    memory_current: int = 0
+    memory_max: Optional[int] = None
+    pids_current: int = 0
+    # PSI: % di tempo in stallo negli ultimi 10s ("some" / "full")
+    cpu_pressure: float = 0.0
+    memory_pressure: float = 0.0
+    memory_pressure_full: float = 0.0
+
+
+def _read(path: Path) -> Optional[str]:
+    try:
+        return path.read_text()
+    except OSError:
+        return None
+
+
+def _read_int(path: Path) -> Optional[int]:
+    text = _read(path)
+    if text is None:
+        return None
+    text = text.strip()
+    return None if text == "max" else int(text)
+
+
+def _flat_keyed(text: Optional[str]) -> Dict[str, int]:
+    out = {}
+    for line in (text or "").splitlines():
+        key, _, value = line.partition(" ")
+        if value.isdigit():
+            out[key] = int(value)
+    return out
+
+
+def _pressure(text: Optional[str]) -> Dict[str, float]:
+    """avg10 di ogni riga PSI ("some avg10=0.12 avg60=... total=...")."""
+    out = {}
+    for line in (text or "").splitlines():
+        kind, *fields = line.split()
+        for field in fields:
+            if field.startswith("avg10="):
+                out[kind] = float(field[6:])
+    return out
+
+
+def read_usage(cgroup: Path) -> CgroupUsage:
+    """Campionamento economico: poche read() su cgroupfs, nessun processo."""
+    cpu = _flat_keyed(_read(cgroup / "cpu.stat"))
+    cpu_psi = _pressure(_read(cgroup / "cpu.pressure"))
+    mem_psi = _pressure(_read(cgroup / "memory.pressure"))
+    return CgroupUsage(
+        cpu_usage_usec=cpu.get("usage_usec", 0),
+        cpu_throttled_usec=cpu.get("throttled_usec", 0),
+        cpu_nr_throttled=cpu.get("nr_throttled", 0),
+        memory_current=_read_int(cgroup / "memory.current") or 0,
+        memory_max=_read_int(cgroup / "memory.max"),
+        pids_current=_read_int(cgroup / "pids.current") or 0,
+        cpu_pressure=cpu_psi.get("some", 0.0),
+        memory_pressure=mem_psi.get("some", 0.0),
+        memory_pressure_full=mem_psi.get("full", 0.0),
+    )
+
+
+class CgroupManager:
+    """
+    Gruppi cgroup v2 per le sandbox, sotto <root>/<parent>.
+
+    Serve un cgroupfs v2 scrivibile (root, o un sottoalbero delegato da
+    systemd: CgroupManager(root=<cgroup delegato>)). available() lo
+    verifica una volta; se è False SandboxManager resta su nice/systemd-run.
+    """
+
+    def __init__(
+        self,
+        root: Path = CGROUP_ROOT,
+        parent: str = "ice-snowball",
+        pids_max: Optional[int] = 512,
+    ) -> None:
+        self.root = Path(root)
+        self.base = self.root / parent
+        self.pids_max = pids_max
+        self._available: Optional[bool] = None
+
+    def _enable_controllers(self, cgroup: Path) -> None:
+        control = cgroup / "cgroup.subtree_control"
+        wanted = " ".join(f"+{name}" for name in CONTROLLERS)
+        try:
+            control.write_text(wanted)
+        except OSError:
+            # uno per uno: un controller mancante non blocca gli altri
+            for name in CONTROLLERS:
+                try:
+                    control.write_text(f"+{name}")
+                except OSError:
+                    pass
+
+    def available(self) -> bool:
+        if self._available is None:
+            self._available = self._probe()
+        return self._available
+
+    def _probe(self) -> bool:
+        if not (self.root / "cgroup.controllers").exists():
+            return False
+        try:
+            self.base.mkdir(exist_ok=True)
+        except OSError as err:
+            logger.info("cgroup v2 not writable (%s), using nice/systemd-run", err)
+            return False
+        self._enable_controllers(self.root)
+        self._enable_controllers(self.base)
+        enabled = (_read(self.base / "cgroup.subtree_control") or "").split()
+        if "cpu" not in enabled and "memory" not in enabled:
+            logger.info("cgroup v2 controllers not delegated, using nice/systemd-run")
+            return False
+        return True
+
+    def create(
+        self,
+        cpu_percent: int,
+        ram_mb: int,
+        pids_max: Optional[int] = None,
+        name: Optional[str] = None,
+    ) -> Path:
+        """
+        Crea un gruppo con:
+        - cpu.max    = cpu_percent% di una CPU per periodo (100 = 1 core)
+        - memory.max = ram_mb (0 = nessun limite)
+        - pids.max   = pids_max (default del manager)
+        """
+        cgroup = self.base / (name or f"sb-{uuid.uuid4().hex[:12]}")
+        cgroup.mkdir()
+        limits = {
+            "cpu.max": (
+                f"{max(1000, CPU_PERIOD_US * cpu_percent // 100)} {CPU_PERIOD_US}"
+                if cpu_percent > 0 else f"max {CPU_PERIOD_US}"
+            ),
+            "memory.max": str(ram_mb * 1024 * 1024) if ram_mb else "max",
+            "pids.max": str(pids_max or self.pids_max or "max"),
+        }
+        for filename, value in limits.items():
+            try:
+                (cgroup / filename).write_text(value)
+            except OSError as err:
+                logger.warning("cgroup %s: cannot set %s=%s: %s", cgroup.name, filename, value, err)
+        return cgroup
+
+    def wrap(self, cgroup: Path, command: List[str]) -> List[str]:
+        return ["/bin/sh", "-c", ATTACH, str(cgroup)] + list(command)
+
+    def attach(self, cgroup: Path, pid: int) -> None:
+        (cgroup / "cgroup.procs").write_text(str(pid))
+
+    def remove(self, cgroup: Path, timeout: float = 2.0) -> bool:
+        """
+        Rimuove il gruppo; uccide prima i processi rimasti (cgroup.kill, o
+        SIGKILL pid per pid sui kernel < 5.14 che non lo hanno) e attende,
+        al massimo `timeout` secondi, che escano davvero (cgroup.events
+        "populated 0"): prima rmdir fallisce con EBUSY.
+        """
+        procs = _read(cgroup / "cgroup.procs")
+        if procs and procs.strip():
+            deadline = time.monotonic() + timeout
+            try:
+                (cgroup / "cgroup.kill").write_text("1")
+            except OSError:
+                if not self._kill_procs(cgroup, deadline):
+                    logger.warning("cgroup %s: processes survived SIGKILL for %.1fs", cgroup.name, timeout)
+                    return False
+            if not self._wait_empty(cgroup, max(0.0, deadline - time.monotonic())):
+                logger.warning("cgroup %s still populated after %.1fs", cgroup.name, timeout)
+                return False
+        try:
+            os.rmdir(cgroup)
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def _kill_procs(cgroup: Path, deadline: float) -> bool:
+        """
+        Ripiego senza cgroup.kill: SIGKILL a ogni pid di cgroup.procs,
+        ripetuto finché la lista non è vuota (un fork in corsa può
+        aggiungere pid tra una lettura e l'altra).
+        """
+        delay = 0.001
+        while True:
+            pids = [int(pid) for pid in (_read(cgroup / "cgroup.procs") or "").split()]
+            if not pids:
+                return True
+            for pid in pids:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                except OSError as err:
+                    logger.warning("cgroup %s: cannot kill %d: %s", cgroup.name, pid, err)
+                    return False
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    @staticmethod
+    def _wait_empty(cgroup: Path, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while True:
+            events = _flat_keyed(_read(cgroup / "cgroup.events"))
+            if events.get("populated", 0) == 0:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
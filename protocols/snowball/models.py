@@ -1,7 +1,9 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from typing import Optional
-import time
+
+# unico PairingRequest, condiviso con il preboot (security/store/trust.py)
+from ..security.store.trust import PairingRequest  # noqa: F401
 
 
 @dataclass(frozen=True)
@@ -11,20 +13,26 @@ class ResourceRequest:
     gpu_layers: Optional[int] = None
 
 
+GRANTED = "granted"
+PARTIAL = "partial"
+QUEUED = "queued"
+REJECTED = "rejected"
+RELEASED = "released"
+
+
 @dataclass
 class ResourceGrant:
     cpu_percent: int
     ram_mb: int
     gpu_layers: Optional[int]
     granted_at: float
+    grant_id: str = ""
+    status: str = GRANTED
+    # nodo/sessione che l'ha chiesta: una sola grant in attesa di uso per owner
+    owner: Optional[str] = None
+    # scadenza del lease (time.time()); None = in uso da una sandbox
+    expires_at: Optional[float] = None
 
-
-@dataclass
-class PairingRequest:
-    request_id: str
-    node_id: str
-    hostname: str
-    ip: str
-    fingerprint: str
-    created_at: float
-    approved: bool = False
+    @property
+    def active(self) -> bool:
+        return self.status in (GRANTED, PARTIAL)
@@ -13,22 +13,34 @@ class PairingService:
     def handle_pairing(self, node_id: str, hostname: str, ip: str) -> bool:
         fingerprint = compute_fingerprint(node_id, hostname)
 
-        if self.state.is_trusted(node_id):
+        # ammissione per fingerprint (indice, O(1)): un node_id già noto ma
+        # con fingerprint diverso ripassa dall'approvazione utente
+        if self.state.trusted_by_fingerprint(fingerprint) == node_id:
             return True
 
         req = PairingRequest(
             request_id=str(uuid.uuid4()),
-            node_id=node_id,
-            hostname=hostname,
-            ip=ip,
-            fingerprint=fingerprint,
+            host_id=node_id,
+            host_hostname=hostname,
+            host_ip=ip,
+            host_fingerprint=fingerprint,
             created_at=time.time(),
         )
 
-        approved = request_user_approval(hostname, ip, fingerprint)
+        try:
+            approved = request_user_approval(hostname, ip, fingerprint)
+        except EOFError:
+            # nessuno alla console (servizio, headless): resta in attesa,
+            # approvabile più tardi (anche in bulk) con
+            # SnowballState.approve_pairings()
+            self.state.add_pairing(req)
+            return False
+
         if approved:
             req.approved = True
             self.state.trust_host(req)
             return True
 
+        # rifiutata esplicitamente: non deve restare approvabile in bulk
+        self.state.reject_pairing(node_id)
         return False
@@ -1,23 +1,340 @@
-import platform
-from .models import ResourceRequest, ResourceGrant
+import heapq
+import os
+import threading
 import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from .capabilities import CapabilityProber
+from .models import (
+    GRANTED,
+    PARTIAL,
+    QUEUED,
+    REJECTED,
+    RELEASED,
+    ResourceGrant,
+    ResourceRequest,
+)
+
+
+@dataclass(frozen=True)
+class HostCapacity:
+    cpu_percent: int  # 100 per core
+    ram_mb: int
+
+    @classmethod
+    def detect(cls) -> "HostCapacity":
+        cpus = os.cpu_count() or 1
+        try:
+            ram_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+        except (ValueError, OSError, AttributeError):
+            ram_mb = 0
+        return cls(cpu_percent=cpus * 100, ram_mb=ram_mb)
 
 
 class ResourceController:
+    """
+    Admission control delle risorse host.
+
+    Tiene il totale concesso (contatori O(1)) contro la capacità host
+    moltiplicata per il rapporto di oversubscription (CPU e RAM separati:
+    la CPU si può sovra-allocare, la RAM sovra-allocata fa swap).
+
+    grant() decide in O(1):
+    - GRANTED  la richiesta entra tutta
+    - PARTIAL  entra almeno `min_fraction` di CPU e RAM: si concede il libero
+    - QUEUED   in coda FIFO; release() riammette in first-fit le richieste
+               che ora entrano (una grande in testa non blocca le piccole)
+    - REJECTED coda piena
+
+    Ogni grant ha un lease (`lease_seconds`): se nessuna sandbox la
+    reclama (claim) prima della scadenza torna libera da sola, così un
+    nodo che chiede risorse e sparisce non le tiene per sempre. Con
+    `owner` (nodo o sessione) una nuova richiesta sostituisce quella
+    precedente non ancora usata invece di sommarsi: un nodo che si
+    riconnette N volte occupa una grant, non N. Le grant reclamate
+    restano fino a release() (il reaper della sandbox all'uscita).
+    """
+
+    def __init__(
+        self,
+        capacity: Optional[HostCapacity] = None,
+        cpu_oversubscription: float = 2.0,
+        ram_oversubscription: float = 1.0,
+        min_fraction: float = 0.5,
+        max_queue: int = 256,
+        prober: Optional[CapabilityProber] = None,
+        lease_seconds: Optional[float] = 300.0,
+    ) -> None:
+        self.capacity = capacity or HostCapacity.detect()
+        self.prober = prober or CapabilityProber()
+        self.cpu_oversubscription = cpu_oversubscription
+        self.ram_oversubscription = ram_oversubscription
+        self.min_fraction = min_fraction
+        self.max_queue = max_queue
+        self.lease_seconds = lease_seconds
+
+        self._grants: Dict[str, ResourceGrant] = {}
+        self._queue: "OrderedDict[str, tuple[ResourceGrant, ResourceRequest, bool]]" = OrderedDict()
+        # owner -> grant non ancora reclamata (attiva o in coda)
+        self._owners: Dict[str, str] = {}
+        # richiesta originale delle grant con owner, per riconoscere il riuso
+        self._requested: Dict[str, tuple[ResourceRequest, bool]] = {}
+        # (expires_at, grant_id); voci superate (renew/claim/release) scartate in pop
+        self._leases: List[tuple[float, str]] = []
+        self._listeners: List[Callable[[ResourceGrant], None]] = []
+        self._used_cpu = 0
+        self._used_ram = 0
+        self._cond = threading.Condition()
+
     def verify_local_capabilities(self) -> dict:
-        system = platform.system().lower()
-        return {
-            "os": system,
-            "supports_gpu": system == "linux",
-            "supports_cgroups": system == "linux",
-        }
-
-    def grant(self, request: ResourceRequest) -> ResourceGrant:
-        # Qui in v1 si assume che il controllo effettivo
-        # venga applicato dal sandbox runtime
-        return ResourceGrant(
-            cpu_percent=request.cpu_percent,
-            ram_mb=request.ram_mb,
+        # dalla cache del prober: nessun accesso a /proc o /sys per chiamata
+        caps = dict(self.prober.capabilities())
+        caps["cpu_percent"] = self.capacity.cpu_percent
+        caps["ram_mb"] = self.capacity.ram_mb
+        return caps
+
+    # ------------------------------------------------------------------
+    # Capacità
+    # ------------------------------------------------------------------
+
+    @property
+    def cpu_limit(self) -> int:
+        return int(self.capacity.cpu_percent * self.cpu_oversubscription)
+
+    @property
+    def ram_limit(self) -> int:
+        return int(self.capacity.ram_mb * self.ram_oversubscription)
+
+    def available(self) -> dict:
+        self.expire()
+        with self._cond:
+            return {
+                "cpu_percent": max(0, self.cpu_limit - self._used_cpu),
+                "ram_mb": max(0, self.ram_limit - self._used_ram),
+                "active": len(self._grants),
+                "queued": len(self._queue),
+            }
+
+    # ------------------------------------------------------------------
+    # Admission (con lock)
+    # ------------------------------------------------------------------
+
+    def _fit(self, request: ResourceRequest, allow_partial: bool) -> Optional[tuple[int, int, str]]:
+        free_cpu = self.cpu_limit - self._used_cpu
+        free_ram = self.ram_limit - self._used_ram
+        if request.cpu_percent <= free_cpu and request.ram_mb <= free_ram:
+            return request.cpu_percent, request.ram_mb, GRANTED
+        if not allow_partial:
+            return None
+        cpu = min(request.cpu_percent, free_cpu)
+        ram = min(request.ram_mb, free_ram)
+        if cpu >= request.cpu_percent * self.min_fraction and ram >= request.ram_mb * self.min_fraction and cpu > 0:
+            return cpu, ram, PARTIAL
+        return None
+
+    def _admit(self, grant: ResourceGrant, cpu: int, ram: int, status: str) -> None:
+        grant.cpu_percent = cpu
+        grant.ram_mb = ram
+        grant.status = status
+        grant.granted_at = time.time()
+        self._used_cpu += cpu
+        self._used_ram += ram
+        self._grants[grant.grant_id] = grant
+        if self.lease_seconds is not None:
+            self._lease(grant, grant.granted_at + self.lease_seconds)
+
+    def _lease(self, grant: ResourceGrant, expires_at: float) -> None:
+        grant.expires_at = expires_at
+        heapq.heappush(self._leases, (expires_at, grant.grant_id))
+
+    def _forget(self, grant_id: str) -> Optional[ResourceGrant]:
+        """Toglie una grant (attiva o in coda) senza riammettere la coda."""
+        grant = self._grants.pop(grant_id, None)
+        if grant is not None:
+            self._used_cpu -= grant.cpu_percent
+            self._used_ram -= grant.ram_mb
+        else:
+            queued = self._queue.pop(grant_id, None)
+            if queued is None:
+                return None
+            grant = queued[0]
+        grant.status = RELEASED
+        grant.expires_at = None
+        self._requested.pop(grant_id, None)
+        if grant.owner is not None and self._owners.get(grant.owner) == grant_id:
+            del self._owners[grant.owner]
+        return grant
+
+    def _expire(self, now: float) -> bool:
+        expired = False
+        while self._leases and self._leases[0][0] <= now:
+            expires_at, grant_id = heapq.heappop(self._leases)
+            grant = self._grants.get(grant_id)
+            if grant is not None and grant.expires_at == expires_at:
+                self._forget(grant_id)
+                expired = True
+        return expired
+
+    def _drain(self) -> List[ResourceGrant]:
+        admitted = []
+        for grant_id, (grant, request, allow_partial) in list(self._queue.items()):
+            if self._used_cpu >= self.cpu_limit or self._used_ram >= self.ram_limit:
+                break
+            fit = self._fit(request, allow_partial)
+            if fit is not None:
+                del self._queue[grant_id]
+                self._admit(grant, *fit)
+                admitted.append(grant)
+        return admitted
+
+    def _notify(self, grants: List[ResourceGrant]) -> None:
+        for grant in grants:
+            for listener in list(self._listeners):
+                listener(grant)
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def grant(
+        self,
+        request: ResourceRequest,
+        allow_partial: bool = True,
+        queue: bool = True,
+        owner: Optional[str] = None,
+    ) -> ResourceGrant:
+        """
+        Nuova grant per `request`. Con `owner` la grant non reclamata
+        dello stesso owner viene riusata (stessa richiesta, ancora attiva:
+        si rinnova il lease) o sostituita.
+        """
+        grant = ResourceGrant(
+            cpu_percent=0,
+            ram_mb=0,
             gpu_layers=request.gpu_layers,
-            granted_at=time.time(),
+            granted_at=0.0,
+            grant_id=uuid.uuid4().hex,
+            status=REJECTED,
+            owner=owner,
         )
+        with self._cond:
+            self._expire(time.time())
+            held = False
+            previous_id = self._owners.get(owner) if owner is not None else None
+            if previous_id is not None:
+                previous = self.get(previous_id)
+                if self._requested.get(previous_id) == (request, allow_partial):
+                    if previous.active and self.lease_seconds is not None:
+                        self._lease(previous, time.time() + self.lease_seconds)
+                    return previous
+                held = previous.active
+                self._forget(previous_id)
+
+            # la coda ha la precedenza: chi arriva dopo non scavalca chi
+            # aspetta, tranne chi sta sostituendo una grant già attiva
+            fit = None if self._queue and not held else self._fit(request, allow_partial)
+            if fit is not None:
+                self._admit(grant, *fit)
+            elif queue and len(self._queue) < self.max_queue:
+                grant.status = QUEUED
+                self._queue[grant.grant_id] = (grant, request, allow_partial)
+            if owner is not None and grant.status != REJECTED:
+                self._owners[owner] = grant.grant_id
+                self._requested[grant.grant_id] = (request, allow_partial)
+            admitted = self._drain()
+            if admitted or held:
+                self._cond.notify_all()
+        self._notify(admitted)
+        return grant
+
+    def claim(self, grant_id: str) -> bool:
+        """
+        La grant passa in uso (una sandbox lanciata): niente più lease né
+        owner, resta occupata fino a release().
+        """
+        with self._cond:
+            grant = self._grants.get(grant_id)
+            if grant is None:
+                return False
+            grant.expires_at = None
+            if grant.owner is not None and self._owners.get(grant.owner) == grant_id:
+                del self._owners[grant.owner]
+            self._requested.pop(grant_id, None)
+            return True
+
+    def renew(self, grant_id: str) -> bool:
+        """Estende il lease di una grant attiva non ancora reclamata."""
+        with self._cond:
+            grant = self._grants.get(grant_id)
+            if grant is None or grant.expires_at is None or self.lease_seconds is None:
+                return False
+            self._lease(grant, time.time() + self.lease_seconds)
+            return True
+
+    def expire(self, now: Optional[float] = None) -> None:
+        """Libera le grant con lease scaduto e riammette la coda."""
+        with self._cond:
+            if not self._expire(time.time() if now is None else now):
+                return
+            admitted = self._drain()
+            self._cond.notify_all()
+        self._notify(admitted)
+
+    def release(self, grant_id: str) -> bool:
+        """Libera una grant (o la toglie dalla coda) e riammette la coda."""
+        with self._cond:
+            grant = self._forget(grant_id)
+            if grant is None:
+                return False
+            admitted = self._drain()
+            self._cond.notify_all()
+        self._notify(admitted)
+        return True
+
+    def release_owner(self, owner: str) -> bool:
+        """Rilascia la grant non reclamata di `owner` (es. nodo disconnesso)."""
+        with self._cond:
+            grant_id = self._owners.get(owner)
+        return grant_id is not None and self.release(grant_id)
+
+    def wait(self, grant: ResourceGrant, timeout: Optional[float] = None) -> bool:
+        """
+        Attende che una grant in coda venga ammessa. Si sveglia anche alla
+        scadenza del prossimo lease: un posto liberato da un lease scaduto
+        non aspetta la prossima grant()/release().
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.expire()
+            with self._cond:
+                if grant.status != QUEUED:
+                    return grant.active
+                step = None
+                if deadline is not None:
+                    step = deadline - time.monotonic()
+                    if step <= 0:
+                        return False
+                if self._leases:
+                    until_lease = max(0.0, self._leases[0][0] - time.time()) + 0.001
+                    step = until_lease if step is None else min(step, until_lease)
+                self._cond.wait(step)
+
+    def subscribe(self, listener: Callable[[ResourceGrant], None]) -> None:
+        """`listener(grant)` quando una grant in coda viene ammessa."""
+        self._listeners.append(listener)
+
+    def get(self, grant_id: str) -> Optional[ResourceGrant]:
+        with self._cond:
+            grant = self._grants.get(grant_id)
+            if grant is None and grant_id in self._queue:
+                grant = self._queue[grant_id][0]
+            return grant
+
+    def owned_by(self, owner: str) -> Optional[ResourceGrant]:
+        """Grant non reclamata (attiva o in coda) di `owner`."""
+        with self._cond:
+            grant_id = self._owners.get(owner)
+            return self.get(grant_id) if grant_id is not None else None
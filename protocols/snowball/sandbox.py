@@ -1,14 +1,22 @@
 from __future__ import annotations
 # src/ice_studio/snowball/sandbox.py
 
-import os
+import logging
 import platform
 import subprocess
-from dataclasses import dataclass
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
 from typing import Optional
 
-from .resources import ResourceGrant
-from .security import audit_event
+from .cgroups import CgroupManager, CgroupUsage, read_usage
+from .models import QUEUED
+from .resources import ResourceController, ResourceGrant
+from .warm import Profile, WarmPool, WarmSlot
+from ..security.audit import audit_event
+
+logger = logging.getLogger("ice.snowball.sandbox")
 
 
 @dataclass
@@ -16,6 +24,14 @@ class SandboxHandle:
     pid: int
     cgroup: Optional[str] = None
     namespace: Optional[str] = None
+    grant_id: Optional[str] = None
+    process: Optional[subprocess.Popen] = field(default=None, repr=False, compare=False)
+
+    def usage(self) -> Optional[CgroupUsage]:
+        """CPU/throttling, memoria e PSI del cgroup (None senza cgroup)."""
+        if not self.cgroup:
+            return None
+        return read_usage(Path(self.cgroup))
 
 
 class SandboxManager:
@@ -24,8 +40,50 @@ class SandboxManager:
     Linux-first. No Docker. No install.
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        node_id: Optional[str] = None,
+        cgroups: Optional[CgroupManager] = None,
+        controller: Optional[ResourceController] = None,
+    ) -> None:
         self.platform = platform.system().lower()
+        # finisce nei dettagli di audit: query_audit(..., node=node_id)
+        self.node_id = node_id
+        self.cgroups = cgroups or CgroupManager()
+        self.warm_pool: Optional[WarmPool] = None
+        # con un controller, la grant viene rilasciata all'uscita del processo
+        self.controller = controller
+        self._running: list[SandboxHandle] = []
+        self._reaper: Optional[threading.Thread] = None
+        self._reaper_lock = threading.Lock()
+
+    def uses_cgroups(self) -> bool:
+        return self.supported() and self.cgroups.available()
+
+    def enable_warm_pool(
+        self,
+        size: int = 2,
+        profiles: Optional[list[ResourceGrant]] = None,
+    ) -> WarmPool:
+        """
+        Attiva il lancio da pool: slot pre-creati (wrapper e limiti già
+        applicati) pronti a fare exec del comando.
+        """
+        if self.warm_pool is None:
+            self.warm_pool = WarmPool(
+                size=size,
+                prepare=self._prepare_slot,
+                discard=self._discard_slot,
+            )
+            self.warm_pool.start()
+        for resources in profiles or []:
+            self.warm_pool.ensure(self._profile(resources))
+        return self.warm_pool
+
+    def disable_warm_pool(self) -> None:
+        if self.warm_pool is not None:
+            self.warm_pool.stop()
+            self.warm_pool = None
 
     def supported(self) -> bool:
         return self.platform == "linux"
@@ -34,37 +92,175 @@ class SandboxManager:
         self,
         command: list[str],
         resources: ResourceGrant,
+        wait: Optional[float] = None,
     ) -> SandboxHandle:
+        """
+        Lancia `command` nei limiti della grant. Una grant non attiva
+        (in coda, rifiutata, rilasciata) ha limiti 0 = nessun limite e
+        viene rifiutata; con `wait` e un controller una grant in coda
+        viene attesa al massimo `wait` secondi.
+
+        Con un controller la grant viene reclamata prima del lancio (il
+        lease non scade sotto un processo in esecuzione) e rilasciata
+        all'uscita del processo, o subito se il lancio fallisce.
+        """
         if not self.supported():
             audit_event(
                 "sandbox.unsupported_platform",
-                {"platform": self.platform},
+                {"platform": self.platform, "node_id": self.node_id},
             )
             raise RuntimeError("Sandbox supported only on Linux")
 
+        if resources.status == QUEUED and wait is not None and self.controller is not None:
+            self.controller.wait(resources, wait)
+        claimed = resources.active and (
+            self.controller is None or self.controller.claim(resources.grant_id)
+        )
+        if not claimed:
+            audit_event(
+                "sandbox.grant_inactive",
+                {
+                    "grant_id": resources.grant_id,
+                    "status": resources.status,
+                    "node_id": self.node_id,
+                },
+            )
+            raise RuntimeError(f"Resource grant not active ({resources.status})")
+
         audit_event(
             "sandbox.launch",
             {
                 "cpu": resources.cpu_percent,
                 "ram": resources.ram_mb,
                 "gpu": resources.gpu_layers,
+                "node_id": self.node_id,
             },
         )
+        try:
+            return self._spawn(command, resources)
+        except BaseException:
+            if self.controller is not None:
+                self.controller.release(resources.grant_id)
+            raise
+
+    def _spawn(self, command: list[str], resources: ResourceGrant) -> SandboxHandle:
+        if self.warm_pool is not None:
+            slot = self.warm_pool.take(self._profile(resources))
+            if slot is not None:
+                proc = self.warm_pool.exec(slot, command)
+                return self._track(
+                    SandboxHandle(pid=proc.pid, cgroup=slot.cgroup, process=proc),
+                    resources,
+                )
+
+        cgroup = None
+        if self.uses_cgroups():
+            cgroup = self.cgroups.create(resources.cpu_percent, resources.ram_mb)
+            cmd = self.cgroups.wrap(cgroup, command)
+        else:
+            cmd = self._build_command(command, resources)
+        try:
+            proc = subprocess.Popen(cmd)
+        except OSError:
+            if cgroup is not None:
+                self.cgroups.remove(cgroup)
+            raise
+
+        return self._track(
+            SandboxHandle(
+                pid=proc.pid,
+                cgroup=str(cgroup) if cgroup else None,
+                process=proc,
+            ),
+            resources,
+        )
+
+    def destroy(self, handle: SandboxHandle) -> bool:
+        """Termina i processi rimasti e rimuove il cgroup della sandbox."""
+        if handle.cgroup:
+            return self.cgroups.remove(Path(handle.cgroup))
+        if handle.process is not None and handle.process.poll() is None:
+            handle.process.kill()
+        return True
 
-        cmd = self._build_command(command, resources)
-        proc = subprocess.Popen(cmd)
+    # ------------------------------------------------------------------
+    # Reaper: rilascio grant e cgroup all'uscita
+    # ------------------------------------------------------------------
 
-        return SandboxHandle(pid=proc.pid)
+    def _track(self, handle: SandboxHandle, resources: ResourceGrant) -> SandboxHandle:
+        handle.grant_id = resources.grant_id or None
+        if self.controller is None and not handle.cgroup:
+            return handle
+        with self._reaper_lock:
+            self._running.append(handle)
+            if self._reaper is None:
+                self._reaper = threading.Thread(
+                    target=self._reap_loop, daemon=True, name="snowball-reaper"
+                )
+                self._reaper.start()
+        return handle
+
+    def reap(self) -> list[SandboxHandle]:
+        """Gestisce le sandbox terminate; ritorna i loro handle."""
+        with self._reaper_lock:
+            done = [h for h in self._running if h.process.poll() is not None]
+            if not done:
+                return done
+            self._running = [h for h in self._running if h.process.returncode is None]
+        for handle in done:
+            if handle.cgroup:
+                self.destroy(handle)
+            if self.controller is not None and handle.grant_id:
+                self.controller.release(handle.grant_id)
+            audit_event(
+                "sandbox.exit",
+                {"pid": handle.pid, "code": handle.process.returncode, "node_id": self.node_id},
+            )
+        return done
+
+    def _reap_loop(self, interval: float = 0.5) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.reap()
+            except Exception:
+                logger.exception("sandbox reaper failed")
+            with self._reaper_lock:
+                if not self._running:
+                    self._reaper = None
+                    return
+
+    # ------------------------------------------------------------------
+    # Profili warm pool
+    # ------------------------------------------------------------------
+
+    def _profile(self, resources: ResourceGrant) -> Profile:
+        if self.uses_cgroups():
+            return ("cgroup", str(resources.cpu_percent), str(resources.ram_mb))
+        return tuple(self._wrapper(resources))
+
+    def _prepare_slot(self, profile: Profile) -> tuple[list[str], Optional[str]]:
+        if profile and profile[0] == "cgroup":
+            cgroup = self.cgroups.create(int(profile[1]), int(profile[2]))
+            return self.cgroups.wrap(cgroup, []), str(cgroup)
+        return list(profile), None
+
+    def _discard_slot(self, slot: WarmSlot) -> None:
+        if slot.cgroup:
+            self.cgroups.remove(Path(slot.cgroup))
 
     def _build_command(
         self,
         command: list[str],
         resources: ResourceGrant,
     ) -> list[str]:
+        return self._wrapper(resources) + command
+
+    def _wrapper(self, resources: ResourceGrant) -> list[str]:
         """
-        Usa:
-        - cgroups v2 (cpu, memory)
-        - nice per fallback
+        Fallback senza cgroup v2 scrivibile:
+        - nice (priorità, non una quota)
+        - systemd-run --scope per la memoria
         """
         cmd = []
 
@@ -78,5 +274,4 @@ class SandboxManager:
                 f"-pMemoryMax={resources.ram_mb}M",
             ]
 
-        cmd += command
         return cmd
@@ -1,10 +1,11 @@
 from __future__ import annotations
-import json
 import time
 from pathlib import Path
-from typing import Dict
-from dataclasses import asdict
+from typing import Dict, List, Optional
 from .models import PairingRequest
+from ..security.pairing.pending import PendingPairings
+from ..security.store.sync import SyncReport, sync_stores
+from ..security.store.trust import SharedTrustStore, TrustedHost, TrustStore, section_hosts_snapshot
 
 
 STATE_PATH = Path.home() / ".ice_studio" / "snowball_state.json"
@@ -12,38 +13,99 @@ STATE_PATH = Path.home() / ".ice_studio" / "snowball_state.json"
 
 class SnowballState:
     def __init__(self):
-        self.pairings: Dict[str, PairingRequest] = {}
-        self.trusted_hosts: Dict[str, dict] = {}
+        # richieste dei nodi non ancora approvate (TTL, limite, dedup per nodo)
+        self.pairings = PendingPairings()
         self._load()
 
     def _load(self):
-        if not STATE_PATH.exists():
-            return
-        try:
-            data = json.loads(STATE_PATH.read_text())
-            self.trusted_hosts = data.get("trusted_hosts", {})
-        except Exception:
-            pass
+        # snapshot snowball_state.json + journal append-only, stesso
+        # modello di trust del preboot, condiviso tra processi
+        self._store = SharedTrustStore(
+            STATE_PATH, snapshot=section_hosts_snapshot("trusted_hosts")
+        )
+        self.trusted_hosts: Dict[str, TrustedHost] = self._store.data
 
     def save(self):
-        STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
-        STATE_PATH.write_text(
-            json.dumps(
-                {
-                    "trusted_hosts": self.trusted_hosts,
-                },
-                indent=2,
-            )
-        )
+        # riscrittura completa (atomica) dello snapshot; le singole
+        # modifiche sono già persistite da trust_host()
+        self._store.compact()
 
     def trust_host(self, pairing: PairingRequest):
-        self.trusted_hosts[pairing.node_id] = {
-            "hostname": pairing.hostname,
-            "ip": pairing.ip,
-            "fingerprint": pairing.fingerprint,
-            "paired_at": time.time(),
-        }
-        self.save()
+        self._store.trust(
+            pairing.host_id,
+            pairing.host_hostname,
+            pairing.host_ip,
+            pairing.host_fingerprint,
+            paired_at=time.time(),
+        )
+
+    def trust_hosts(self, pairings: List[PairingRequest]) -> None:
+        """Come trust_host() per un batch: un solo commit del journal."""
+        now = time.time()
+        with self._store.locked():
+            for pairing in pairings:
+                self._store.trust(
+                    pairing.host_id,
+                    pairing.host_hostname,
+                    pairing.host_ip,
+                    pairing.host_fingerprint,
+                    paired_at=now,
+                    sync=False,
+                )
+        self._store.commit()
+
+    def add_pairing(self, pairing: PairingRequest) -> PairingRequest:
+        """Registra una richiesta in attesa di approvazione (o rinnova quella del nodo)."""
+        return self.pairings.add(pairing)[0]
+
+    def reject_pairing(self, node_id: str) -> bool:
+        """Scarta la richiesta pendente di un nodo rifiutato dall'utente."""
+        pairing = self.pairings.find(node_id)
+        return pairing is not None and self.pairings.discard(pairing.request_id)
+
+    def approve_pairings(self, request_ids: List[str]) -> Dict[str, dict]:
+        """
+        Approva un batch di richieste pendenti: un solo commit del journal.
+        Per request_id, come security.pairing.approve_pairings():
+          {"ok": True, "status": "approved" | "already_approved", "host_id": ...}
+          {"ok": False, "status": "unknown"}
+        """
+        results: Dict[str, dict] = {}
+        approved: List[PairingRequest] = []
+        for request_id in request_ids:
+            if request_id in results:
+                continue
+            pairing = self.pairings.get(request_id)
+            if pairing is None:
+                status = "already_approved" if self.pairings.is_retired(request_id) else "unknown"
+                results[request_id] = {"ok": status != "unknown", "status": status}
+                continue
+            pairing.approved = True
+            approved.append(pairing)
+            results[request_id] = {"ok": True, "status": "approved", "host_id": pairing.host_id}
+        if approved:
+            self.trust_hosts(approved)
+            for pairing in approved:
+                self.pairings.retire(pairing.request_id)
+        return results
+
+    def revoke_host(self, node_id: str) -> bool:
+        """Rimuove un nodo trusted (tombstone: la sync non lo fa rientrare)."""
+        return self._store.delete(node_id)
 
     def is_trusted(self, node_id: str) -> bool:
-        return node_id in self.trusted_hosts
+        return node_id in self._store
+
+    def trusted_by_fingerprint(self, fingerprint: str) -> Optional[str]:
+        """node_id dell'host trusted con questo fingerprint, se esiste."""
+        keys = self._store.lookup_keys("fingerprint", fingerprint)
+        return keys[0] if keys else None
+
+    @property
+    def store(self) -> TrustStore:
+        """Store dei trusted_hosts, es. da esporre con TrustSyncServer."""
+        return self._store
+
+    def sync(self, address: tuple, secret: Optional[bytes] = None) -> SyncReport:
+        """Riconcilia i trusted_hosts con lo store "snowball_state" di un peer."""
+        return sync_stores(address, {"snowball_state": self._store}, secret=secret)
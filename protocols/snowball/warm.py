@@ -0,0 +1,259 @@
+from __future__ import annotations
+# src/ice_studio/snowball/warm.py
+
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("ice.snowball.sandbox")
+
+# Processo "zygote": parte già dentro il wrapper (cgroup v2, o nice / scope
+# con i limiti applicati), poi resta fermo sulla pipe finché non riceve il
+# comando da eseguire e fa exec sul posto. La pipe chiusa senza dati lo
+# fa uscire (pool in chiusura).
+ZYGOTE = """\
+import json, os, sys
+with os.fdopen(int(sys.argv[1]), "rb") as r:
+    data = r.read()
+if not data:
+    sys.exit(0)
+spec = json.loads(data)
+if spec.get("cwd"):
+    os.chdir(spec["cwd"])
+env = dict(os.environ)
+env.update(spec.get("env") or {})
+try:
+    os.execvpe(spec["argv"][0], spec["argv"], env)
+except OSError as err:
+    sys.stderr.write("snowball zygote: exec %s failed: %s\\n" % (spec["argv"][0], err))
+    os._exit(127)
+"""
+
+Profile = Tuple[str, ...]
+# profilo -> (prefisso del comando dello zygote, cgroup o None)
+Prepare = Callable[[Profile], Tuple[List[str], Optional[str]]]
+
+
+def _plain_prefix(profile: Profile) -> Tuple[List[str], Optional[str]]:
+    return list(profile), None
+
+
+@dataclass
+class WarmSlot:
+    profile: Profile
+    process: subprocess.Popen
+    control: int
+    cgroup: Optional[str] = None
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def release(self) -> None:
+        """Chiude la pipe senza comando: lo zygote esce. Idempotente."""
+        control, self.control = self.control, -1
+        if control < 0:
+            return
+        try:
+            os.close(control)
+        except OSError:
+            pass
+
+
+class WarmPool:
+    """
+    Pool di sandbox pre-create per profilo di limiti (prefisso del wrapper).
+
+    - take() consegna uno zygote già vivo e già limitato: il lancio costa
+      una write sulla pipe + exec, niente systemd-run sul percorso critico
+    - un thread di refill riporta ogni profilo a `size` slot in background
+    - un profilo mai visto viene servito a freddo e aggiunto al pool, così
+      i burst successivi con gli stessi limiti trovano slot pronti
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_profiles: int = 8,
+        prepare: Prepare = _plain_prefix,
+        discard: Optional[Callable[[WarmSlot], None]] = None,
+    ) -> None:
+        self.size = size
+        self.max_profiles = max_profiles
+        self.prepare = prepare
+        self.discard = discard
+        self._slots: Dict[Profile, Deque[WarmSlot]] = {}
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.hits = 0
+        self.misses = 0
+
+    # ------------------------------------------------------------------
+    # Slot
+    # ------------------------------------------------------------------
+
+    def _spawn(self, profile: Profile) -> WarmSlot:
+        prefix, cgroup = self.prepare(profile)
+        read_fd, write_fd = os.pipe()
+        try:
+            process = subprocess.Popen(
+                prefix + [sys.executable, "-I", "-S", "-c", ZYGOTE, str(read_fd)],
+                pass_fds=(read_fd,),
+                stdin=subprocess.DEVNULL,
+            )
+        except BaseException:
+            os.close(write_fd)
+            if cgroup is not None and self.discard is not None:
+                self.discard(WarmSlot(profile=profile, process=None, control=-1, cgroup=cgroup))
+            raise
+        finally:
+            os.close(read_fd)
+        return WarmSlot(profile=profile, process=process, control=write_fd, cgroup=cgroup)
+
+    def _drop(self, slot: WarmSlot) -> None:
+        """
+        Slot mai usato: chiude lo zygote e libera le sue risorse.
+        Può attendere fino a 1s: mai con il lock del pool.
+        """
+        slot.release()
+        try:
+            slot.process.wait(timeout=1.0)
+        except subprocess.TimeoutExpired:
+            slot.process.kill()
+            slot.process.wait()
+        if self.discard is not None:
+            self.discard(slot)
+
+    def ensure(self, profile: Profile) -> None:
+        """Registra `profile` per il refill (se c'è posto)."""
+        with self._cond:
+            if profile not in self._slots and len(self._slots) < self.max_profiles:
+                self._slots[profile] = deque()
+                self._cond.notify_all()
+
+    def take(self, profile: Profile) -> Optional[WarmSlot]:
+        dead: List[WarmSlot] = []
+        found = None
+        with self._cond:
+            slots = self._slots.get(profile)
+            while slots:
+                slot = slots.popleft()
+                if slot.alive():
+                    self.hits += 1
+                    found = slot
+                    break
+                dead.append(slot)
+            else:
+                self.misses += 1
+            if found is not None or dead:
+                # slot consumati o morti: il refill li rimpiazza subito
+                self._cond.notify_all()
+        for slot in dead:
+            self._drop(slot)
+        if found is None:
+            self.ensure(profile)
+        return found
+
+    def exec(
+        self,
+        slot: WarmSlot,
+        command: List[str],
+        env: Optional[Dict[str, str]] = None,
+        cwd: Optional[str] = None,
+    ) -> subprocess.Popen:
+        spec = json.dumps({"argv": command, "env": env or {}, "cwd": cwd}).encode()
+        try:
+            view = memoryview(spec)
+            while view:
+                view = view[os.write(slot.control, view):]
+        except OSError:
+            # zygote morto o pipe rotta: va raccolto e il suo cgroup rimosso
+            self._drop(slot)
+            raise
+        slot.release()
+        return slot.process
+
+    # ------------------------------------------------------------------
+    # Refill
+    # ------------------------------------------------------------------
+
+    def _missing(self, dead: List[WarmSlot]) -> List[Profile]:
+        """Con il lock: toglie gli slot morti (in `dead`) e ritorna i mancanti."""
+        missing = []
+        for profile, slots in self._slots.items():
+            for slot in [s for s in slots if not s.alive()]:
+                slots.remove(slot)
+                dead.append(slot)
+            missing += [profile] * (self.size - len(slots))
+        return missing
+
+    def _run(self) -> None:
+        while True:
+            dead: List[WarmSlot] = []
+            with self._cond:
+                while not self._stop and not (missing := self._missing(dead)) and not dead:
+                    self._cond.wait(5.0)
+                stop = self._stop
+            for slot in dead:
+                self._drop(slot)
+            if stop:
+                return
+            for profile in missing:
+                try:
+                    slot = self._spawn(profile)
+                except OSError as err:
+                    logger.warning("warm slot spawn failed for %s: %s", profile, err)
+                    with self._cond:
+                        self._slots.pop(profile, None)
+                    continue
+                with self._cond:
+                    keep = not self._stop and profile in self._slots
+                    if keep:
+                        self._slots[profile].append(slot)
+                        self._cond.notify_all()
+                if not keep:
+                    self._drop(slot)
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="snowball-warm")
+        self._thread.start()
+
+    def wait_ready(self, timeout: float = 5.0) -> bool:
+        """Attende che tutti i profili registrati abbiano `size` slot."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: all(len(s) >= self.size for s in self._slots.values()),
+                timeout,
+            )
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stop = True
+            slots = [slot for queue in self._slots.values() for slot in queue]
+            self._slots.clear()
+            self._cond.notify_all()
+        for slot in slots:
+            self._drop(slot)
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "profiles": len(self._slots),
+                "ready": sum(len(s) for s in self._slots.values()),
+            }
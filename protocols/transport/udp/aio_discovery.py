@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from .udp_discovery import DISCOVERY_PORT
+from .wire import DISCOVERY_MAGIC_V2, ProbeHandler, decode_reply, encode_probe
+
+
+class DiscoveryProtocol(asyncio.DatagramProtocol):
+    """
+    Lato prober: ogni risposta decodificata finisce in una asyncio.Queue,
+    consumata da discover().
+    """
+
+    def __init__(self) -> None:
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.replies: asyncio.Queue[Tuple[Dict, Tuple[str, int]]] = asyncio.Queue()
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        try:
+            payload = decode_reply(data)
+        except Exception:
+            return
+        if not payload.get("ip"):
+            payload["ip"] = addr[0]
+        payload["seen_at"] = time.time()
+        self.replies.put_nowait((payload, addr))
+
+    def error_received(self, exc: Exception) -> None:
+        # ICMP unreachable & co: non interrompono il probe
+        pass
+
+
+class ResponderProtocol(asyncio.DatagramProtocol):
+    """Responder ICE su event loop: risponde ai probe V3 e V2 con l'identity."""
+
+    def __init__(self, identity: Dict) -> None:
+        self.handler = ProbeHandler(identity)
+        self.transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        response = self.handler.respond(data, addr)
+        if not response or self.transport is None:
+            return
+        reply, delay = response
+        if delay > 0:
+            asyncio.get_running_loop().call_later(
+                delay, self._send, reply, addr
+            )
+        else:
+            self.transport.sendto(reply, addr)
+
+    def _send(self, reply: bytes, addr) -> None:
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.sendto(reply, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        pass
+
+
+async def start_async_responder(
+    identity: Dict,
+    host: str = "",
+    port: int = DISCOVERY_PORT,
+) -> asyncio.DatagramTransport:
+    """
+    Avvia il responder UDP sull'event loop corrente.
+    Il chiamante chiude il transport ritornato per fermarlo.
+    """
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: ResponderProtocol(identity),
+        local_addr=(host or "0.0.0.0", port),
+    )
+    return transport
+
+
+async def discover(
+    timeout: float = 1.2,
+    *,
+    expected: Optional[int] = None,
+    node_id: Optional[str] = None,
+    address: Tuple[str, int] = ("<broadcast>", DISCOVERY_PORT),
+    window: float = 0.0,
+    legacy: bool = True,
+) -> AsyncIterator[Dict]:
+    """
+    Broadcast UDP asincrono: produce i nodi man mano che rispondono.
+
+    Si ferma al primo tra:
+    - timeout scaduto
+    - `expected` nodi distinti hanno risposto
+    - il nodo `node_id` ha risposto
+
+    Ogni chiamata usa il proprio socket: più probe possono girare
+    in parallelo sullo stesso loop. `window` chiede ai responder di
+    spalmare le risposte su [0, window) secondi. Con `legacy` (default
+    durante la migrazione) parte anche il probe V2, come in udp_discovery().
+    """
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        DiscoveryProtocol,
+        local_addr=("0.0.0.0", 0),
+        allow_broadcast=True,
+    )
+    deadline = loop.time() + timeout
+    seen: set = set()
+
+    try:
+        transport.sendto(encode_probe(window=min(window, timeout)), address)
+        if legacy:
+            transport.sendto(DISCOVERY_MAGIC_V2, address)
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                payload, _addr = await asyncio.wait_for(
+                    protocol.replies.get(), remaining
+                )
+            except asyncio.TimeoutError:
+                return
+
+            key = payload.get("node_id")
+            if key is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+
+            yield payload
+
+            if node_id is not None and key == node_id:
+                return
+            if expected is not None and len(seen) >= expected:
+                return
+    finally:
+        transport.close()
+
+
+async def discover_all(timeout: float = 1.2, **kwargs) -> list[Dict]:
+    """Come discover(), ma raccoglie i risultati in una lista."""
+    return [payload async for payload in discover(timeout, **kwargs)]
+
+
+async def find_node(
+    node_id: str,
+    timeout: float = 1.2,
+    address: Tuple[str, int] = ("<broadcast>", DISCOVERY_PORT),
+) -> Optional[Dict]:
+    """Ritorna il payload di `node_id` appena risponde, None a timeout."""
+    async for payload in discover(timeout, node_id=node_id, address=address):
+        if payload.get("node_id") == node_id:
+            return payload
+    return None
@@ -0,0 +1,239 @@
+"""
+Modalità announce/listen della discovery ICE.
+
+Ogni nodo manda in multicast un heartbeat V3 (KIND_ANNOUNCE) con la propria
+identity e l'intervallo al prossimo annuncio. Da idle l'intervallo cresce
+(backoff) fino a `max_interval`: a regime il traffico è N / max_interval
+pacchetti al secondo per tutta la LAN. Un cambio di identity o l'arrivo di
+un peer mai visto riporta l'intervallo al minimo; i poke per nuovi peer
+sono limitati a uno per periodo di backoff, così un join di massa o un
+nodo che va e viene non tengono tutta la flotta all'intervallo minimo.
+
+Il listener è lo stesso responder su DISCOVERY_PORT: riceve gli annunci e
+aggiorna una DiscoveryRegistry, così "discover" diventa una lettura in
+memoria senza latenza di probe.
+"""
+from __future__ import annotations
+
+import logging
+import random
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from .registry import NODE_ADDED, DiscoveryRegistry
+from .udp_discovery import ANNOUNCE_GROUP, DISCOVERY_PORT, start_udp_responder
+from .wire import KIND_BYE, encode_announce
+from ...security.identity.identity import get_identity_provider
+
+logger = logging.getLogger("ice.discovery")
+
+# Un nodo scade dopo questo numero di annunci mancati
+MISSED_ANNOUNCES = 3
+
+# Peer già visti ricordati per non ri-accelerare a ogni loro ritorno
+MAX_KNOWN_PEERS = 4096
+
+
+class Announcer:
+    """Heartbeat multicast dell'identity locale, con backoff da idle."""
+
+    def __init__(
+        self,
+        identity: Dict,
+        group: str = ANNOUNCE_GROUP,
+        port: int = DISCOVERY_PORT,
+        min_interval: float = 1.0,
+        max_interval: float = 30.0,
+        backoff: float = 2.0,
+    ) -> None:
+        self.identity = dict(identity)
+        self.address = (group, port)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.sent = 0
+        self.pokes_dropped = 0
+
+        # node_id -> primo avvistamento (LRU limitata)
+        self._known: "OrderedDict[str, float]" = OrderedDict()
+        # prima di questo istante i poke per nuovi peer vengono ignorati
+        self._poke_holdoff = 0.0
+        self._unfollow: Optional[Callable[[], None]] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="udp-announcer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, bye: bool = True) -> None:
+        if self._unfollow is not None:
+            self._unfollow()
+            self._unfollow = None
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if bye:
+            self._send(encode_announce(self.identity, 0, bye=True))
+        self._sock.close()
+
+    def poke(self, force: bool = False) -> bool:
+        """
+        Riporta l'intervallo al minimo e anticipa il prossimo annuncio.
+        Senza `force` al massimo una volta per periodo di backoff (quello
+        in corso al momento del poke precedente); ritorna False se ignorato.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not force and now < self._poke_holdoff:
+                self.pokes_dropped += 1
+                return False
+            self._poke_holdoff = now + self.interval
+            self.interval = self.min_interval
+        self._wake.set()
+        return True
+
+    def peer_added(self, node_id: Optional[str]) -> bool:
+        """
+        Un peer è entrato nella registry: poke solo se non l'avevamo mai
+        visto (un nodo che scade e ritorna ci conosce già).
+        """
+        if not node_id:
+            return False
+        with self._lock:
+            if node_id in self._known:
+                self._known.move_to_end(node_id)
+                return False
+            self._known[node_id] = time.time()
+            while len(self._known) > MAX_KNOWN_PEERS:
+                self._known.popitem(last=False)
+        return self.poke()
+
+    def update_identity(self, identity: Dict) -> None:
+        with self._lock:
+            self.identity = dict(identity)
+        self.poke(force=True)
+
+    def follow_identity(self, provider) -> None:
+        """Annuncia l'identity di un IdentityProvider e ne segue i cambi."""
+        if self._unfollow is not None:
+            self._unfollow()
+        self._unfollow = provider.follow(self.update_identity)
+        self.update_identity(provider.payload)
+
+    def _send(self, packet: bytes) -> None:
+        try:
+            self._sock.sendto(packet, self.address)
+            self.sent += 1
+        except OSError as err:
+            logger.warning("announce send failed: %s", err)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                interval = self.interval
+                packet = encode_announce(self.identity, interval)
+                self.interval = min(self.max_interval, interval * self.backoff)
+            self._send(packet)
+
+            # jitter ±10%: i nodi avviati insieme non restano sincronizzati
+            delay = interval * random.uniform(0.9, 1.1)
+            if self._wake.wait(delay):
+                self._wake.clear()
+                # risveglio anticipato (poke): piccolo ritardo casuale per
+                # non rispondere tutti nello stesso istante a un nuovo peer
+                self._stop.wait(random.uniform(0.0, self.min_interval))
+
+
+class AnnounceListener:
+    """Callback per serve_probes: porta gli annunci dentro la registry."""
+
+    def __init__(self, registry: DiscoveryRegistry, self_id: Optional[str] = None) -> None:
+        self.registry = registry
+        self.self_id = self_id
+        self.received = 0
+
+    def __call__(self, kind: int, payload: Dict, interval: float, addr) -> None:
+        node_id = payload.get("node_id")
+        if self.self_id is not None and node_id == self.self_id:
+            return
+        self.received += 1
+        if kind == KIND_BYE:
+            if node_id:
+                self.registry.forget(node_id)
+            return
+        if not payload.get("ip"):
+            payload["ip"] = addr[0]
+        ttl = max(interval, 0.1) * MISSED_ANNOUNCES
+        self.registry.ingest(payload, ttl=ttl)
+
+
+def start_announce_mode(
+    identity: Optional[Dict] = None,
+    registry: Optional[DiscoveryRegistry] = None,
+    **announcer_options,
+) -> tuple[Announcer, DiscoveryRegistry]:
+    """
+    Avvia responder+listener su DISCOVERY_PORT e l'heartbeat locale.
+    La registry (passiva se non fornita) resta aggiornata dagli annunci.
+
+    Senza `identity` responder e heartbeat usano quella locale
+    (IdentityProvider, ruolo host) e ne seguono i cambi.
+
+    Se la porta è già occupata solleva OSError prima di avviare
+    qualunque cosa: senza listener la modalità announce non riceverebbe
+    nulla.
+    """
+    if registry is None:
+        # il ttl per nodo arriva dagli annunci; quello globale copre solo
+        # eventuali ingest da altre sorgenti
+        max_interval = announcer_options.get("max_interval", 30.0)
+        registry = DiscoveryRegistry(
+            ttl=max_interval * MISSED_ANNOUNCES,
+            refresh_interval=1.0,
+            scan=None,
+        )
+
+    provider = get_identity_provider() if identity is None else None
+    if provider is not None:
+        identity = provider.payload
+
+    listener = AnnounceListener(registry, self_id=identity.get("node_id"))
+    try:
+        start_udp_responder(
+            None if provider is not None else identity, on_announce=listener
+        )
+    except OSError as err:
+        logger.error("announce mode: cannot bind port %s: %s", DISCOVERY_PORT, err)
+        raise
+
+    announcer = Announcer(identity, **announcer_options)
+    if provider is not None:
+        announcer.follow_identity(provider)
+
+    # un peer nuovo deve conoscerci subito, senza attendere il nostro backoff
+    registry.subscribe(
+        lambda event, payload: announcer.peer_added(payload.get("node_id"))
+        if event == NODE_ADDED
+        else None
+    )
+
+    registry.start()
+    announcer.start()
+    return announcer, registry
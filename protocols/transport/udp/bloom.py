@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import struct
+
+_H = struct.Struct("<QQ")
+
+# Limite sul filtro dentro un probe: resta sotto un datagram "sicuro"
+MAX_BLOOM_BYTES = 8192
+
+
+class BloomFilter:
+    """
+    Bloom filter compatto per il campo "già visti" dei probe V3.
+
+    Il salt cambia a ogni round di probe: un falso positivo in un round
+    (nodo mai sentito ma che risulta "visto") non si ripete nel successivo.
+    """
+
+    __slots__ = ("bits", "k", "salt", "_m")
+
+    def __init__(self, bits: bytes | bytearray, k: int, salt: int = 0) -> None:
+        if not bits or k <= 0:
+            raise ValueError("bloom filter needs at least one byte and one hash")
+        self.bits = bytearray(bits)
+        self.k = k
+        self.salt = salt
+        self._m = len(self.bits) * 8
+
+    @classmethod
+    def for_capacity(
+        cls,
+        capacity: int,
+        fp_rate: float = 0.01,
+        salt: int = 0,
+        max_bytes: int = MAX_BLOOM_BYTES,
+    ) -> "BloomFilter":
+        capacity = max(1, capacity)
+        m = -capacity * math.log(fp_rate) / (math.log(2) ** 2)
+        size = min(max_bytes, max(1, math.ceil(m / 8)))
+        k = max(1, round(size * 8 / capacity * math.log(2)))
+        return cls(bytes(size), min(k, 16), salt)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(
+            key.encode(), digest_size=16, salt=self.salt.to_bytes(8, "little")
+        ).digest()
+        h1, h2 = _H.unpack(digest)
+        h2 |= 1
+        m = self._m
+        for i in range(self.k):
+            yield (h1 + i * h2) % m
+
+    def add(self, key: str) -> None:
+        bits = self.bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.bits)
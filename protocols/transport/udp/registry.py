@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from .udp_discovery import udp_discovery
+
+logger = logging.getLogger("ice.discovery")
+
+NODE_ADDED = "added"
+NODE_UPDATED = "updated"
+NODE_EXPIRED = "expired"
+
+Listener = Callable[[str, Dict], None]
+
+
+@dataclass
+class DiscoveredNode:
+    node_id: str
+    payload: Dict
+    seen_at: float
+    expires_at: float
+
+
+def _node_key(payload: Dict) -> Optional[str]:
+    return payload.get("node_id") or payload.get("ip") or payload.get("hostname")
+
+
+def _same_identity(a: Dict, b: Dict) -> bool:
+    return {k: v for k, v in a.items() if k != "seen_at"} == {
+        k: v for k, v in b.items() if k != "seen_at"
+    }
+
+
+class DiscoveryRegistry:
+    """
+    Tabella live dei nodi ICE sulla LAN, indicizzata per node_id.
+
+    - refresh in background ogni `refresh_interval` secondi
+      (scan=None: modalità passiva, la tabella è alimentata da ingest(),
+      es. dagli announce multicast, e il thread fa solo eviction)
+    - i nodi non visti da più di `ttl` secondi (o dal ttl del singolo
+      ingest) vengono rimossi
+    - le letture (nodes/get/locate) sono servite dalla memoria
+    - i listener ricevono (event, payload) per added/updated/expired
+    """
+
+    def __init__(
+        self,
+        ttl: float = 30.0,
+        refresh_interval: float = 10.0,
+        probe_timeout: float = 1.2,
+        scan: Optional[Callable[[float], List[Dict]]] = udp_discovery,
+    ) -> None:
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.probe_timeout = probe_timeout
+        self._scan = scan
+
+        self._nodes: Dict[str, DiscoveredNode] = {}
+        self._listeners: List[Listener] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Avvia il refresh in background (idempotente, non blocca)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="discovery-registry", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread and thread is not threading.current_thread():
+            thread.join(timeout=self.probe_timeout + 1.0)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Attende la fine del primo refresh (riuscito o no), al massimo
+        `timeout` secondi (default: probe_timeout + 1s). Ritorna False se
+        la deadline scade prima.
+        """
+        if timeout is None:
+            timeout = self.probe_timeout + 1.0
+        return self._ready.wait(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as err:
+                logger.warning("discovery refresh failed: %s", err)
+            self._ready.set()
+            self._stop.wait(self.refresh_interval)
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+
+    def refresh(self) -> None:
+        """Un giro di discovery sincrono, poi eviction dei nodi scaduti."""
+        if self._scan is not None:
+            for payload in self._scan(self.probe_timeout):
+                self.ingest(payload)
+        self.evict()
+
+    def ingest(
+        self,
+        payload: Dict,
+        seen_at: Optional[float] = None,
+        ttl: Optional[float] = None,
+    ) -> Optional[str]:
+        """
+        Registra una risposta (da probe, announce o altra sorgente).
+        Ritorna l'evento generato, None se il payload non è utilizzabile.
+        """
+        node_id = _node_key(payload)
+        if not node_id:
+            return None
+        seen_at = seen_at or payload.get("seen_at") or time.time()
+        expires_at = seen_at + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            current = self._nodes.get(node_id)
+            if current is None:
+                event = NODE_ADDED
+            elif not _same_identity(current.payload, payload):
+                event = NODE_UPDATED
+            else:
+                event = None
+            node = DiscoveredNode(
+                node_id=node_id,
+                payload={**payload, "seen_at": seen_at},
+                seen_at=seen_at,
+                expires_at=expires_at,
+            )
+            self._nodes[node_id] = node
+
+        if event:
+            self._notify(event, node.payload)
+        return event
+
+    def evict(self, now: Optional[float] = None) -> List[str]:
+        now = now or time.time()
+        with self._lock:
+            expired = [n for n in self._nodes.values() if n.expires_at < now]
+            for node in expired:
+                del self._nodes[node.node_id]
+
+        for node in expired:
+            self._notify(NODE_EXPIRED, node.payload)
+        return [node.node_id for node in expired]
+
+    def forget(self, node_id: str) -> bool:
+        """Rimuove subito un nodo (es. bye esplicito) e notifica expired."""
+        with self._lock:
+            node = self._nodes.pop(node_id, None)
+        if node is None:
+            return False
+        self._notify(NODE_EXPIRED, node.payload)
+        return True
+
+    # ------------------------------------------------------------------
+    # Queries (solo memoria)
+    # ------------------------------------------------------------------
+
+    def nodes(self) -> List[Dict]:
+        """Chi c'è sulla rete: snapshot dei nodi non scaduti."""
+        now = time.time()
+        with self._lock:
+            return [
+                dict(n.payload) for n in self._nodes.values() if n.expires_at >= now
+            ]
+
+    def get(self, node_id: str) -> Optional[Dict]:
+        with self._lock:
+            node = self._nodes.get(node_id)
+        if not node or node.expires_at < time.time():
+            return None
+        return dict(node.payload)
+
+    def locate(self, node_id: str) -> Optional[str]:
+        """Dov'è il nodo X: ip dell'ultima risposta, se ancora valida."""
+        node = self.get(node_id)
+        return node.get("ip") if node else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._nodes)
+
+    # ------------------------------------------------------------------
+    # Notifications
+    # ------------------------------------------------------------------
+
+    def subscribe(self, listener: Listener) -> Callable[[], None]:
+        """Registra un listener; ritorna la funzione per rimuoverlo."""
+        with self._lock:
+            self._listeners.append(listener)
+
+        def _unsubscribe() -> None:
+            with self._lock:
+                if listener in self._listeners:
+                    self._listeners.remove(listener)
+
+        return _unsubscribe
+
+    def _notify(self, event: str, payload: Dict) -> None:
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(event, dict(payload))
+            except Exception as err:
+                logger.warning("discovery listener failed on %s: %s", event, err)
@@ -0,0 +1,279 @@
+"""
+Responder UDP multi-worker.
+
+N socket legati alla stessa porta con SO_REUSEPORT: il kernel distribuisce
+i probe tra i worker per hash della sorgente, quindi ogni worker ha la sua
+coda di ricezione e nessun lock sul percorso caldo. Tutti i worker
+condividono lo stesso ProbeHandler (risposte V2/V3 pre-codificate).
+
+Attenzione: SO_REUSEPORT bilancia solo l'unicast. Broadcast e multicast
+(i probe di discovery, gli annunci) arrivano in copia a OGNI socket del
+gruppo: con IP_PKTINFO ogni worker riconosce le copie e serve solo quelle
+della sua quota (hash della sorgente), così ogni probe riceve una sola
+risposta e anche il carico broadcast è diviso. Senza IP_PKTINFO si
+resta a un worker.
+
+Rate limit per sorgente (token bucket per IP, non per porta: chi inonda
+cambia porta ad ogni probe) più un bucket globale opzionale, che protegge
+dalle sorgenti spoofate tutte diverse: una risposta V2 è molto più grande
+del probe e il responder non deve diventare un amplificatore.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .udp_discovery import (
+    DISCOVERY_PORT,
+    AnnounceCallback,
+    join_announce_group,
+    serve_probes,
+)
+from .wire import ProbeHandler
+
+logger = logging.getLogger("ice.network.udp_responder")
+
+HAS_REUSEPORT = hasattr(socket, "SO_REUSEPORT")
+# non esportata da tutte le build di Python; 8 è il valore Linux
+IP_PKTINFO = getattr(socket, "IP_PKTINFO", 8 if sys.platform.startswith("linux") else None)
+_PKTINFO = struct.Struct("=i4s4s")  # ifindex, spec_dst, addr
+
+
+class SourceLimiter:
+    """
+    Token bucket per IP sorgente: `rate` probe/s, fino a `burst` di fila.
+
+    I bucket pieni sono indistinguibili da uno nuovo, quindi quando la
+    tabella supera `max_sources` vengono scartati quelli inattivi da più
+    di burst/rate secondi.
+    """
+
+    def __init__(
+        self,
+        rate: float = 20.0,
+        burst: float = 40.0,
+        global_rate: Optional[float] = None,
+        max_sources: int = 4096,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.global_rate = global_rate
+        self.max_sources = max_sources
+        self._buckets: Dict[str, List[float]] = {}
+        self._global = [global_rate or 0.0, time.monotonic()]
+        self._lock = threading.Lock()
+
+    def _take(self, bucket: List[float], rate: float, burst: float, now: float) -> bool:
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens < 1.0:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1.0
+        return True
+
+    def _prune(self, now: float) -> None:
+        idle = self.burst / self.rate if self.rate > 0 else 0.0
+        for source in [s for s, b in self._buckets.items() if now - b[1] >= idle]:
+            del self._buckets[source]
+        if len(self._buckets) >= self.max_sources:
+            self._buckets.clear()
+
+    def allow(self, addr: tuple) -> bool:
+        source = addr[0]
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(source)
+            if bucket is None:
+                if len(self._buckets) >= self.max_sources:
+                    self._prune(now)
+                bucket = self._buckets[source] = [self.burst, now]
+            if not self._take(bucket, self.rate, self.burst, now):
+                return False
+            if self.global_rate and not self._take(
+                self._global, self.global_rate, self.global_rate, now
+            ):
+                bucket[0] += 1.0  # il probe non è stato servito: token restituito
+                return False
+            return True
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class _ShardSocket:
+    """
+    Socket di un worker: recvfrom() via recvmsg + IP_PKTINFO.
+
+    Per i datagrammi broadcast/multicast (destinazione != indirizzo
+    locale scelto per la risposta) ritorna b"" se la copia spetta a un
+    altro worker; serve_probes la ignora senza contarla.
+    """
+
+    def __init__(self, sock: socket.socket, index: int, shards: int) -> None:
+        sock.setsockopt(socket.IPPROTO_IP, IP_PKTINFO, 1)
+        self._sock = sock
+        self._index = index
+        self._shards = shards
+        self._ancbuf = socket.CMSG_SPACE(_PKTINFO.size)
+
+    def recvfrom(self, bufsize: int):
+        data, ancdata, _, addr = self._sock.recvmsg(bufsize, self._ancbuf)
+        for level, kind, value in ancdata:
+            if level == socket.IPPROTO_IP and kind == IP_PKTINFO:
+                _, local, destination = _PKTINFO.unpack_from(value)
+                if destination != local and hash(addr) % self._shards != self._index:
+                    return b"", addr
+        return data, addr
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+def default_workers() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+    return max(1, min(4, cpus))
+
+
+class ShardedResponder:
+    """
+    Responder di discovery su `workers` socket SO_REUSEPORT.
+
+    Senza SO_REUSEPORT / IP_PKTINFO (o se il bind condiviso fallisce)
+    ripiega su un solo worker. update_identity() ricodifica le risposte al volo, ad es.
+    collegata a IdentityProvider.subscribe().
+    """
+
+    def __init__(
+        self,
+        identity: Dict,
+        *,
+        workers: Optional[int] = None,
+        port: int = DISCOVERY_PORT,
+        host: str = "",
+        rate: Optional[float] = 20.0,
+        burst: float = 40.0,
+        global_rate: Optional[float] = None,
+        on_announce: Optional[AnnounceCallback] = None,
+    ) -> None:
+        self.handler = ProbeHandler(identity)
+        self.workers = max(1, workers or default_workers())
+        self.port = port
+        self.host = host
+        self.limiter = (
+            SourceLimiter(rate, burst, global_rate) if rate is not None else None
+        )
+        self.on_announce = on_announce
+        self._sockets: List[socket.socket] = []
+        self._threads: List[threading.Thread] = []
+        self._counters: List[Dict[str, int]] = []
+        self._stop = threading.Event()
+
+    # -- setup --------------------------------------------------------------
+
+    def _socket(self, shared: bool) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if shared:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((self.host, self.port))
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _bind(self) -> None:
+        shared = HAS_REUSEPORT and IP_PKTINFO is not None and self.workers > 1
+        try:
+            self._sockets.append(self._socket(shared))
+            if self.port == 0:
+                self.port = self._sockets[0].getsockname()[1]
+            for _ in range(self.workers - 1 if shared else 0):
+                self._sockets.append(self._socket(True))
+        except OSError as err:
+            if not self._sockets:
+                raise
+            logger.warning("SO_REUSEPORT bind failed (%s); using %d worker(s)", err, len(self._sockets))
+        if len(self._sockets) < self.workers:
+            self.workers = len(self._sockets)
+
+    def start(self) -> "ShardedResponder":
+        self._bind()
+        for n, sock in enumerate(self._sockets):
+            counters: Dict[str, int] = {}
+            self._counters.append(counters)
+            # la membership è dell'host: basta un join, le copie multicast
+            # arrivano a tutti i worker e ognuno gestisce la sua quota
+            if self.on_announce and n == 0:
+                join_announce_group(sock)
+            if self.workers > 1:
+                sock = _ShardSocket(sock, n, self.workers)
+            thread = threading.Thread(
+                target=self._serve,
+                args=(sock, counters, self.on_announce),
+                name=f"udp-responder-{n}",
+                daemon=True,
+            )
+            self._threads.append(thread)
+            thread.start()
+        logger.info("UDP responder active on port %s (%d workers)", self.port, self.workers)
+        return self
+
+    def _serve(self, sock, counters: Dict[str, int], announce) -> None:
+        def _on_error(err: Exception) -> None:
+            if self._stop.is_set():
+                return
+            logger.warning("UDP responder error: %s", err)
+            time.sleep(0.2)
+
+        try:
+            serve_probes(
+                sock,
+                self.handler,
+                on_error=_on_error,
+                on_announce=announce,
+                admit=self.limiter.allow if self.limiter is not None else None,
+                counters=counters,
+                stop=self._stop,
+            )
+        finally:
+            sock.close()
+
+    # -- runtime --------------------------------------------------------------
+
+    def update_identity(self, identity: Dict) -> None:
+        self.handler.update(identity)
+
+    def stats(self) -> Dict[str, object]:
+        totals = {"served": 0, "dropped": 0, "limited": 0, "errors": 0}
+        per_worker = []
+        for counters in self._counters:
+            snapshot = dict(counters)
+            per_worker.append(snapshot)
+            for key in totals:
+                totals[key] += snapshot.get(key, 0)
+        totals["workers"] = self.workers
+        totals["sources"] = len(self.limiter) if self.limiter is not None else 0
+        totals["per_worker"] = per_worker
+        return totals
+
+    def stop(self, timeout: float = 1.0) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+        self._sockets.clear()
+
+
+def start_sharded_responder(identity: Dict, **options) -> ShardedResponder:
+    return ShardedResponder(identity, **options).start()
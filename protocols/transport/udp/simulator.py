@@ -0,0 +1,415 @@
+"""
+Simulatore di discovery su scala flotta.
+
+Un DatagramFabric in memoria sostituisce la LAN: migliaia di responder
+virtuali e il vero udp_discovery(), che riceve un FabricSocket al posto
+del socket UDP. Ogni responder è lo stesso ProbeServer che serve_probes()
+guida con un socket vero (ProbeHandler, heap delle risposte ritardate
+dalla finestra, Bloom filter, probe V2/V3, rate limit per sorgente con
+`rate`, contatori); qui lo guida il thread del fabric, senza un thread
+per nodo.
+
+Il fabric modella per pacchetto:
+  - loss      probabilità di perdita
+  - latency   ritardo di consegna, più un jitter uniforme in [0, jitter)
+  - rcvbuf    tetto del buffer di ricezione del prober (come
+              net.core.rmem_max): oltre, i pacchetti sono scartati come
+              farebbe il kernel (overflow)
+e la taglia delle risposte tramite `reply_size(rng)`.
+
+    python -m protocols.transport.udp.simulator --nodes 5000 --loss 0.01
+
+Il tempo è reale (udp_discovery usa time.time() e timeout di socket):
+un run costa circa `timeout` secondi.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import random
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .sharded import SourceLimiter
+from .udp_discovery import DISCOVERY_PORT, PROBER_RCVBUF, ProbeServer, udp_discovery
+from .wire import ProbeHandler
+
+Address = Tuple[str, int]
+BROADCAST = "<broadcast>"
+
+
+@dataclass
+class FabricStats:
+    sent: int = 0
+    delivered: int = 0
+    lost: int = 0
+    overflow: int = 0
+    truncated: int = 0
+
+
+class FabricSocket:
+    """Il sottoinsieme dell'API socket usato da udp_discovery()."""
+
+    def __init__(self, fabric: "DatagramFabric", address: Address) -> None:
+        self.fabric = fabric
+        self.address = address
+        self.rcvbuf_max = PROBER_RCVBUF
+        self.rcvbuf = 212992  # default Linux
+        self._queue: Deque[Tuple[bytes, Address]] = deque()
+        self._queued_bytes = 0
+        self._cond = threading.Condition()
+        self._timeout: Optional[float] = None
+
+    # API socket ---------------------------------------------------------
+
+    def setsockopt(self, level: int, option: int, value) -> None:
+        if option == socket.SO_RCVBUF:
+            self.rcvbuf = min(int(value), self.rcvbuf_max)
+
+    def settimeout(self, timeout: Optional[float]) -> None:
+        self._timeout = timeout
+
+    def sendto(self, data: bytes, address: Address) -> int:
+        self.fabric.send(self.address, data, address)
+        return len(data)
+
+    def recvfrom(self, bufsize: int) -> Tuple[bytes, Address]:
+        deadline = None if self._timeout is None else time.monotonic() + self._timeout
+        with self._cond:
+            while not self._queue:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise socket.timeout("timed out")
+                self._cond.wait(remaining)
+            data, source = self._queue.popleft()
+            self._queued_bytes -= len(data)
+        if len(data) > bufsize:
+            # come UDP: il datagramma viene troncato alla taglia del buffer
+            self.fabric.stats.truncated += 1
+            data = data[:bufsize]
+        return data, source
+
+    def close(self) -> None:
+        self.fabric.unbind(self.address)
+
+    # lato fabric --------------------------------------------------------
+
+    def deliver(self, data: bytes, source: Address) -> bool:
+        with self._cond:
+            if self._queued_bytes + len(data) > self.rcvbuf:
+                return False
+            self._queue.append((data, source))
+            self._queued_bytes += len(data)
+            self._cond.notify()
+        return True
+
+
+class DatagramFabric:
+    """Rete datagram in memoria con perdita, latenza e jitter."""
+
+    def __init__(
+        self,
+        loss: float = 0.0,
+        latency: float = 0.0005,
+        jitter: float = 0.0005,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.stats = FabricStats()
+
+        self._sockets: Dict[Address, FabricSocket] = {}
+        self._responders: Dict[int, List[Tuple[Address, ProbeServer]]] = {}
+        self._events: list = []
+        self._order = itertools.count()
+        self._ports = itertools.count(40000)
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="ice-fabric")
+        self._thread.start()
+
+    # topologia ------------------------------------------------------------
+
+    def socket(self, host: str = "10.255.0.1") -> FabricSocket:
+        sock = FabricSocket(self, (host, next(self._ports)))
+        self._sockets[sock.address] = sock
+        return sock
+
+    def unbind(self, address: Address) -> None:
+        self._sockets.pop(address, None)
+
+    def add_responder(
+        self,
+        identity: Dict,
+        port: int = DISCOVERY_PORT,
+        admit: Optional[Callable[[tuple], bool]] = None,
+    ) -> Address:
+        """
+        Responder virtuale: un ProbeServer per `identity`, senza socket né
+        thread. `admit` come in serve_probes (es. SourceLimiter(...).allow).
+        """
+        address = (identity.get("ip") or "0.0.0.0", port)
+        server = ProbeServer(ProbeHandler(identity), admit=admit)
+        self._responders.setdefault(port, []).append((address, server))
+        return address
+
+    def responder_counters(self) -> Dict[str, int]:
+        """Contatori dei ProbeServer sommati (served/dropped/limited/errors)."""
+        totals: Dict[str, int] = {}
+        for servers in self._responders.values():
+            for _, server in servers:
+                for key, value in server.counters.items():
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    # consegna ---------------------------------------------------------------
+
+    def _schedule(self, due: float, kind: str, *args) -> None:
+        heapq.heappush(self._events, (due, next(self._order), kind, args))
+
+    def send(self, source: Address, data: bytes, destination: Address) -> None:
+        now = time.monotonic()
+        with self._cond:
+            host, port = destination
+            servers = [
+                (address, server)
+                for address, server in self._responders.get(port, ())
+                if host == BROADCAST or address == destination
+            ]
+            for address, server in servers:
+                self.stats.sent += 1
+                if self.rng.random() < self.loss:
+                    self.stats.lost += 1
+                    continue
+                self._schedule(now + self._delay(), "probe", server, address, source, data)
+            if not servers and destination in self._sockets:
+                self.stats.sent += 1
+                if self.rng.random() < self.loss:
+                    self.stats.lost += 1
+                else:
+                    self._schedule(now + self._delay(), "deliver", destination, source, data)
+            self._cond.notify()
+
+    def _delay(self) -> float:
+        return self.latency + (self.rng.random() * self.jitter if self.jitter else 0.0)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stop and (
+                    not self._events or self._events[0][0] > time.monotonic()
+                ):
+                    timeout = self._events[0][0] - time.monotonic() if self._events else None
+                    self._cond.wait(timeout)
+                if self._stop:
+                    return
+                _, _, kind, args = heapq.heappop(self._events)
+
+            if kind == "probe":
+                server, address, source, data = args
+                try:
+                    reply = server.receive(data, source, time.monotonic())
+                except Exception:
+                    server.counters["errors"] += 1
+                    continue
+                if reply is not None:
+                    self._reply(address, source, reply)
+                due = server.next_due()
+                if due is not None:
+                    with self._cond:
+                        self._schedule(due, "due", server, address)
+            elif kind == "due":
+                # risposte ritardate dalla finestra, come il timeout di serve_probes
+                server, address = args
+                for reply, destination in server.due(time.monotonic()):
+                    self._reply(address, destination, reply)
+            else:
+                destination, source, data = args
+                sock = self._sockets.get(destination)
+                if sock is None:
+                    continue
+                if sock.deliver(data, source):
+                    self.stats.delivered += 1
+                else:
+                    self.stats.overflow += 1
+
+    def _reply(self, source: Address, destination: Address, reply: bytes) -> None:
+        with self._cond:
+            self.stats.sent += 1
+            if self.rng.random() < self.loss:
+                self.stats.lost += 1
+                return
+            self._schedule(time.monotonic() + self._delay(), "deliver", destination, source, reply)
+
+    def close(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._thread.join(timeout=1.0)
+
+
+# ---------------------------------------------------------------------------
+# Scenario
+# ---------------------------------------------------------------------------
+
+@dataclass
+class SimulationReport:
+    nodes: int
+    found: int
+    duration_ms: float
+    latency_ms: Dict[str, float] = field(default_factory=dict)
+    stats: FabricStats = field(default_factory=FabricStats)
+    # contatori dei ProbeServer sommati su tutti i responder
+    responders: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def completeness(self) -> float:
+        return self.found / self.nodes if self.nodes else 1.0
+
+    @property
+    def drop_rate(self) -> float:
+        dropped = self.stats.lost + self.stats.overflow
+        return dropped / self.stats.sent if self.stats.sent else 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "nodes": self.nodes,
+            "found": self.found,
+            "completeness": round(self.completeness, 4),
+            "duration_ms": round(self.duration_ms, 1),
+            "latency_ms": {k: round(v, 2) for k, v in self.latency_ms.items()},
+            "drop_rate": round(self.drop_rate, 4),
+            "sent": self.stats.sent,
+            "lost": self.stats.lost,
+            "overflow": self.stats.overflow,
+            "truncated": self.stats.truncated,
+            "responders": dict(self.responders),
+        }
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def simulate(
+    nodes: int = 1000,
+    *,
+    loss: float = 0.0,
+    latency: float = 0.0005,
+    jitter: float = 0.0005,
+    reply_size: Optional[Callable[[random.Random], int]] = None,
+    rcvbuf: int = PROBER_RCVBUF,
+    timeout: float = 1.2,
+    window: float = 0.0,
+    rounds: int = 1,
+    legacy: bool = False,
+    rate: Optional[float] = None,
+    seed: Optional[int] = None,
+) -> SimulationReport:
+    """
+    Esegue udp_discovery() contro `nodes` responder virtuali.
+    `rate`: probe/s per IP sorgente ammessi da ogni responder (SourceLimiter).
+
+    reply_size(rng) -> byte extra per nodo: allunga l'hostname (V3, max
+    255) e aggiunge un campo "meta" all'identity (rilevante per le
+    risposte V2 JSON).
+    """
+    fabric = DatagramFabric(loss=loss, latency=latency, jitter=jitter, seed=seed)
+    rng = random.Random(seed)
+    try:
+        for i in range(nodes):
+            extra = max(0, reply_size(rng)) if reply_size else 0
+            hostname = f"sim-{i}"
+            identity = {
+                "node_id": f"sim-node-{i}",
+                "hostname": (hostname + "-" + "x" * extra)[:255] if extra else hostname,
+                "ip": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+                "role": "host",
+                "fingerprint": f"SHA256:sim-{i}",
+            }
+            if extra:
+                identity["meta"] = "x" * extra
+            admit = SourceLimiter(rate=rate, burst=max(1.0, rate)).allow if rate else None
+            fabric.add_responder(identity, admit=admit)
+
+        sock = fabric.socket()
+        sock.rcvbuf_max = rcvbuf
+        started = time.time()
+        devices = udp_discovery(
+            timeout=timeout,
+            legacy=legacy,
+            window=window,
+            rounds=rounds,
+            sock=sock,
+        )
+        duration = (time.time() - started) * 1e3
+    finally:
+        fabric.close()
+
+    first_seen: Dict[str, float] = {}
+    for device in devices:
+        node_id = device.get("node_id")
+        seen = (device.get("seen_at", started) - started) * 1e3
+        if node_id not in first_seen or seen < first_seen[node_id]:
+            first_seen[node_id] = seen
+    latencies = sorted(first_seen.values())
+
+    return SimulationReport(
+        nodes=nodes,
+        found=len(first_seen),
+        duration_ms=duration,
+        latency_ms={
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+        stats=fabric.stats,
+        responders=fabric.responder_counters(),
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(prog="python -m protocols.transport.udp.simulator")
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0005)
+    parser.add_argument("--jitter", type=float, default=0.0005)
+    parser.add_argument("--reply-extra", type=int, default=0,
+                        help="byte extra massimi per risposta (uniforme in [0, N])")
+    parser.add_argument("--rcvbuf", type=int, default=PROBER_RCVBUF)
+    parser.add_argument("--timeout", type=float, default=1.2)
+    parser.add_argument("--window", type=float, default=0.0)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--legacy", action="store_true")
+    parser.add_argument("--rate", type=float, help="probe/s per sorgente ammessi da ogni responder")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    report = simulate(
+        args.nodes,
+        loss=args.loss,
+        latency=args.latency,
+        jitter=args.jitter,
+        reply_size=(lambda rng: rng.randint(0, args.reply_extra)) if args.reply_extra else None,
+        rcvbuf=args.rcvbuf,
+        timeout=args.timeout,
+        window=args.window,
+        rounds=args.rounds,
+        legacy=args.legacy,
+        rate=args.rate,
+        seed=args.seed,
+    )
+    print(json.dumps(report.as_dict(), indent=2))
@@ -1,58 +1,307 @@
 from __future__ import annotations
 
+import heapq
+import itertools
+import random
 import socket
-import json
 import threading
 import time
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
+
+from ...security.identity.identity import get_identity_provider
+from .bloom import BloomFilter
+from .wire import ProbeHandler, decode_announce, decode_reply, encode_probe, is_announce
 
 DISCOVERY_PORT = 7042
 DISCOVERY_MAGIC = "ICE_DISCOVERY_V2"
 
+# Probe con Bloom filter possono superare il vecchio buffer da 1024 byte
+MAX_DATAGRAM = 65535
+PROBER_RCVBUF = 4 * 1024 * 1024
+
+# Gruppo multicast (site-local) per la modalità announce
+ANNOUNCE_GROUP = "239.255.70.42"
+
+AnnounceCallback = Callable[[int, Dict, float, tuple], None]
+
+
+def join_announce_group(sock: socket.socket, group: str = ANNOUNCE_GROUP) -> None:
+    mreq = socket.inet_aton(group) + socket.inet_aton("0.0.0.0")
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+
+
+class ProbeServer:
+    """
+    Stato di un responder, indipendente dal socket: decide cosa
+    rispondere a ogni datagram e tiene in un heap le risposte ritardate
+    dalla finestra del probe (nessun thread per risposta). serve_probes()
+    lo guida con un socket vero, il simulatore con il fabric in memoria.
 
-def start_udp_responder(identity: Dict):
+    Con on_announce gli heartbeat multicast ricevuti sulla stessa porta
+    vengono passati a on_announce(kind, identity, interval, addr).
+    admit(addr) -> False scarta il probe prima di rispondere (rate limit);
+    `counters` conta served / dropped / limited / errors.
+    """
+
+    def __init__(
+        self,
+        handler: ProbeHandler,
+        on_announce: Optional[AnnounceCallback] = None,
+        admit: Optional[Callable[[tuple], bool]] = None,
+        counters: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.handler = handler
+        self.on_announce = on_announce
+        self.admit = admit
+        self.counters = counters if counters is not None else {}
+        for key in ("served", "dropped", "limited", "errors"):
+            self.counters.setdefault(key, 0)
+        self._pending: list = []
+        self._order = itertools.count()
+
+    def receive(self, data: bytes, addr: tuple, now: float) -> Optional[bytes]:
+        """Risposta da inviare subito, None se nessuna o ritardata."""
+        if not data:
+            return None
+        if self.on_announce and is_announce(data):
+            kind, payload, interval = decode_announce(data)
+            self.on_announce(kind, payload, interval, addr)
+            return None
+        if self.admit is not None and not self.admit(addr):
+            self.counters["limited"] += 1
+            return None
+        response = self.handler.respond(data, addr)
+        if not response:
+            self.counters["dropped"] += 1
+            return None
+        reply, delay = response
+        self.counters["served"] += 1
+        if delay > 0:
+            heapq.heappush(self._pending, (now + delay, next(self._order), reply, addr))
+            return None
+        return reply
+
+    def next_due(self) -> Optional[float]:
+        """Istante (monotonic) della prossima risposta ritardata."""
+        return self._pending[0][0] if self._pending else None
+
+    def due(self, now: float) -> List[tuple]:
+        """(risposta, indirizzo) delle risposte ritardate ormai scadute."""
+        ready = []
+        while self._pending and self._pending[0][0] <= now:
+            _, _, reply, addr = heapq.heappop(self._pending)
+            ready.append((reply, addr))
+        return ready
+
+
+def serve_probes(
+    sock: socket.socket,
+    handler: ProbeHandler,
+    on_error: Optional[Callable[[Exception], None]] = None,
+    on_announce: Optional[AnnounceCallback] = None,
+    admit: Optional[Callable[[tuple], bool]] = None,
+    counters: Optional[Dict[str, int]] = None,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """
+    Loop del responder: riceve probe e invia le risposte, rispettando il
+    ritardo casuale richiesto dalla finestra del probe (vedi ProbeServer
+    per on_announce, admit e counters). Con `stop` il loop esce quando
+    l'evento viene settato.
+    """
+    server = ProbeServer(handler, on_announce=on_announce, admit=admit, counters=counters)
+    idle = None if stop is None else 0.5
+
+    while stop is None or not stop.is_set():
+        try:
+            due = server.next_due()
+            sock.settimeout(idle if due is None else max(0.0, due - time.monotonic()))
+            try:
+                data, addr = sock.recvfrom(MAX_DATAGRAM)
+            except socket.timeout:
+                data = None
+
+            if data:
+                reply = server.receive(data, addr, time.monotonic())
+                if reply is not None:
+                    sock.sendto(reply, addr)
+
+            for reply, addr in server.due(time.monotonic()):
+                sock.sendto(reply, addr)
+        except Exception as err:
+            server.counters["errors"] += 1
+            if on_error:
+                on_error(err)
+
+
+def start_udp_responder(
+    identity: Optional[Dict] = None,
+    on_announce: Optional[AnnounceCallback] = None,
+    workers: int = 1,
+    rate: Optional[float] = None,
+):
     """
     Avvia responder UDP ICE.
     Deve partire SEMPRE in preboot e runtime.
+    Risponde sia ai probe V3 (binari) sia ai probe V2 legacy (JSON).
+
+    Senza `identity` usa quella locale (IdentityProvider, ruolo host) e
+    ne segue i cambi: le risposte vengono ricodificate a ogni cambio IP.
+
+    Con on_announce il responder entra anche nel gruppo ANNOUNCE_GROUP e
+    fa da listener per la modalità announce (vedi announce.py).
+
+    workers > 1 o rate (probe/s per IP sorgente) passano al responder
+    multi-worker SO_REUSEPORT con rate limit (sharded.py), che viene
+    ritornato per stats() / stop().
+
+    Il bind avviene nel thread chiamante: se DISCOVERY_PORT è già occupata
+    (es. da un altro responder) solleva OSError invece di fallire in
+    silenzio nel thread.
     """
-    def _run():
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.bind(("", DISCOVERY_PORT))
+    provider = None
+    if identity is None:
+        provider = get_identity_provider()
+        identity = provider.payload
 
-        while True:
-            data, addr = sock.recvfrom(1024)
-            try:
-                if data.decode() == DISCOVERY_MAGIC:
-                    sock.sendto(json.dumps(identity).encode(), addr)
-            except Exception:
-                continue
+    if workers > 1 or rate is not None:
+        from .sharded import start_sharded_responder
 
-    threading.Thread(target=_run, daemon=True).start()
+        responder = start_sharded_responder(
+            identity, workers=workers, rate=rate, on_announce=on_announce
+        )
+        if provider is not None:
+            provider.follow(responder.update_identity)
+        return responder
+
+    handler = ProbeHandler(identity)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind(("", DISCOVERY_PORT))
+        if on_announce:
+            join_announce_group(sock)
+    except OSError:
+        sock.close()
+        raise
+    if provider is not None:
+        provider.follow(handler.update)
+
+    thread = threading.Thread(
+        target=serve_probes,
+        args=(sock, handler),
+        kwargs={"on_announce": on_announce},
+        name="udp-responder",
+        daemon=True,
+    )
+    thread.start()
+    return thread
 
 
-def udp_discovery(timeout: float = 1.2) -> List[Dict]:
+def udp_discovery(
+    timeout: float = 1.2,
+    legacy: bool = True,
+    window: float = 0.0,
+    rounds: int = 1,
+    expected: Optional[int] = None,
+    address: tuple = ("<broadcast>", DISCOVERY_PORT),
+    sock: Optional[socket.socket] = None,
+) -> List[Dict]:
     """
     Broadcast UDP per trovare nodi ICE.
     Tempo massimo: timeout (default 1.2s)
+
+    Invia un probe V3 e, finché legacy=True (default durante la
+    migrazione), anche il probe V2 per i responder non ancora migrati; i
+    responder V3 rispondono a uno solo dei due e le risposte sono
+    comunque deduplicate per node_id. legacy=False quando tutta la
+    flotta parla V3.
+
+    Flotte grandi:
+    - window: i responder spalmano la risposta su [0, window) secondi
+    - rounds: il timeout è diviso in round; dal secondo in poi il probe
+      porta un Bloom filter dei nodi già sentiti e rispondono solo gli altri
+
+    expected: ritorna appena ha `expected` nodi, senza attendere il timeout.
+    address: destinazione del probe (default broadcast sulla porta ICE).
+    sock: socket già pronto (es. FabricSocket del simulatore); non viene chiuso.
     """
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-    sock.settimeout(timeout)
+    rounds = max(1, rounds)
+    round_time = timeout / rounds
+    window = min(window, round_time * 0.8)
+
+    owned = sock is None
+    if owned:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        return _probe(sock, legacy, window, rounds, round_time, expected, address)
+    finally:
+        # il socket creato qui si chiude anche se send/recv sollevano
+        if owned:
+            sock.close()
 
-    sock.sendto(DISCOVERY_MAGIC.encode(), ("<broadcast>", DISCOVERY_PORT))
+
+def _probe(
+    sock: socket.socket,
+    legacy: bool,
+    window: float,
+    rounds: int,
+    round_time: float,
+    expected: Optional[int],
+    address: tuple,
+) -> List[Dict]:
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, PROBER_RCVBUF)
+    except OSError:
+        pass
 
     devices = []
+    seen = set()
+    dedup = legacy or rounds > 1
     start = time.time()
 
-    while time.time() - start < timeout:
-        try:
-            data, addr = sock.recvfrom(2048)
-            payload = json.loads(data.decode())
-            payload["seen_at"] = time.time()
-            devices.append(payload)
-        except socket.timeout:
+    for n in range(rounds):
+        if n == 0:
+            probe = encode_probe(window=window)
+        else:
+            bloom = BloomFilter.for_capacity(
+                len(seen), salt=random.getrandbits(32)
+            )
+            for node_id in seen:
+                bloom.add(str(node_id))
+            probe = encode_probe(window=window, seen=bloom)
+
+        sock.sendto(probe, address)
+        if legacy and n == 0:
+            sock.sendto(DISCOVERY_MAGIC.encode(), address)
+
+        round_end = start + round_time * (n + 1)
+        while True:
+            remaining = round_end - time.time()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                # buffer della taglia massima: una risposta V2 JSON lunga
+                # verrebbe troncata in silenzio e scartata come JSON invalido
+                data, addr = sock.recvfrom(MAX_DATAGRAM)
+                payload = decode_reply(data)
+                if not payload.get("ip"):
+                    payload["ip"] = addr[0]
+                if dedup:
+                    node_id = payload.get("node_id")
+                    if node_id in seen:
+                        continue
+                    seen.add(node_id)
+                payload["seen_at"] = time.time()
+                devices.append(payload)
+                if expected is not None and len(devices) >= expected:
+                    break
+            except socket.timeout:
+                break
+            except Exception:
+                continue
+        if expected is not None and len(devices) >= expected:
             break
-        except Exception:
-            continue
 
     return devices
@@ -1,23 +1,52 @@
-import json
 from engine.logging.router import get_logger
 import socket
 import threading
 import time
-from typing import Optional
+from typing import Optional, Union
+
+from ...security.identity.identity import get_identity_provider
+from .sharded import ShardedResponder, start_sharded_responder
+from .udp_discovery import serve_probes
+from .wire import ProbeHandler
 
 DISCOVERY_PORT = 7042
 DISCOVERY_MAGIC = "ICE_DISCOVERY_V2"
 logger = get_logger("icenet", "discovery", "ice.network.udp_responder")
 
 
-def start_udp_responder(identity: dict | None = None) -> Optional[threading.Thread]:
-    """Start a best-effort UDP responder for LAN discovery probes."""
+def start_udp_responder(
+    identity: dict | None = None,
+    workers: int = 1,
+    rate: Optional[float] = None,
+) -> Optional[Union[threading.Thread, ShardedResponder]]:
+    """Start a best-effort UDP responder for LAN discovery probes.
+
+    With workers > 1 or a per-source rate limit the probes are sharded
+    across SO_REUSEPORT sockets (see sharded.py) and the ShardedResponder
+    is returned instead of the thread.
 
+    Without an identity the cached local one is used, and the replies are
+    re-encoded whenever it changes (IdentityProvider.follow).
+    """
+
+    provider = None
     if not identity:
-        logger.warning("UDP responder identity missing; not starting responder")
-        return None
+        provider = get_identity_provider()
+        identity = provider.payload
+
+    if workers > 1 or rate is not None:
+        try:
+            responder = start_sharded_responder(identity, workers=workers, rate=rate)
+        except OSError as err:
+            logger.error("UDP responder failed to bind on %s: %s", DISCOVERY_PORT, err)
+            return None
+        if provider is not None:
+            provider.follow(responder.update_identity)
+        return responder
 
-    payload = json.dumps(identity).encode("utf-8")
+    handler = ProbeHandler(identity)
+    if provider is not None:
+        provider.follow(handler.update)
 
     def _loop():
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -29,17 +58,11 @@ def start_udp_responder(identity: dict | None = None) -> Optional[threading.Thre
 
         logger.info("UDP responder active on port %s", DISCOVERY_PORT)
 
-        while True:
-            try:
-                data, addr = sock.recvfrom(1024)
-                if not data:
-                    continue
-                msg = data.decode("utf-8", errors="ignore").strip()
-                if msg == DISCOVERY_MAGIC:
-                    sock.sendto(payload, addr)
-            except Exception as err:
-                logger.warning("UDP responder error: %s", err)
-                time.sleep(0.2)
+        def _on_error(err: Exception) -> None:
+            logger.warning("UDP responder error: %s", err)
+            time.sleep(0.2)
+
+        serve_probes(sock, handler, on_error=_on_error)
 
     thread = threading.Thread(target=_loop, name="udp-responder", daemon=True)
     thread.start()
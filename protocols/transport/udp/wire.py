@@ -0,0 +1,302 @@
+"""
+ICE discovery wire format.
+
+V2 (legacy): probe = b"ICE_DISCOVERY_V2", reply = json.dumps(identity).
+V3: header fisso + body binario length-prefixed.
+
+    header  : magic "ICE3" | version u8 | kind u8 | body_len u16
+    probe   : [window_ms u16 | bloom_k u8 | bloom_salt u32 | bloom bits]
+              (body vuoto = risposta immediata, nessun filtro)
+    reply   : role u8 | ipv4 4s | node_id | hostname | fingerprint
+              (stringhe: len u8 + utf-8); eventuali byte dopo fingerprint,
+              entro body_len, sono campi di revisioni successive e vengono
+              ignorati
+    announce: interval_ds u16 | <reply body>   (heartbeat multicast)
+    bye     : interval_ds u16 | <reply body>   (il nodo esce)
+
+Con window_ms > 0 il responder risponde dopo un ritardo casuale dentro
+la finestra, per non far arrivare centinaia di risposte nello stesso
+istante. Se il probe porta un Bloom filter, i nodi già presenti nel
+filtro non rispondono: il prober può ri-sondare solo i mancanti.
+
+Il probe V3 porta la versione massima supportata dal prober; il responder
+risponde con min(probe, propria). I probe V2 restano serviti in JSON
+finché tutta la flotta non è migrata; durante la migrazione i prober
+mandano entrambi i probe e un responder V3 ignora il probe V2 che segue
+un probe V3 dalla stessa sorgente (una sola risposta, quella binaria).
+"""
+from __future__ import annotations
+
+import json
+import random
+import socket
+import struct
+import time
+from typing import Dict, Optional, Tuple
+
+from .bloom import BloomFilter
+
+DISCOVERY_MAGIC_V2 = b"ICE_DISCOVERY_V2"
+MAGIC_V3 = b"ICE3"
+WIRE_VERSION = 3
+
+KIND_PROBE = 1
+KIND_REPLY = 2
+KIND_ANNOUNCE = 3
+KIND_BYE = 4
+
+HEADER = struct.Struct("!4sBBH")
+_PROBE_BODY = struct.Struct("!HBI")
+_REPLY_FIXED = struct.Struct("!B4s")
+
+_ROLES = {"client": 1, "host": 2}
+_ROLE_NAMES = {code: name for name, code in _ROLES.items()}
+
+_NO_IP = b"\x00\x00\x00\x00"
+_IDENTITY_MIN = _REPLY_FIXED.size + 3
+
+# Le risposte di uno stesso nodo sono byte-identiche tra un probe e l'altro:
+# il decode si fa una volta sola per pacchetto distinto.
+_DECODE_CACHE: Dict[bytes, Dict] = {}
+_DECODE_CACHE_MAX = 4096
+
+# Un probe V2 entro questa finestra da una sorgente che ha appena mandato
+# un probe V3 è il doppione di migrazione: non va risposto due volte.
+V2_SUPPRESS_WINDOW = 2.0
+_V3_SOURCES_MAX = 4096
+
+
+class WireError(ValueError):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Encoding
+# ---------------------------------------------------------------------------
+
+def _pack_str(value) -> bytes:
+    raw = str(value or "").encode("utf-8")
+    if len(raw) > 255:
+        raise WireError(f"field too long for V3 wire format: {len(raw)} bytes")
+    return bytes((len(raw),)) + raw
+
+
+def _pack_ip(ip: Optional[str]) -> bytes:
+    try:
+        return socket.inet_aton(ip) if ip else _NO_IP
+    except OSError:
+        return _NO_IP
+
+
+def encode_probe(
+    version: int = WIRE_VERSION,
+    window: float = 0.0,
+    seen: Optional[BloomFilter] = None,
+) -> bytes:
+    """
+    Probe V3. `window` in secondi (max ~65s), `seen` = nodi da escludere.
+    """
+    if not window and seen is None:
+        return HEADER.pack(MAGIC_V3, version, KIND_PROBE, 0)
+
+    window_ms = max(0, min(0xFFFF, int(window * 1000)))
+    if seen is None:
+        body = _PROBE_BODY.pack(window_ms, 0, 0)
+    else:
+        body = _PROBE_BODY.pack(window_ms, seen.k, seen.salt) + seen.to_bytes()
+    return HEADER.pack(MAGIC_V3, version, KIND_PROBE, len(body)) + body
+
+
+_PROBE_V3 = encode_probe()
+
+
+def _identity_body(identity: Dict) -> bytes:
+    role = identity.get("role")
+    role = getattr(role, "value", role)
+    return b"".join(
+        (
+            _REPLY_FIXED.pack(_ROLES.get(role, 0), _pack_ip(identity.get("ip"))),
+            _pack_str(identity.get("node_id")),
+            _pack_str(identity.get("hostname")),
+            _pack_str(identity.get("fingerprint")),
+        )
+    )
+
+
+def encode_reply(identity: Dict) -> bytes:
+    body = _identity_body(identity)
+    return HEADER.pack(MAGIC_V3, WIRE_VERSION, KIND_REPLY, len(body)) + body
+
+
+def encode_announce(identity: Dict, interval: float, bye: bool = False) -> bytes:
+    """Heartbeat (o bye) multicast; `interval` = prossimo annuncio atteso."""
+    interval_ds = max(0, min(0xFFFF, int(interval * 10)))
+    body = interval_ds.to_bytes(2, "big") + _identity_body(identity)
+    kind = KIND_BYE if bye else KIND_ANNOUNCE
+    return HEADER.pack(MAGIC_V3, WIRE_VERSION, kind, len(body)) + body
+
+
+# ---------------------------------------------------------------------------
+# Decoding
+# ---------------------------------------------------------------------------
+
+def parse_header(data: bytes) -> Optional[tuple[int, int, memoryview]]:
+    """(version, kind, body) per un pacchetto V3, None se non è V3."""
+    if len(data) < HEADER.size or data[:4] != MAGIC_V3:
+        return None
+    _, version, kind, length = HEADER.unpack_from(data)
+    body = memoryview(data)[HEADER.size:HEADER.size + length]
+    if len(body) != length:
+        raise WireError("truncated V3 packet")
+    return version, kind, body
+
+
+def decode_probe(data: bytes) -> Optional[Tuple[float, Optional[BloomFilter]]]:
+    """(window secondi, filtro già-visti) per un probe V3, None altrimenti."""
+    try:
+        parsed = parse_header(data)
+    except WireError:
+        return None
+    if parsed is None or parsed[1] != KIND_PROBE:
+        return None
+    body = parsed[2]
+    if len(body) < _PROBE_BODY.size:
+        return 0.0, None
+
+    window_ms, k, salt = _PROBE_BODY.unpack_from(body)
+    bits = body[_PROBE_BODY.size:]
+    seen = BloomFilter(bits, k, salt) if k and len(bits) else None
+    return window_ms / 1000.0, seen
+
+
+def _decode_identity(data: bytes, start: int) -> Dict:
+    """Body identity (role, ip, node_id, hostname, fingerprint) da `start`."""
+    cached = _DECODE_CACHE.get(data)
+    if cached is not None:
+        return dict(cached)
+
+    # slicing diretto sui bytes, niente memoryview/struct per campo
+    if len(data) < start + _IDENTITY_MIN:
+        raise WireError("malformed V3 identity")
+    end = HEADER.size + ((data[6] << 8) | data[7])
+    role = data[start]
+    ip = data[start + 1:start + 5]
+    try:
+        o = start + 6
+        n = data[o - 1]
+        node_id = data[o:o + n].decode()
+        o += n
+        n = data[o]
+        o += 1
+        hostname = data[o:o + n].decode()
+        o += n
+        n = data[o]
+        o += 1
+        fingerprint = data[o:o + n].decode()
+    except IndexError as err:
+        raise WireError("malformed V3 identity") from err
+    # byte oltre fingerprint (fino a body_len): campi di revisioni future
+    if o + n > end or end > len(data):
+        raise WireError("truncated V3 identity")
+
+    payload = {
+        "node_id": node_id,
+        "hostname": hostname,
+        "ip": socket.inet_ntoa(ip) if ip != _NO_IP else "",
+        "role": _ROLE_NAMES.get(role, ""),
+        "fingerprint": fingerprint,
+    }
+    if len(_DECODE_CACHE) >= _DECODE_CACHE_MAX:
+        _DECODE_CACHE.clear()
+    _DECODE_CACHE[bytes(data)] = payload
+    return dict(payload)
+
+
+def decode_reply(data: bytes) -> Dict:
+    """
+    Decodifica una risposta di discovery, V3 binaria o V2 JSON.
+    Solleva WireError / ValueError se il pacchetto non è valido.
+    """
+    if data[:4] != MAGIC_V3:
+        payload = json.loads(data)
+        if not isinstance(payload, dict):
+            raise WireError("V2 reply is not an object")
+        return payload
+    if len(data) < HEADER.size or data[5] != KIND_REPLY:
+        raise WireError("not a V3 reply")
+    return _decode_identity(data, HEADER.size)
+
+
+def is_announce(data: bytes) -> bool:
+    return (
+        len(data) >= HEADER.size
+        and data[:4] == MAGIC_V3
+        and data[5] in (KIND_ANNOUNCE, KIND_BYE)
+    )
+
+
+def decode_announce(data: bytes) -> Tuple[int, Dict, float]:
+    """(kind, identity, intervallo annunciato in secondi)."""
+    if not is_announce(data):
+        raise WireError("not a V3 announce")
+    interval = ((data[8] << 8) | data[9]) / 10.0
+    return data[5], _decode_identity(data, HEADER.size + 2), interval
+
+
+# ---------------------------------------------------------------------------
+# Responder side
+# ---------------------------------------------------------------------------
+
+class ProbeHandler:
+    """
+    Risposte pre-codificate per un'identity: i responder chiamano
+    respond(data) per ogni datagram e inviano la risposta dopo `delay`.
+    """
+
+    def __init__(self, identity: Dict) -> None:
+        # sorgente -> ultimo probe V3 (monotonic), per scartare il V2 doppione
+        self._v3_sources: Dict[tuple, float] = {}
+        self.update(identity)
+
+    def update(self, identity: Dict) -> None:
+        """Ricodifica le risposte per una nuova identity (es. cambio IP)."""
+        v2 = json.dumps(identity).encode("utf-8")
+        v3 = encode_reply(identity)
+        self.identity = identity
+        self.node_id = str(identity.get("node_id") or "")
+        self.v2, self.v3 = v2, v3
+
+    def _saw_v3(self, source: Optional[tuple]) -> None:
+        if source is None:
+            return
+        if len(self._v3_sources) >= _V3_SOURCES_MAX:
+            self._v3_sources.clear()
+        self._v3_sources[source] = time.monotonic()
+
+    def respond(
+        self, data: bytes, source: Optional[tuple] = None
+    ) -> Optional[Tuple[bytes, float]]:
+        """
+        (risposta, ritardo in secondi) oppure None se non va risposto.
+        `source` (indirizzo del prober) serve a riconoscere la coppia di
+        probe V3+V2 mandata durante la migrazione.
+        """
+        if data == _PROBE_V3:
+            self._saw_v3(source)
+            return self.v3, 0.0
+        if data[:4] == MAGIC_V3:
+            probe = decode_probe(data)
+            if probe is None:
+                return None
+            self._saw_v3(source)
+            window, seen = probe
+            if seen is not None and self.node_id in seen:
+                return None
+            # unica versione binaria per ora: min(probe, WIRE_VERSION) == 3
+            return self.v3, random.uniform(0.0, window) if window else 0.0
+        if data == DISCOVERY_MAGIC_V2 or data.strip() == DISCOVERY_MAGIC_V2:
+            seen_at = self._v3_sources.get(source) if source is not None else None
+            if seen_at is not None and time.monotonic() - seen_at < V2_SUPPRESS_WINDOW:
+                return None
+            return self.v2, 0.0
+        return None
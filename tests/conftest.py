@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Diversi moduli fissano i path sotto ~/.ice_studio all'import (audit,
+# pairing, snowball state): HOME temporanea prima di qualunque import,
+# così i test non toccano mai i file reali.
+os.environ["HOME"] = tempfile.mkdtemp(prefix="ice-tests-home-")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
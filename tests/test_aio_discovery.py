@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+from protocols.transport.udp.aio_discovery import discover_all, find_node, start_async_responder
+
+
+def _identity(node_id):
+    return {"node_id": node_id, "hostname": f"box-{node_id}", "ip": "", "role": "host", "fingerprint": "fp"}
+
+
+async def _with_responders(node_ids, probe):
+    transports = [
+        await start_async_responder(_identity(node_id), host="127.0.0.1", port=0)
+        for node_id in node_ids
+    ]
+    try:
+        return await probe([t.get_extra_info("sockname") for t in transports])
+    finally:
+        for transport in transports:
+            transport.close()
+
+
+def test_expected_count_ends_the_probe_early():
+    async def probe(addresses):
+        started = time.monotonic()
+        found = await discover_all(5.0, expected=1, address=addresses[0])
+        return found, time.monotonic() - started
+
+    found, elapsed = asyncio.run(_with_responders(["n1"], probe))
+    assert [n["node_id"] for n in found] == ["n1"]
+    # l'indirizzo mancante nella risposta è quello da cui è arrivata
+    assert found[0]["ip"] == "127.0.0.1"
+    assert elapsed < 1.0
+
+
+def test_find_node_returns_as_soon_as_it_answers():
+    async def probe(addresses):
+        return await find_node("n2", timeout=5.0, address=addresses[1])
+
+    payload = asyncio.run(_with_responders(["n1", "n2"], probe))
+    assert payload["node_id"] == "n2"
+
+
+def test_duplicate_replies_are_yielded_once():
+    async def probe(addresses):
+        # probe V3 + V2: il responder ne serve uno solo, il prober deduplica
+        return await discover_all(0.3, address=addresses[0])
+
+    found = asyncio.run(_with_responders(["n1"], probe))
+    assert [n["node_id"] for n in found] == ["n1"]
+
+
+def test_parallel_probes_share_the_loop():
+    async def probe(addresses):
+        return await asyncio.gather(*(
+            discover_all(2.0, expected=1, address=address) for address in addresses
+        ))
+
+    results = asyncio.run(_with_responders(["n1", "n2", "n3"], probe))
+    assert [[n["node_id"] for n in found] for found in results] == [["n1"], ["n2"], ["n3"]]
+
+
+def test_timeout_without_responders():
+    async def probe():
+        return await discover_all(0.1, address=("127.0.0.1", 9))
+
+    assert asyncio.run(probe()) == []
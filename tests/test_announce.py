@@ -0,0 +1,82 @@
+import pytest
+
+from protocols.transport.udp import announce
+from protocols.transport.udp.announce import AnnounceListener, Announcer
+from protocols.transport.udp.registry import DiscoveryRegistry
+from protocols.transport.udp.wire import KIND_ANNOUNCE, KIND_BYE
+
+
+@pytest.fixture
+def announcer():
+    a = Announcer({"node_id": "self", "ip": "10.0.0.1"}, min_interval=1.0, max_interval=30.0)
+    yield a
+    a.stop(bye=False)
+
+
+def test_pokes_are_rate_limited_per_backoff_period(announcer):
+    announcer.interval = 16.0
+    assert announcer.poke()
+    assert announcer.interval == announcer.min_interval
+    # un solo poke per il periodo di backoff in corso (16s)
+    assert not announcer.poke()
+    assert not announcer.poke()
+    assert announcer.pokes_dropped == 2
+
+    announcer._poke_holdoff = 0.0
+    assert announcer.poke()
+    assert announcer.poke(force=True)
+
+
+def test_only_new_peers_poke(announcer):
+    assert announcer.peer_added("n1")
+    announcer._poke_holdoff = 0.0
+    # lo stesso nodo che scade e ritorna non riaccelera gli annunci
+    assert not announcer.peer_added("n1")
+    assert not announcer.peer_added(None)
+    assert announcer.peer_added("n2")
+
+
+def test_follows_identity_changes(announcer):
+    class Provider:
+        payload = {"node_id": "self", "ip": "10.0.0.2"}
+        listeners = []
+
+        def follow(self, update):
+            self.listeners.append(update)
+            return lambda: self.listeners.remove(update)
+
+    provider = Provider()
+    announcer.follow_identity(provider)
+    assert announcer.identity["ip"] == "10.0.0.2"
+
+    announcer._poke_holdoff = float("inf")
+    provider.listeners[0]({"node_id": "self", "ip": "10.0.0.3"})
+    # un cambio di identity passa anche durante l'holdoff
+    assert announcer.identity["ip"] == "10.0.0.3"
+    assert announcer.interval == announcer.min_interval
+
+    announcer.stop(bye=False)
+    assert provider.listeners == []
+
+
+def test_listener_feeds_the_registry():
+    registry = DiscoveryRegistry(scan=None)
+    listener = AnnounceListener(registry, self_id="self")
+
+    listener(KIND_ANNOUNCE, {"node_id": "self"}, 1.0, ("10.0.0.1", 1))
+    listener(KIND_ANNOUNCE, {"node_id": "n1"}, 2.0, ("10.0.0.7", 1))
+    node = registry.get("n1")
+    assert node["ip"] == "10.0.0.7"
+    assert registry.get("self") is None
+
+    listener(KIND_BYE, {"node_id": "n1"}, 0.0, ("10.0.0.7", 1))
+    assert registry.get("n1") is None
+
+
+def test_bind_failure_is_raised(monkeypatch):
+    def busy(*args, **kwargs):
+        raise OSError(98, "Address already in use")
+
+    monkeypatch.setattr(announce, "start_udp_responder", busy)
+    with pytest.raises(OSError):
+        announce.start_announce_mode({"node_id": "self"})
@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from protocols.security import audit
+from protocols.security.audit import BLOCK, DROP_NEWEST, DROP_OLDEST, AuditSink
+
+
+@pytest.fixture
+def make_sink(tmp_path):
+    sinks = []
+
+    def make(**options):
+        sink = AuditSink(tmp_path / "audit", **options)
+        sinks.append(sink)
+        return sink
+
+    yield make
+    for sink in sinks:
+        sink.close()
+
+
+def _events(sink):
+    return [r["event"] for r in sink.query()]
+
+
+def test_events_reach_disk_in_batches(make_sink):
+    sink = make_sink(batch_size=8, flush_interval=5.0)
+    for i in range(20):
+        assert sink.submit({"ts": time.time(), "event": f"e{i}"})
+    assert sink.flush(2.0)
+    assert _events(sink) == [f"e{i}" for i in range(20)]
+    assert sink.stats() == {"enqueued": 20, "written": 20, "dropped": 0, "queued": 0}
+
+
+@pytest.mark.parametrize("policy, kept", [(DROP_OLDEST, ["e2", "e3"]), (DROP_NEWEST, ["e0", "e1"])])
+def test_full_buffer_applies_the_drop_policy(make_sink, policy, kept):
+    sink = make_sink(capacity=2, policy=policy)
+    # con la condition in mano il writer non può svuotare la coda
+    with sink._cond:
+        results = [sink.submit({"ts": 1.0, "event": f"e{i}"}) for i in range(4)]
+        assert [r["event"] for r in sink._queue] == kept
+    assert results == ([True] * 4 if policy == DROP_OLDEST else [True, True, False, False])
+    assert sink.flush(2.0)
+    assert _events(sink) == kept
+    assert sink.stats()["dropped"] == 2
+
+
+def test_blocking_policy_waits_for_the_writer(make_sink):
+    sink = make_sink(capacity=1, policy=BLOCK, block_timeout=1.0, flush_interval=5.0)
+    with sink._cond:
+        assert sink.submit({"ts": 1.0, "event": "e0"})
+        started = time.monotonic()
+        # wait() rilascia la condition: il writer, svegliato, libera il posto
+        assert sink.submit({"ts": 1.0, "event": "e1"})
+        assert time.monotonic() - started < 0.5
+    assert sink.flush(2.0)
+    assert _events(sink) == ["e0", "e1"]
+
+
+def test_blocking_policy_gives_up_after_the_timeout(make_sink, monkeypatch):
+    sink = make_sink(capacity=1, policy=BLOCK, block_timeout=0.02)
+    writing, release = threading.Event(), threading.Event()
+    append = sink.log.append
+
+    def slow_append(records):
+        writing.set()
+        release.wait(2.0)
+        append(records)
+
+    monkeypatch.setattr(sink.log, "append", slow_append)
+    sink.submit({"ts": 1.0, "event": "e0"})
+    assert writing.wait(2.0)
+    # writer fermo sul disco: e1 occupa la coda, e2 attende e rinuncia
+    assert sink.submit({"ts": 1.0, "event": "e1"})
+    assert not sink.submit({"ts": 1.0, "event": "e2"})
+    release.set()
+    assert sink.flush(2.0)
+    assert _events(sink) == ["e0", "e1"]
+    assert sink.stats()["dropped"] == 1
+
+
+def test_submit_after_close_is_dropped(make_sink):
+    sink = make_sink()
+    sink.submit({"ts": 1.0, "event": "before"})
+    sink.close()
+    assert not sink.submit({"ts": 1.0, "event": "after"})
+    assert sink.stats()["written"] == 1
+    assert sink.stats()["dropped"] == 1
+
+
+def test_unknown_policy_is_refused(tmp_path):
+    with pytest.raises(ValueError):
+        AuditSink(tmp_path, policy="spill")
+
+
+def test_audit_event_does_not_write_on_the_caller_thread(tmp_path, monkeypatch):
+    sink = audit.configure_audit(directory=tmp_path / "audit", flush_interval=5.0)
+    writers = set()
+    append = sink.log.append
+
+    def recording_append(records):
+        writers.add(threading.current_thread().name)
+        append(records)
+
+    monkeypatch.setattr(sink.log, "append", recording_append)
+    try:
+        audit.audit_event("sandbox.launch", {"node_id": "n1"})
+        records = list(audit.query_audit("sandbox.launch", node="n1"))
+    finally:
+        sink.close()
+    assert [r["details"] for r in records] == [{"node_id": "n1"}]
+    assert writers == {"ice-audit"}
@@ -0,0 +1,77 @@
+import pytest
+
+from protocols.snowball import capabilities
+from protocols.snowball.capabilities import CapabilityProber
+
+
+@pytest.fixture
+def host(monkeypatch):
+    state = {"now": 100.0, "stamp": ("dev", 1), "probes": 0, "checks": 0}
+
+    def probe(self):
+        state["probes"] += 1
+        return {"probe": state["probes"]}
+
+    def fingerprint(self):
+        state["checks"] += 1
+        return state["stamp"]
+
+    monkeypatch.setattr(capabilities.time, "monotonic", lambda: state["now"])
+    monkeypatch.setattr(CapabilityProber, "probe", probe)
+    monkeypatch.setattr(CapabilityProber, "_fingerprint", fingerprint)
+    return state
+
+
+def test_reads_between_checks_are_served_from_cache(host):
+    prober = CapabilityProber(ttl=30.0, check_interval=2.0)
+    first = prober.capabilities()
+    for _ in range(100):
+        assert prober.capabilities() is first
+    assert (host["probes"], host["checks"]) == (1, 1)
+
+
+def test_hotplug_invalidates_before_the_ttl(host):
+    prober = CapabilityProber(ttl=30.0, check_interval=2.0)
+    prober.capabilities()
+
+    host["now"] += 2.0
+    assert prober.capabilities() == {"probe": 1}
+    assert host["checks"] == 2
+
+    host["stamp"] = ("dev", 2)
+    host["now"] += 2.0
+    assert prober.capabilities() == {"probe": 2}
+
+
+def test_ttl_forces_a_new_probe(host):
+    prober = CapabilityProber(ttl=30.0, check_interval=2.0)
+    prober.capabilities()
+    host["now"] += 31.0
+    assert prober.capabilities() == {"probe": 2}
+
+    prober.invalidate()
+    assert prober.capabilities() == {"probe": 3}
+
+
+def test_memory_and_topology_come_from_procfs_and_sysfs(tmp_path, monkeypatch):
+    meminfo = tmp_path / "meminfo"
+    meminfo.write_text("MemTotal:       16384000 kB\nMemFree: 1 kB\nMemAvailable:    8192000 kB\n")
+    monkeypatch.setattr(capabilities, "MEMINFO", str(meminfo))
+    assert capabilities._memory() == {"ram_total_mb": 16000, "ram_available_mb": 8000}
+
+    # 2 socket x 2 core x 2 thread
+    for cpu in range(8):
+        topology = tmp_path / "cpu" / f"cpu{cpu}" / "topology"
+        topology.mkdir(parents=True)
+        (topology / "physical_package_id").write_text(f"{cpu // 4}\n")
+        (topology / "core_id").write_text(f"{(cpu // 2) % 2}\n")
+    monkeypatch.setattr(capabilities, "CPU_SYSFS", str(tmp_path / "cpu"))
+    topology = capabilities._cpu_topology()
+    assert (topology["cpu_sockets"], topology["cpu_cores"]) == (2, 4)
+
+
+def test_real_probe_reports_the_expected_keys():
+    caps = CapabilityProber().capabilities()
+    assert {"os", "cpu_count", "cpu_usable", "gpu_devices", "supports_gpu", "supports_cgroups"} <= caps.keys()
+    assert caps["cpu_usable"] <= caps["cpu_count"]
+    assert caps["supports_gpu"] == bool(caps["gpu_devices"])
@@ -0,0 +1,63 @@
+import os
+import shutil
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from protocols.snowball import cgroups
+from protocols.snowball.cgroups import CgroupManager
+
+
+@pytest.fixture
+def fake_cgroup(tmp_path, monkeypatch):
+    """Cartella che imita un cgroup v2 senza cgroup.kill (kernel < 5.14)."""
+    group = tmp_path / "sb-test"
+    group.mkdir()
+    (group / "cgroup.events").write_text("populated 0\nfrozen 0\n")
+    # cgroup.kill non scrivibile, come su un kernel che non lo espone
+    (group / "cgroup.kill").mkdir()
+    # su cgroupfs i file di controllo non impediscono rmdir
+    monkeypatch.setattr(cgroups, "os", SimpleNamespace(rmdir=shutil.rmtree, kill=os.kill))
+    return group
+
+
+def _populate(group, *pids):
+    (group / "cgroup.procs").write_text("".join(f"{pid}\n" for pid in pids))
+    (group / "cgroup.events").write_text("populated 1\nfrozen 0\n")
+
+
+def test_remove_without_cgroup_kill_kills_listed_pids(fake_cgroup, monkeypatch):
+    proc = subprocess.Popen(["sleep", "30"])
+    _populate(fake_cgroup, proc.pid)
+    real_kill = os.kill
+    killed = []
+
+    def kill(pid, sig):
+        killed.append(pid)
+        real_kill(pid, sig)
+        proc.wait(2.0)
+        # il kernel svuota il gruppo quando il processo esce
+        (fake_cgroup / "cgroup.procs").write_text("")
+        (fake_cgroup / "cgroup.events").write_text("populated 0\nfrozen 0\n")
+
+    monkeypatch.setattr(cgroups.os, "kill", kill)
+    assert CgroupManager(root=fake_cgroup.parent).remove(fake_cgroup)
+    assert killed == [proc.pid]
+    assert proc.returncode == -9
+    assert not fake_cgroup.exists()
+
+
+def test_remove_gives_up_when_the_group_stays_populated(fake_cgroup, monkeypatch):
+    _populate(fake_cgroup, 4242)
+    monkeypatch.setattr(cgroups.os, "kill", lambda pid, sig: None)
+
+    assert not CgroupManager(root=fake_cgroup.parent).remove(fake_cgroup, timeout=0.05)
+    assert fake_cgroup.exists()
+
+
+def test_empty_group_is_removed_directly(fake_cgroup):
+    (fake_cgroup / "cgroup.procs").write_text("")
+    assert CgroupManager(root=fake_cgroup.parent).remove(fake_cgroup)
+    assert not fake_cgroup.exists()
+
@@ -0,0 +1,98 @@
+import dataclasses
+import json
+import time
+
+import pytest
+
+from protocols.security.identity import identity as identity_module
+from protocols.security.identity.identity import IdentityProvider, NodeRole
+
+
+@pytest.fixture
+def network(monkeypatch):
+    state = {"hostname": "box-1", "ip": "10.0.0.5", "lookups": 0}
+
+    def local_ip():
+        state["lookups"] += 1
+        return state["ip"]
+
+    monkeypatch.setattr(identity_module.socket, "gethostname", lambda: state["hostname"])
+    monkeypatch.setattr(identity_module, "_local_ip", local_ip)
+    return state
+
+
+def test_identity_is_resolved_once_and_frozen(network):
+    provider = IdentityProvider(NodeRole.HOST)
+    first = provider.identity
+    for _ in range(10):
+        assert provider.identity is first
+    assert network["lookups"] == 1
+
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        first.ip = "10.0.0.6"
+
+
+def test_payload_matches_the_serialized_bytes(network):
+    provider = IdentityProvider(NodeRole.CLIENT)
+    payload = provider.payload
+    assert payload["role"] == "client" and payload["ip"] == "10.0.0.5"
+    assert json.loads(provider.payload_bytes) == payload
+
+    payload["ip"] = "tampered"
+    assert provider.payload["ip"] == "10.0.0.5"
+
+
+def test_refresh_notifies_followers_only_on_change(network):
+    provider = IdentityProvider()
+    seen = []
+    unfollow = provider.follow(seen.append)
+
+    assert not provider.refresh()
+    network["ip"] = "192.168.1.7"
+    assert provider.refresh()
+    assert provider.version == 2
+    assert [p["ip"] for p in seen] == ["192.168.1.7"]
+    assert json.loads(provider.payload_bytes)["ip"] == "192.168.1.7"
+
+    unfollow()
+    network["hostname"] = "box-2"
+    assert provider.refresh()
+    assert len(seen) == 1
+
+
+def test_failing_listener_does_not_block_the_others(network):
+    provider = IdentityProvider()
+    seen = []
+
+    def broken(identity):
+        raise RuntimeError("boom")
+
+    provider.subscribe(broken)
+    provider.subscribe(seen.append)
+    network["ip"] = "10.0.0.6"
+    assert provider.refresh()
+    assert [i.ip for i in seen] == ["10.0.0.6"]
+
+
+def test_background_refresh_follows_network_changes(network):
+    provider = IdentityProvider()
+    changed = []
+    provider.follow(changed.append)
+    network["ip"] = "10.9.9.9"
+    provider.start(interval=0.01)
+    try:
+        deadline = time.monotonic() + 2.0
+        while not changed and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        provider.stop()
+    assert changed and changed[0]["ip"] == "10.9.9.9"
+
+
+def test_shared_provider_per_role(network, monkeypatch):
+    monkeypatch.setattr(identity_module, "_PROVIDERS", {})
+    monkeypatch.setattr(IdentityProvider, "start", lambda self, interval=0: None)
+    host = identity_module.get_identity_provider(NodeRole.HOST)
+    assert identity_module.get_identity_provider("host") is host
+    assert identity_module.get_identity_provider(NodeRole.CLIENT) is not host
+    assert identity_module.get_local_identity(NodeRole.HOST) is host.identity
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from protocols.security.store import journal
+from protocols.security.store.journal import JournalStore
+
+
+def _store(path, **kwargs):
+    return JournalStore(path, key_field="id", durable=False, **kwargs)
+
+
+def _journal_lines(store):
+    return [json.loads(line) for line in store.journal_path.read_text().splitlines()]
+
+
+def test_journal_is_replayed_over_the_snapshot(tmp_path):
+    store = _store(tmp_path / "hosts.json")
+    store.put("a", {"id": "a", "ip": "10.0.0.1"})
+    store.put("b", {"id": "b"})
+    store.delete("b")
+    store.close()
+
+    fresh = _store(tmp_path / "hosts.json")
+    assert fresh.get("a") == {"id": "a", "ip": "10.0.0.1"}
+    assert "b" not in fresh and "b" in fresh.tombstones
+
+
+def test_compaction_keeps_tombstones(tmp_path):
+    store = _store(tmp_path / "hosts.json", tombstone_ttl=float("inf"))
+    store.put("a", {"id": "a"})
+    store.put("b", {"id": "b"})
+    store.delete("b", at=1000.0)
+    store.compact()
+
+    assert json.loads(store.path.read_text()) == {"a": {"id": "a"}}
+    assert _journal_lines(store) == [{"k": "b", "d": 1, "t": 1000.0}]
+    # le append successive vanno nel journal nuovo
+    store.put("c", {"id": "c"})
+    store.close()
+
+    fresh = _store(tmp_path / "hosts.json", tombstone_ttl=float("inf"))
+    assert sorted(k for k, _ in fresh.items()) == ["a", "c"]
+    assert fresh.tombstones == {"b": 1000.0}
+
+
+def test_crash_before_journal_swap_keeps_the_old_journal(tmp_path, monkeypatch):
+    store = _store(tmp_path / "hosts.json", tombstone_ttl=float("inf"))
+    store.put("a", {"id": "a"})
+    store.put("b", {"id": "b"})
+    store.delete("b", at=1000.0)
+    store.commit()
+    before = store.journal_path.read_text()
+
+    real_replace = journal.os.replace
+
+    def crash(src, dst):
+        if str(dst) == str(store.journal_path):
+            raise OSError("power loss")
+        real_replace(src, dst)
+
+    monkeypatch.setattr(journal.os, "replace", crash)
+    with pytest.raises(OSError):
+        store.compact()
+
+    # snapshot già nuovo, journal ancora intero: la revoca non è persa
+    assert store.journal_path.read_text() == before
+    monkeypatch.setattr(journal.os, "replace", real_replace)
+    fresh = _store(tmp_path / "hosts.json", tombstone_ttl=float("inf"))
+    assert [k for k, _ in fresh.items()] == ["a"]
+    assert fresh.tombstones == {"b": 1000.0}
+
+
+def test_expired_tombstones_are_dropped_on_compaction(tmp_path):
+    store = _store(tmp_path / "hosts.json", tombstone_ttl=60.0)
+    store.put("a", {"id": "a"})
+    store.delete("a", at=1.0)
+    store.compact()
+    assert store.tombstones == {}
+    assert store.journal_path.read_text() == ""
+
+
+def test_automatic_compaction_bounds_the_journal(tmp_path):
+    store = _store(tmp_path / "hosts.json", min_compact=8, compact_ratio=2.0)
+    for i in range(50):
+        store.put("a", {"id": "a", "n": i})
+    assert store.journal_records <= 8
+    store.close()
+    assert _store(tmp_path / "hosts.json").get("a")["n"] == 49
+
+
+def test_secondary_index_follows_updates(tmp_path):
+    store = _store(tmp_path / "hosts.json", indexes={"ip": lambda r: r.get("ip")})
+    store.put("a", {"id": "a", "ip": "10.0.0.1"})
+    store.put("b", {"id": "b", "ip": "10.0.0.1"})
+    assert sorted(store.lookup_keys("ip", "10.0.0.1")) == ["a", "b"]
+
+    store.put("a", {"id": "a", "ip": "10.0.0.2"})
+    store.delete("b")
+    assert store.lookup_keys("ip", "10.0.0.1") == []
+    assert store.lookup_one("ip", "10.0.0.2") == {"id": "a", "ip": "10.0.0.2"}
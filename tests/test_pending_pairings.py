@@ -0,0 +1,100 @@
+from dataclasses import dataclass
+
+import pytest
+
+from protocols.security.pairing import pending
+from protocols.security.pairing.pending import PendingPairings
+
+
+@dataclass
+class Request:
+    request_id: str
+    host_id: str
+    client_id: str = ""
+    host_hostname: str = ""
+    created_at: float = 0.0
+    expires_at: float = 0.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pending.time, "time", lambda: now[0])
+    return now
+
+
+def test_requests_expire_after_ttl(clock):
+    table = PendingPairings(ttl=60.0)
+    table.add(Request("r1", "h1"))
+    table.add(Request("r2", "h2"), ttl=120.0)
+
+    clock[0] += 61
+    assert "r1" not in table and "r2" in table
+    clock[0] += 60
+    assert len(table) == 0
+    assert table.expired == 2
+
+
+def test_same_pair_renews_instead_of_duplicating(clock):
+    table = PendingPairings(ttl=60.0)
+    first, created = table.add(Request("r1", "h1", host_hostname="box"))
+    assert created
+
+    clock[0] += 50
+    again, created = table.add(Request("r2", "h1", host_hostname="box-renamed"))
+    assert not created and again is first
+    assert first.host_hostname == "box-renamed"
+    assert [r.request_id for r in table.values()] == ["r1"]
+
+    # il rinnovo sposta la scadenza: la entry vecchia dell'heap è ignorata
+    clock[0] += 50
+    assert table.find("h1") is first
+    clock[0] += 11
+    assert table.find("h1") is None
+
+    # client diverso, stesso host: richiesta distinta
+    table.add(Request("r3", "h1", client_id="c1"))
+    table.add(Request("r4", "h1", client_id="c2"))
+    assert len(table) == 2
+
+
+def test_full_table_evicts_the_request_closest_to_expiry(clock):
+    table = PendingPairings(ttl=60.0, max_pending=3)
+    table.add(Request("r1", "h1"), ttl=10.0)
+    table.add(Request("r2", "h2"), ttl=30.0)
+    table.add(Request("r3", "h3"), ttl=20.0)
+    table.add(Request("r4", "h4"))
+    table.add(Request("r5", "h5"))
+
+    assert sorted(r.request_id for r in table.values()) == ["r2", "r4", "r5"]
+    assert table.evicted == 2
+
+
+def test_retired_ids_are_remembered_and_bounded(clock):
+    table = PendingPairings(max_retired=2)
+    for i in range(3):
+        table.add(Request(f"r{i}", f"h{i}"))
+        assert table.retire(f"r{i}").request_id == f"r{i}"
+
+    assert table.retire("r2") is None
+    assert not table.is_retired("r0")
+    assert table.is_retired("r1") and table.is_retired("r2")
+    assert len(table) == 0
+
+
+def test_discard_frees_the_pair(clock):
+    table = PendingPairings()
+    table.add(Request("r1", "h1"))
+    assert table.discard("r1")
+    assert not table.discard("r1")
+    _, created = table.add(Request("r2", "h1"))
+    assert created and not table.is_retired("r1")
+
+
+def test_renewal_storm_keeps_the_heap_bounded(clock):
+    table = PendingPairings(max_pending=4)
+    for i in range(1000):
+        clock[0] += 0.01
+        table.add(Request(f"r{i}", "h1"))
+    assert len(table) == 1
+    assert len(table._expiry) <= 4 * 4 + 1
@@ -0,0 +1,96 @@
+import threading
+
+from protocols.transport.udp.registry import (
+    NODE_ADDED, NODE_EXPIRED, NODE_UPDATED, DiscoveryRegistry,
+)
+
+
+def _registry(**kwargs):
+    registry = DiscoveryRegistry(scan=None, **kwargs)
+    events = []
+    registry.subscribe(lambda event, payload: events.append((event, payload["node_id"])))
+    return registry, events
+
+
+def test_ingest_reports_added_then_updated_only_on_change():
+    registry, events = _registry(ttl=30.0)
+    assert registry.ingest({"node_id": "n1", "ip": "10.0.0.1"}, seen_at=100.0) == NODE_ADDED
+    # stessa identity: rinnova il ttl senza evento
+    assert registry.ingest({"node_id": "n1", "ip": "10.0.0.1"}, seen_at=110.0) is None
+    assert registry.ingest({"node_id": "n1", "ip": "10.0.0.2"}, seen_at=120.0) == NODE_UPDATED
+    assert registry.ingest({"role": "host"}) is None
+    assert events == [(NODE_ADDED, "n1"), (NODE_UPDATED, "n1")]
+
+
+def test_nodes_expire_after_their_ttl():
+    registry, events = _registry(ttl=30.0)
+    registry.ingest({"node_id": "n1"}, seen_at=100.0)
+    registry.ingest({"node_id": "n2"}, seen_at=100.0, ttl=90.0)
+
+    assert registry.evict(now=129.0) == []
+    assert registry.evict(now=131.0) == ["n1"]
+    assert registry.evict(now=191.0) == ["n2"]
+    assert events[-2:] == [(NODE_EXPIRED, "n1"), (NODE_EXPIRED, "n2")]
+    assert len(registry) == 0
+
+
+def test_expired_nodes_are_hidden_before_eviction():
+    registry, _ = _registry(ttl=30.0)
+    registry.ingest({"node_id": "old"}, seen_at=1.0)
+    registry.ingest({"node_id": "fresh", "ip": "10.0.0.9"})
+
+    assert registry.get("old") is None
+    assert [n["node_id"] for n in registry.nodes()] == ["fresh"]
+    assert registry.locate("fresh") == "10.0.0.9"
+    assert len(registry) == 2
+
+
+def test_forget_notifies_once():
+    registry, events = _registry()
+    registry.ingest({"node_id": "n1"})
+    assert registry.forget("n1")
+    assert not registry.forget("n1")
+    assert events == [(NODE_ADDED, "n1"), (NODE_EXPIRED, "n1")]
+
+
+def test_failing_listener_does_not_block_the_others():
+    registry, events = _registry()
+
+    def broken(event, payload):
+        raise RuntimeError("boom")
+
+    unsubscribe = registry.subscribe(broken)
+    registry.ingest({"node_id": "n1"})
+    unsubscribe()
+    assert events == [(NODE_ADDED, "n1")]
+
+
+def test_background_refresh_uses_the_scan():
+    scans = threading.Event()
+
+    def scan(timeout):
+        scans.set()
+        return [{"node_id": "n1", "ip": "10.0.0.1"}]
+
+    registry = DiscoveryRegistry(scan=scan, refresh_interval=60.0, probe_timeout=0.1)
+    registry.start()
+    try:
+        assert registry.wait_ready(2.0)
+        assert scans.is_set()
+        assert registry.locate("n1") == "10.0.0.1"
+    finally:
+        registry.stop()
+    assert not registry.running
+
+
+def test_wait_ready_survives_a_failing_scan():
+    def scan(timeout):
+        raise OSError("no network")
+
+    registry = DiscoveryRegistry(scan=scan, refresh_interval=60.0, probe_timeout=0.1)
+    registry.start()
+    try:
+        assert registry.wait_ready(2.0)
+        assert registry.nodes() == []
+    finally:
+        registry.stop()
@@ -0,0 +1,152 @@
+import sys
+import threading
+
+import pytest
+
+from protocols.snowball.models import (
+    GRANTED,
+    PARTIAL,
+    QUEUED,
+    REJECTED,
+    RELEASED,
+    ResourceRequest,
+)
+from protocols.snowball.resources import HostCapacity, ResourceController
+
+
+@pytest.fixture
+def controller():
+    # 2 core, 1 GB, niente oversubscription: numeri facili da seguire
+    return ResourceController(
+        capacity=HostCapacity(cpu_percent=200, ram_mb=1024),
+        cpu_oversubscription=1.0,
+        ram_oversubscription=1.0,
+        max_queue=1,
+    )
+
+
+def test_grant_status_sequence(controller):
+    full = controller.grant(ResourceRequest(cpu_percent=100, ram_mb=512))
+    assert full.status == GRANTED and full.active
+
+    partial = controller.grant(ResourceRequest(cpu_percent=150, ram_mb=600))
+    assert partial.status == PARTIAL
+    assert (partial.cpu_percent, partial.ram_mb) == (100, 512)
+
+    queued = controller.grant(ResourceRequest(cpu_percent=100, ram_mb=100))
+    assert queued.status == QUEUED and not queued.active
+    assert (queued.cpu_percent, queued.ram_mb) == (0, 0)
+
+    rejected = controller.grant(ResourceRequest(cpu_percent=100, ram_mb=100))
+    assert rejected.status == REJECTED and not rejected.active
+
+
+def test_release_admits_the_queue(controller):
+    first = controller.grant(ResourceRequest(cpu_percent=200, ram_mb=1024))
+    queued = controller.grant(ResourceRequest(cpu_percent=100, ram_mb=256))
+    admitted = []
+    controller.subscribe(admitted.append)
+
+    assert not controller.wait(queued, timeout=0.01)
+    threading.Timer(0.05, controller.release, (first.grant_id,)).start()
+    assert controller.wait(queued, timeout=2.0)
+
+    assert queued.status == GRANTED
+    assert admitted == [queued]
+    assert first.status == RELEASED
+    assert controller.available()["cpu_percent"] == 100
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="sandbox is Linux-only")
+def test_sandbox_refuses_inactive_grants(controller):
+    from protocols.snowball.sandbox import SandboxManager
+
+    controller.grant(ResourceRequest(cpu_percent=200, ram_mb=1024))
+    queued = controller.grant(ResourceRequest(cpu_percent=100, ram_mb=256))
+    rejected = controller.grant(ResourceRequest(cpu_percent=100, ram_mb=256))
+    sandbox = SandboxManager(controller=controller)
+
+    for grant in (queued, rejected):
+        with pytest.raises(RuntimeError, match="not active"):
+            sandbox.launch([sys.executable, "-c", "pass"], grant)
+    with pytest.raises(RuntimeError, match="not active"):
+        sandbox.launch([sys.executable, "-c", "pass"], queued, wait=0.01)
+
+
+def test_owner_reconnect_reuses_or_replaces_its_grant(controller):
+    request = ResourceRequest(cpu_percent=100, ram_mb=512)
+    first = controller.grant(request, owner="node-1")
+    assert controller.grant(request, owner="node-1") is first
+
+    bigger = controller.grant(ResourceRequest(cpu_percent=200, ram_mb=1024), owner="node-1")
+    assert first.status == RELEASED and bigger.status == GRANTED
+    assert controller.available()["active"] == 1
+    assert controller.owned_by("node-1") is bigger
+
+    assert controller.release_owner("node-1")
+    assert controller.available()["cpu_percent"] == 200
+
+
+def test_unclaimed_grants_expire(controller):
+    controller.lease_seconds = 30
+    held = controller.grant(ResourceRequest(cpu_percent=200, ram_mb=1024), owner="gone")
+    queued = controller.grant(ResourceRequest(cpu_percent=100, ram_mb=256))
+
+    controller.expire(now=held.expires_at)
+    assert held.status == RELEASED and controller.owned_by("gone") is None
+    assert queued.status == GRANTED
+
+    claimed = controller.grant(ResourceRequest(cpu_percent=100, ram_mb=256))
+
+    assert controller.claim(claimed.grant_id)
+    assert claimed.expires_at is None
+    controller.expire(now=queued.expires_at + 3600)
+    assert queued.status == RELEASED and claimed.status == GRANTED
+    assert controller.available()["cpu_percent"] == 100
+
+
+def test_agent_hands_capacity_back_on_reconnect_and_release(monkeypatch):
+    from protocols.snowball import agent as agent_module
+    from protocols.snowball import pairing as pairing_module
+
+    monkeypatch.setattr(pairing_module, "request_user_approval", lambda *args: True)
+    agent = agent_module.SnowballAgent()
+    agent.resources = agent.sandbox.controller = ResourceController(
+        capacity=HostCapacity(cpu_percent=100, ram_mb=512),
+        cpu_oversubscription=1.0,
+        max_queue=1,
+    )
+
+    request = ResourceRequest(cpu_percent=100, ram_mb=512)
+    statuses = [
+        agent.accept_connection("node-1", "box", "10.0.0.5", request)
+        for _ in range(3)
+    ]
+    # tre riconnessioni dello stesso nodo: sempre la stessa grant
+    assert [s["grant_status"] for s in statuses] == [GRANTED] * 3
+    assert len({s["resource_grant"].grant_id for s in statuses}) == 1
+
+    other = agent.accept_connection("node-2", "box2", "10.0.0.6", request)
+    assert other["grant_status"] == QUEUED
+
+    assert agent.disconnect("node-1")
+    assert other["resource_grant"].status == GRANTED
+    with pytest.raises(PermissionError):
+        agent.launch("node-1", [sys.executable, "-c", "pass"])
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="sandbox is Linux-only")
+def test_sandbox_releases_the_grant_when_the_process_exits(controller, monkeypatch):
+    from protocols.snowball.sandbox import SandboxManager
+
+    sandbox = SandboxManager(controller=controller)
+    monkeypatch.setattr(sandbox, "uses_cgroups", lambda: False)
+    monkeypatch.setattr(sandbox, "_wrapper", lambda resources: [])
+    grant = controller.grant(ResourceRequest(cpu_percent=200, ram_mb=1024))
+
+    handle = sandbox.launch([sys.executable, "-c", "pass"], grant)
+    assert grant.expires_at is None
+    handle.process.wait()
+    assert [h.pid for h in sandbox.reap()] == [handle.pid]
+    assert grant.status == RELEASED
+    assert controller.available()["cpu_percent"] == 200
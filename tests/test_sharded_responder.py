@@ -0,0 +1,71 @@
+import pytest
+
+from protocols.transport.udp import sharded
+from protocols.transport.udp import udp_discovery as discovery
+from protocols.transport.udp.sharded import ShardedResponder, SourceLimiter
+
+IDENTITY = {"node_id": "node-1", "hostname": "box-1", "ip": "", "role": "host", "fingerprint": "fp"}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sharded.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_burst_then_steady_rate_per_source(clock):
+    limiter = SourceLimiter(rate=2.0, burst=3.0)
+    a, a_other_port, b = ("10.0.0.1", 1), ("10.0.0.1", 2), ("10.0.0.2", 1)
+
+    assert [limiter.allow(a) for _ in range(3)] == [True] * 3
+    # stesso IP, porta diversa: stesso bucket
+    assert not limiter.allow(a_other_port)
+    assert limiter.allow(b)
+
+    clock[0] += 0.5
+    assert limiter.allow(a)
+    assert not limiter.allow(a)
+
+
+def test_global_bucket_caps_spoofed_sources(clock):
+    limiter = SourceLimiter(rate=10.0, burst=10.0, global_rate=2.0)
+    results = [limiter.allow((f"10.0.0.{i}", 1)) for i in range(4)]
+    assert results == [True, True, False, False]
+
+    # il token per sorgente non viene consumato da un probe rifiutato
+    clock[0] += 1.0
+    assert limiter.allow(("10.0.0.3", 1))
+    assert limiter._buckets["10.0.0.3"][0] == 9.0
+
+
+def test_source_table_is_bounded(clock):
+    limiter = SourceLimiter(rate=1.0, burst=2.0, max_sources=4)
+    for i in range(4):
+        limiter.allow((f"10.0.0.{i}", 1))
+    clock[0] += 0.5
+    limiter.allow(("10.0.1.1", 1))
+    # nessun bucket inattivo abbastanza: la tabella viene azzerata
+    assert len(limiter) == 1
+
+    for i in range(3):
+        limiter.allow((f"10.0.2.{i}", 1))
+    clock[0] += 2.0
+    limiter.allow(("10.0.3.1", 1))
+    assert len(limiter) == 1 and "10.0.3.1" in limiter._buckets
+
+
+def test_workers_answer_probes_and_enforce_the_limit():
+    responder = ShardedResponder(IDENTITY, workers=2, host="127.0.0.1", port=0, rate=0.001, burst=1.0)
+    responder.start()
+    try:
+        address = ("127.0.0.1", responder.port)
+        found = discovery.udp_discovery(timeout=2.0, expected=1, legacy=False, address=address)
+        assert [n["node_id"] for n in found] == ["node-1"]
+        # stessa sorgente, bucket vuoto: nessuna risposta
+        assert discovery.udp_discovery(timeout=0.3, legacy=False, address=address) == []
+        stats = responder.stats()
+    finally:
+        responder.stop()
+    assert 1 <= stats["workers"] <= 2
+    assert (stats["served"], stats["limited"], stats["sources"]) == (1, 1, 1)
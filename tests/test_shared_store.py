@@ -0,0 +1,110 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from protocols.security.store.shared import HEADER, SharedJournalStore
+from protocols.security.store.trust import SharedTrustStore
+
+fcntl = pytest.importorskip("fcntl")
+
+
+def _journal(path):
+    return path.with_name(path.name + ".journal")
+
+
+def test_writes_visible_to_other_instances(tmp_path):
+    path = tmp_path / "hosts.json"
+    writer = SharedTrustStore(path)
+    reader = SharedTrustStore(path)
+
+    writer.trust("h1", ip="10.0.0.1")
+    assert reader.get("h1").ip == "10.0.0.1"
+
+    writer.delete("h1")
+    assert "h1" not in reader
+    assert "h1" in reader.tombstones
+
+
+def test_unpublished_tail_is_discarded(tmp_path):
+    path = tmp_path / "hosts.json"
+    store = SharedTrustStore(path)
+    store.trust("h1")
+
+    # writer morto dopo l'append e prima di _publish()
+    with open(_journal(path), "ab") as fh:
+        fh.write(b'{"k":"ghost","v":{"host_id":"ghost"}}\n')
+
+    store.trust("h2")
+    fresh = SharedTrustStore(path)
+    assert sorted(fresh.data) == ["h1", "h2"]
+
+
+def test_short_journal_after_compaction_crash_is_not_padded(tmp_path):
+    path = tmp_path / "hosts.json"
+    store = SharedTrustStore(path)
+    for host_id in ("h1", "h2", "h3"):
+        store.trust(host_id)
+
+    # crash tra il rename del journal in compact() e _publish(): snapshot
+    # nuovo, journal vuoto, header ancora con la vecchia dimensione
+    records = [host.to_record() for host in store.data.values()]
+    path.write_text(json.dumps(records))
+    _journal(path).write_bytes(b"")
+
+    survivor = SharedTrustStore(path)
+    assert sorted(survivor.data) == ["h1", "h2", "h3"]
+
+    survivor.trust("h4")
+    raw = _journal(path).read_bytes()
+    assert b"\0" not in raw
+
+    reloaded = SharedTrustStore(path)
+    assert sorted(reloaded.data) == ["h1", "h2", "h3", "h4"]
+    # l'header ripubblicato corrisponde al journal reale
+    assert HEADER.unpack_from(reloaded._header, 0)[3] == len(raw)
+    # anche chi aveva la vista vecchia si riallinea
+    assert sorted(k for k, _ in store.items()) == ["h1", "h2", "h3", "h4"]
+
+
+def test_compaction_keeps_tombstones_and_readers_follow(tmp_path):
+    path = tmp_path / "hosts.json"
+    store = SharedTrustStore(path)
+    reader = SharedTrustStore(path)
+    store.trust("h1")
+    store.trust("h2")
+    store.delete("h1")
+    store.compact()
+
+    store.trust("h3")
+    assert sorted(k for k, _ in reader.items()) == ["h2", "h3"]
+
+    reopened = SharedTrustStore(path)
+    assert "h1" in reopened.tombstones
+    assert sorted(reopened.data) == ["h2", "h3"]
+
+
+def _writer(path, prefix, count):
+    store = SharedJournalStore(path)
+    for i in range(count):
+        store.put(f"{prefix}-{i}", {"n": i}, sync=False)
+    store.commit()
+    store.close()
+
+
+def test_concurrent_writer_processes(tmp_path):
+    path = tmp_path / "shared.json"
+    SharedJournalStore(path).close()
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_writer, args=(path, f"w{n}", 200)) for n in range(3)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join(30)
+        assert proc.exitcode == 0
+
+    store = SharedJournalStore(path)
+    assert len(store) == 600
+    assert store.get("w2-199") == {"n": 199}
+    assert os.path.getsize(_journal(path)) == HEADER.unpack_from(store._header, 0)[3]
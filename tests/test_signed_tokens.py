@@ -0,0 +1,87 @@
+import time
+
+from protocols.security.tokens.signed import (
+    Keyring, RevocationList, SigningKey, issue_signed_token, revoke_signed_token,
+    verify_signed_token,
+)
+
+
+def _keyring(*key_ids, keep=3):
+    return Keyring([SigningKey.generate(k) for k in key_ids], keep=keep)
+
+
+def test_token_verifies_on_another_node_with_the_same_keyring():
+    issuer = _keyring("k1")
+    other = Keyring([issuer.get("k1")])
+    token = issue_signed_token(issuer, "pairing", ttl_seconds=60, issuer="node-a")
+
+    verified = verify_signed_token(other, token.token, scope="pairing")
+    assert verified is not None
+    assert (verified.token_id, verified.issuer, verified.key_id) == (token.token_id, "node-a", "k1")
+    assert verify_signed_token(other, token.token, scope="admin") is None
+
+
+def test_tampered_or_foreign_tokens_are_rejected():
+    keyring = _keyring("k1")
+    token = issue_signed_token(keyring, "pairing").token
+    prefix, key_id, payload, signature = token.split(".")
+
+    forged = issue_signed_token(_keyring("k1"), "pairing").token
+    assert verify_signed_token(keyring, forged) is None
+    assert verify_signed_token(keyring, f"{prefix}.{key_id}.{payload}x.{signature}") is None
+    assert verify_signed_token(keyring, f"{prefix}.nope.{payload}.{signature}") is None
+    assert verify_signed_token(keyring, f"ice0.{key_id}.{payload}.{signature}") is None
+    assert verify_signed_token(keyring, "not-a-token") is None
+
+
+def test_expired_tokens_are_rejected_even_from_the_cache():
+    keyring = _keyring("k1")
+    token = issue_signed_token(keyring, "pairing", ttl_seconds=60)
+    assert verify_signed_token(keyring, token.token) is not None
+    assert verify_signed_token(keyring, token.token, now=token.expires_at) is None
+
+
+def test_rotation_keeps_old_keys_for_verification():
+    keyring = _keyring("k1", keep=2)
+    old = issue_signed_token(keyring, "pairing")
+    keyring.rotate(SigningKey.generate("k2"))
+
+    new = issue_signed_token(keyring, "pairing")
+    assert new.key_id == "k2"
+    assert verify_signed_token(keyring, old.token) is not None
+
+    # oltre `keep` la chiave più vecchia esce, con i suoi token in cache
+    keyring.rotate(SigningKey.generate("k3"))
+    assert keyring.key_ids() == ["k2", "k3"]
+    assert verify_signed_token(keyring, old.token) is None
+    assert verify_signed_token(keyring, new.token) is not None
+
+
+def test_revocation_is_shared_and_pruned_after_expiry():
+    keyring = _keyring("k1")
+    token = issue_signed_token(keyring, "pairing", ttl_seconds=60)
+    local, remote = RevocationList(), RevocationList()
+
+    revoke_signed_token(local, token)
+    assert verify_signed_token(keyring, token.token, revocations=local) is None
+    remote.merge(local.export())
+    assert verify_signed_token(keyring, token.token, revocations=remote) is None
+
+    assert remote.prune(now=token.expires_at - 1) == 0
+    assert remote.prune(now=token.expires_at) == 1
+    assert len(remote) == 0
+
+
+def test_revocations_prune_themselves_on_write():
+    revocations = RevocationList(prune_interval=0.0)
+    revocations.revoke("old", time.time() - 1)
+    revocations.revoke("new", time.time() + 60)
+    assert revocations.export().keys() == {"new"}
+
+
+def test_verified_cache_is_bounded():
+    keyring = Keyring([SigningKey.generate("k1")], cache_size=2)
+    tokens = [issue_signed_token(keyring, "s").token for _ in range(3)]
+    for token in tokens:
+        assert verify_signed_token(keyring, token) is not None
+    assert list(keyring._verified) == tokens[1:]
@@ -0,0 +1,24 @@
+from protocols.transport.udp.simulator import simulate
+
+
+def test_fleet_is_found_through_the_responder_loop():
+    report = simulate(300, timeout=0.6, window=0.2, rounds=2, seed=1)
+    assert report.completeness == 1.0
+    assert report.stats.overflow == report.stats.truncated == 0
+    # secondo round: tutti già nel Bloom filter, nessuno risponde di nuovo
+    assert report.responders["served"] == 300
+    assert report.responders["dropped"] == 300
+    assert report.latency_ms["max"] < 600
+
+
+def test_rate_limited_responders_are_counted():
+    report = simulate(20, timeout=0.6, rounds=3, rate=1.0, seed=2)
+    assert report.completeness == 1.0
+    assert report.responders["served"] == 20
+    assert report.responders["limited"] == 40
+
+
+def test_large_legacy_replies_are_not_truncated():
+    report = simulate(20, timeout=0.3, legacy=True, reply_size=lambda rng: 3000, seed=3)
+    assert report.completeness == 1.0
+    assert report.stats.truncated == 0
@@ -0,0 +1,79 @@
+import pytest
+
+from protocols.snowball import agent as agent_module
+from protocols.snowball import pairing as pairing_module
+from protocols.snowball import state as state_module
+from protocols.snowball.security import compute_fingerprint
+
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch):
+    monkeypatch.setattr(state_module, "STATE_PATH", tmp_path / "snowball_state.json")
+    return agent_module.SnowballAgent()
+
+
+def _answer(monkeypatch, answer):
+    asked = []
+
+    def approval(hostname, ip, fingerprint):
+        asked.append(hostname)
+        if isinstance(answer, BaseException):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(pairing_module, "request_user_approval", approval)
+    return asked
+
+
+def test_bulk_enrolled_nodes_are_admitted(agent, monkeypatch):
+    asked = _answer(monkeypatch, False)
+    results = agent.trust_hosts([
+        {"node_id": "n1", "hostname": "box1", "ip": "10.0.0.1"},
+        {"node_id": "n2", "ip": "10.0.0.2"},
+        {"node_id": "n3", "hostname": "box3", "fingerprint": "bogus"},
+        {"hostname": "box4"},
+    ])
+
+    assert [r["ok"] for r in results] == [True, False, False, False]
+    assert [r.get("error") for r in results[1:]] == [
+        "missing hostname", "fingerprint mismatch", "missing node_id",
+    ]
+    assert agent.pairing.handle_pairing("n1", "box1", "10.0.0.1")
+    assert asked == []
+    assert not agent.state.is_trusted("n2")
+
+
+def test_rejected_request_cannot_be_bulk_approved(agent, monkeypatch):
+    _answer(monkeypatch, EOFError())
+    assert not agent.pairing.handle_pairing("n1", "box1", "10.0.0.1")
+    pending = agent.state.pairings.find("n1")
+    assert pending is not None
+
+    # l'utente ora risponde di no: la richiesta in attesa sparisce
+    _answer(monkeypatch, False)
+    assert not agent.pairing.handle_pairing("n1", "box1", "10.0.0.1")
+    assert agent.state.pairings.find("n1") is None
+    assert agent.approve_pairings([pending.request_id]) == {
+        pending.request_id: {"ok": False, "status": "unknown"},
+    }
+    assert not agent.state.is_trusted("n1")
+
+
+def test_headless_requests_are_approved_in_bulk(agent, monkeypatch):
+    _answer(monkeypatch, EOFError())
+    for i in range(3):
+        agent.pairing.handle_pairing(f"n{i}", f"box{i}", f"10.0.0.{i}")
+    # una nuova richiesta dello stesso nodo rinnova quella pendente
+    agent.pairing.handle_pairing("n0", "box0-renamed", "10.0.0.9")
+    ids = [p.request_id for p in agent.state.pairings.values()]
+    assert len(ids) == 3
+
+    results = agent.approve_pairings(ids + ["missing"])
+    assert [results[i]["status"] for i in ids] == ["approved"] * 3
+    assert results["missing"]["ok"] is False
+    assert agent.approve_pairings(ids[:1])[ids[0]]["status"] == "already_approved"
+
+    host = agent.state.trusted_hosts["n0"]
+    assert (host.hostname, host.ip) == ("box0-renamed", "10.0.0.9")
+    assert host.fingerprint == compute_fingerprint("n0", "box0-renamed")
+    assert agent.pairing.handle_pairing("n0", "box0-renamed", "10.0.0.9")
@@ -0,0 +1,153 @@
+import socket
+import time
+
+import pytest
+
+from protocols.security.store import sync
+from protocols.security.store.trust import TrustStore
+
+SECRET = b"test-secret"
+
+
+@pytest.fixture
+def stores(tmp_path):
+    return TrustStore(tmp_path / "a.json"), TrustStore(tmp_path / "b.json")
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def _serve(store, secret=SECRET):
+        server = sync.TrustSyncServer({"hosts": store}, secret=secret).start()
+        servers.append(server)
+        return server
+
+    yield _serve
+    for server in servers:
+        server.stop()
+
+
+def _sync(server, store, secret=SECRET):
+    report = sync.sync_stores(server.address, {"hosts": store}, secret=secret)
+    return report.results[0]
+
+
+def _tick():
+    # updated_at distinti anche con clock a bassa risoluzione
+    time.sleep(0.01)
+
+
+def test_two_way_merge_transfers_only_differences(stores, serve):
+    a, b = stores
+    for i in range(500):
+        a.trust(f"h{i}", ip=f"10.0.{i // 250}.{i % 250}", sync=False)
+    a.commit()
+    b.trust("only-b")
+    server = serve(a)
+
+    first = _sync(server, b)
+    assert (first.pulled, first.pushed) == (500, 1)
+    assert sorted(a.data) == sorted(b.data)
+
+    again = _sync(server, b)
+    assert (again.pulled, again.pushed, again.round_trips) == (0, 0, 1)
+
+
+def test_newer_update_wins_over_original_pairing(stores, serve):
+    a, b = stores
+    a.trust("h1", ip="10.0.0.1")
+    server = serve(a)
+    _sync(server, b)
+
+    _tick()
+    b.trust("h1", ip="10.0.0.99")  # paired_at invariato, updated_at avanza
+    assert b.get("h1").paired_at == a.get("h1").paired_at
+
+    result = _sync(server, b)
+    assert result.conflicts == 1
+    assert a.get("h1").ip == "10.0.0.99"
+
+
+def test_revocation_is_not_resurrected(stores, serve):
+    a, b = stores
+    a.trust("h1")
+    a.trust("h2")
+    server = serve(a)
+    _sync(server, b)
+
+    _tick()
+    b.delete("h1")
+    _sync(server, b)
+    assert "h1" not in a
+    assert "h1" in a.tombstones
+
+    _sync(server, b)
+    assert "h1" not in a and "h1" not in b
+
+    # un nuovo pairing dopo la revoca vince sulla tombstone
+    _tick()
+    a.trust("h1", ip="10.0.0.7")
+    _sync(server, b)
+    assert b.get("h1").ip == "10.0.0.7"
+    assert "h1" not in b.tombstones
+
+
+def test_without_secret_nothing_is_applied(stores, serve):
+    a, b = stores
+    a.trust("h1")
+    a.trust("h2")
+    b.trust("h2")
+    _tick()
+    a.delete("h2")
+    b.trust("injected")
+    server = serve(a, secret=None)
+
+    # un server non autenticato non può aggiungere né revocare host
+    result = _sync(server, b, secret=None)
+    assert (result.pulled, result.pushed, result.pending) == (0, 0, 2)
+    assert sorted(b.data) == ["h2", "injected"]
+    assert "injected" not in a
+
+    with socket.create_connection(server.address) as sock:
+        channel = sync._Channel(sock)
+        channel.call({"op": "hello", "nonce": "00"})
+        with pytest.raises(sync.SyncError, match="authentication"):
+            channel.call({"op": "put", "store": "hosts", "records": {"x": {"host_id": "x"}}})
+    assert "x" not in a
+
+
+def test_records_must_match_their_key(stores):
+    a, _ = stores
+    a.trust("h1", ip="10.0.0.1")
+    record = a.get("h1").to_record()
+    record["updated_at"] += 10
+
+    assert sync._apply(a, {"h2": record}, "hosts", None) == []
+    assert "h2" not in a and a.get("h1").ip == "10.0.0.1"
+    assert a._decode("h2", record) is None
+
+
+def test_wrong_secret_is_rejected(stores, serve):
+    a, b = stores
+    server = serve(a)
+    with pytest.raises(sync.SyncError):
+        _sync(server, b, secret=b"wrong")
+    with pytest.raises(sync.SyncError):
+        _sync(server, b, secret=None)
+
+
+def test_malformed_request_ends_only_that_session(stores, serve):
+    a, b = stores
+    a.trust("h1")
+    server = serve(a, secret=None)
+
+    with socket.create_connection(server.address) as sock:
+        channel = sync._Channel(sock)
+        channel.call({"op": "hello", "nonce": "00"})
+        channel.call({"op": "open", "store": "hosts", "depth": 1})
+        channel.send({"op": "nodes", "store": "hosts", "level": 9, "nodes": [0]})
+        with pytest.raises(sync.SyncError):
+            channel.recv()
+
+    assert _sync(server, b, secret=None).pending == 1
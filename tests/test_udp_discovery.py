@@ -0,0 +1,71 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from protocols.transport.udp import udp_discovery as discovery
+from protocols.transport.udp.wire import ProbeHandler
+
+IDENTITY = {"node_id": "node-1", "hostname": "box-1", "ip": "", "role": "host", "fingerprint": "fp"}
+
+
+@pytest.fixture
+def responder():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    stop = threading.Event()
+    counters = {}
+    thread = threading.Thread(
+        target=discovery.serve_probes,
+        args=(sock, ProbeHandler(IDENTITY)),
+        kwargs={"counters": counters, "stop": stop},
+        daemon=True,
+    )
+    thread.start()
+    yield sock.getsockname(), counters
+    stop.set()
+    thread.join(2.0)
+    sock.close()
+
+
+def test_discovery_finds_the_responder(responder):
+    address, counters = responder
+    started = time.monotonic()
+    found = discovery.udp_discovery(timeout=2.0, expected=1, address=address)
+    assert time.monotonic() - started < 1.0
+    assert [n["node_id"] for n in found] == ["node-1"]
+    assert found[0]["ip"] == "127.0.0.1"
+    # probe V3 + V2 di migrazione: una sola risposta servita
+    deadline = time.monotonic() + 1.0
+    while counters.get("dropped", 0) < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert (counters["served"], counters["dropped"]) == (1, 1)
+
+
+def test_later_rounds_skip_nodes_already_heard(responder):
+    address, counters = responder
+    found = discovery.udp_discovery(
+        timeout=0.6, window=0.1, rounds=2, legacy=False, address=address
+    )
+    assert [n["node_id"] for n in found] == ["node-1"]
+    # il secondo probe porta il Bloom filter con node-1: nessuna risposta
+    assert (counters["served"], counters["dropped"]) == (1, 1)
+
+
+def test_owned_socket_is_closed_on_error(monkeypatch):
+    created = []
+
+    class FailingSocket(socket.socket):
+        def sendto(self, *args):
+            raise OSError("network unreachable")
+
+    def factory(*args):
+        sock = FailingSocket(*args)
+        created.append(sock)
+        return sock
+
+    monkeypatch.setattr(discovery.socket, "socket", factory)
+    with pytest.raises(OSError, match="unreachable"):
+        discovery.udp_discovery(timeout=0.1, address=("127.0.0.1", 9))
+    assert created and created[0].fileno() == -1
@@ -0,0 +1,82 @@
+import sys
+
+import pytest
+
+from protocols.snowball.warm import WarmPool
+
+PROFILE = ()
+
+
+@pytest.fixture
+def pool():
+    discarded = []
+    pool = WarmPool(size=2, discard=discarded.append)
+    pool.discarded = discarded
+    yield pool
+    pool.stop()
+
+
+def _write(path, text):
+    return [sys.executable, "-c", f"import os; open({str(path)!r}, 'w').write(os.environ['X'] + {text!r})"]
+
+
+def test_first_take_is_cold_then_the_pool_refills(pool, tmp_path):
+    assert pool.take(PROFILE) is None
+    assert pool.stats()["misses"] == 1
+    pool.start()
+    assert pool.wait_ready(10.0)
+    assert pool.stats()["ready"] == 2
+
+    slot = pool.take(PROFILE)
+    assert slot is not None and slot.alive()
+    process = pool.exec(slot, _write(tmp_path / "out", "-ok"), env={"X": "warm"}, cwd=str(tmp_path))
+    assert process.wait(10.0) == 0
+    assert (tmp_path / "out").read_text() == "warm-ok"
+    assert pool.stats()["hits"] == 1
+    # il pid consegnato è quello dello zygote: exec sul posto
+    assert process is slot.process
+    assert pool.wait_ready(10.0)
+
+
+def test_failed_exec_exits_with_127(pool):
+    pool.ensure(PROFILE)
+    pool.start()
+    assert pool.wait_ready(10.0)
+    process = pool.exec(pool.take(PROFILE), ["/nonexistent/binary"])
+    assert process.wait(10.0) == 127
+
+
+def test_dead_slots_are_skipped_and_discarded(pool):
+    pool.ensure(PROFILE)
+    pool.start()
+    assert pool.wait_ready(10.0)
+    with pool._cond:
+        victims = list(pool._slots[PROFILE])
+    for slot in victims:
+        slot.process.kill()
+        slot.process.wait()
+
+    assert pool.take(PROFILE) is None
+    assert pool.stats()["misses"] == 1
+    assert all(slot in pool.discarded for slot in victims)
+    assert pool.wait_ready(10.0)
+
+
+def test_profiles_are_bounded():
+    pool = WarmPool(size=1, max_profiles=2)
+    for profile in [("a",), ("b",), ("c",)]:
+        pool.ensure(profile)
+    assert pool.stats()["profiles"] == 2
+
+
+def test_stop_releases_every_zygote(pool):
+    pool.ensure(PROFILE)
+    pool.start()
+    assert pool.wait_ready(10.0)
+    with pool._cond:
+        slots = list(pool._slots[PROFILE])
+    pool.stop()
+    # pipe chiusa senza comando: lo zygote esce da solo con 0
+    assert [slot.process.returncode for slot in slots] == [0, 0]
+    assert pool.discarded == slots
+    assert pool.stats()["ready"] == 0
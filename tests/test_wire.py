@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from protocols.transport.udp import wire
+from protocols.transport.udp.bloom import BloomFilter
+
+IDENTITY = {
+    "node_id": "node-1",
+    "hostname": "box-1",
+    "ip": "10.0.0.5",
+    "role": "host",
+    "fingerprint": "SHA256:abc",
+}
+
+
+def test_reply_round_trip():
+    assert wire.decode_reply(wire.encode_reply(IDENTITY)) == IDENTITY
+    assert wire.decode_reply(json.dumps(IDENTITY).encode()) == IDENTITY
+
+    no_ip = dict(IDENTITY, ip=None, role="unknown")
+    assert wire.decode_reply(wire.encode_reply(no_ip)) == dict(IDENTITY, ip="", role="")
+
+
+def test_announce_round_trip():
+    kind, payload, interval = wire.decode_announce(wire.encode_announce(IDENTITY, 7.5))
+    assert (kind, payload, interval) == (wire.KIND_ANNOUNCE, IDENTITY, 7.5)
+    kind, _, interval = wire.decode_announce(wire.encode_announce(IDENTITY, 0, bye=True))
+    assert (kind, interval) == (wire.KIND_BYE, 0.0)
+
+
+def test_probe_round_trip():
+    assert wire.decode_probe(wire.encode_probe()) == (0.0, None)
+
+    seen = BloomFilter.for_capacity(10, salt=1234)
+    seen.add("node-1")
+    window, decoded = wire.decode_probe(wire.encode_probe(window=0.25, seen=seen))
+    assert window == 0.25
+    assert "node-1" in decoded and "node-2" not in decoded
+
+
+def test_truncated_packets_are_rejected():
+    packet = wire.encode_reply(dict(IDENTITY, node_id="truncated"))
+    for cut in (len(packet) - 1, wire.HEADER.size + 3, 6):
+        with pytest.raises(ValueError):
+            wire.decode_reply(packet[:cut])
+
+    # body_len che dichiara più byte di quelli presenti
+    probe = wire.encode_probe(window=1.0)
+    assert wire.decode_probe(probe[:-1]) is None
+
+
+def test_unknown_trailing_fields_are_skipped():
+    identity = dict(IDENTITY, node_id="future")
+    body = wire._identity_body(identity) + b"\x05extra"
+    packet = wire.HEADER.pack(wire.MAGIC_V3, 4, wire.KIND_REPLY, len(body)) + body
+    assert wire.decode_reply(packet) == identity
+
+    # un campo noto che esce dal body resta un errore
+    short = wire.HEADER.pack(wire.MAGIC_V3, 3, wire.KIND_REPLY, len(body) - 8) + body
+    with pytest.raises(wire.WireError):
+        wire.decode_reply(short)
+
+
+def test_fields_longer_than_255_bytes_are_refused():
+    with pytest.raises(wire.WireError):
+        wire.encode_reply(dict(IDENTITY, hostname="x" * 256))
+
+
+def test_responder_answers_once_per_migration_probe_pair():
+    handler = wire.ProbeHandler(IDENTITY)
+    v2_probe = wire.DISCOVERY_MAGIC_V2
+    prober, legacy_prober = ("10.0.0.9", 5000), ("10.0.0.10", 5000)
+
+    assert handler.respond(wire.encode_probe(), prober) == (handler.v3, 0.0)
+    assert handler.respond(v2_probe, prober) is None
+    assert handler.respond(v2_probe, legacy_prober) == (handler.v2, 0.0)
+    assert handler.respond(v2_probe) == (handler.v2, 0.0)
+
+    seen = BloomFilter.for_capacity(4, salt=1)
+    seen.add("node-1")
+    assert handler.respond(wire.encode_probe(seen=seen), prober) is None
+    assert handler.respond(b"garbage", prober) is None